@@ -1,12 +1,25 @@
+import asyncio
+import os
+import random
+import time
+from collections.abc import Awaitable, Callable
+from dataclasses import dataclass
+from email.utils import parsedate_to_datetime
 from enum import Enum
 from sys import stderr
-from typing import Union
+from typing import TypeVar
 
+import anthropic
 import flet as ft
-import keyring
+import openai
 from anthropic import AsyncAnthropic
 from openai import AsyncOpenAI
 
+from atrament import rate_limits, settings
+from atrament.rate_limits import RateLimit
+
+T = TypeVar("T")
+
 WANTED_OPENAI_MODELS = {
     "gpt-5-nano",
     "gpt-5-mini",
@@ -21,46 +34,386 @@ WANTED_ANTHROPIC_MODELS = {
     "claude-opus-4-5",
 }
 
+# Upper bound of the response length, the whole edited files have to fit in
+ANTHROPIC_MAX_TOKENS: int = 32000
+
 
 class AiCompany(Enum):
     OpenAI = 0
+    Anthropic = 1
 
     def to_icon(self) -> ft.Image:
         match self:
             case AiCompany.OpenAI:
-                return ft.Image(src="icons/openai_icon.svg", width=32, height=32)
+                return ft.Image(
+                    src="icons/openai_icon.svg", width=32, height=32
+                )
+            case AiCompany.Anthropic:
+                return ft.Image(
+                    src="icons/anthropic_icon.svg", width=32, height=32
+                )
             case _:
                 raise ValueError(f"Unknown company: {self}")
 
 
 SUPPORTED_COMPANIES = {
     AiCompany.OpenAI,
+    AiCompany.Anthropic,
+}
+
+# Read when the keyring holds no key, e.g. on a headless host without a
+# keyring backend
+API_KEY_ENV: dict[AiCompany, str] = {
+    AiCompany.OpenAI: "OPENAI_API_KEY",
+    AiCompany.Anthropic: "ANTHROPIC_API_KEY",
 }
 
 
+@dataclass
+class AiResponse:
+    """Text of a response together with the token usage reported for it"""
+
+    text: str
+    input_tokens: int = 0
+    # part of input_tokens that was served from the provider's prompt cache
+    cached_tokens: int = 0
+    output_tokens: int = 0
+
+
+MAX_RETRIES: int = 6
+BASE_RETRY_DELAY: float = 1.0
+MAX_RETRY_DELAY: float = 60.0
+INITIAL_CONCURRENCY: float = 4.0
+MAX_CONCURRENCY: float = 32.0
+
+
+def estimate_tokens(text: str) -> int:
+    """Rough token count of `text`, good enough for rate limiting"""
+    return len(text) // 4 + 1
+
+
+class TokenBucket:
+    def __init__(self, per_minute: float):
+        self.rate = per_minute / 60.0
+        self.capacity = per_minute
+        self._tokens = per_minute
+        self._updated = time.monotonic()
+        self._paused_until = 0.0
+        self._lock = asyncio.Lock()
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        self._tokens = min(
+            self.capacity, self._tokens + (now - self._updated) * self.rate
+        )
+        self._updated = now
+
+    def pause(self, seconds: float) -> None:
+        """Hand out nothing for `seconds`, used to honour Retry-After"""
+        self._paused_until = max(self._paused_until, time.monotonic() + seconds)
+        self._tokens = 0.0
+
+    async def acquire(self, amount: float = 1.0) -> None:
+        # a single request larger than the whole bucket would wait forever
+        amount = min(amount, self.capacity)
+
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                if now < self._paused_until:
+                    await asyncio.sleep(self._paused_until - now)
+                    continue
+
+                self._refill()
+                if self._tokens >= amount:
+                    self._tokens -= amount
+                    return
+
+                await asyncio.sleep((amount - self._tokens) / self.rate)
+
+
+class ThrottledError(Exception):
+    """Raised when a request still fails after all retries"""
+
+
+def _retry_after(error: Exception) -> float | None:
+    """Seconds the provider asked us to wait, parsed from the response"""
+    response = getattr(error, "response", None)
+    headers = getattr(response, "headers", None)
+    if headers is None:
+        return None
+
+    retry_after_ms = headers.get("retry-after-ms")
+    if retry_after_ms is not None:
+        try:
+            return float(retry_after_ms) / 1000
+        except ValueError:
+            pass
+
+    retry_after = headers.get("retry-after")
+    if retry_after is None:
+        return None
+    try:
+        return float(retry_after)
+    except ValueError:
+        pass
+    try:
+        return max(
+            0.0,
+            parsedate_to_datetime(retry_after).timestamp() - time.time(),
+        )
+    except (TypeError, ValueError):
+        return None
+
+
+def _is_throttled(error: Exception) -> bool:
+    return isinstance(
+        error, (openai.RateLimitError, anthropic.RateLimitError)
+    ) or getattr(error, "status_code", None) in (429, 529)
+
+
+def _is_transient(error: Exception) -> bool:
+    if isinstance(
+        error, (openai.APIConnectionError, anthropic.APIConnectionError)
+    ):
+        return True
+
+    status_code = getattr(error, "status_code", None)
+    return isinstance(status_code, int) and status_code >= 500
+
+
+class _ModelLimiter:
+    """
+    Adaptive concurrency limit of a single model
+
+    The limit grows by roughly one slot per limit's worth of successful
+    requests and is halved when the provider throttles us (AIMD). A
+    burst of throttled requests halves it once, requests sent before
+    the last decrease saw the higher limit and don't count again.
+    """
+
+    def __init__(
+        self, rate_limit: RateLimit, max_limit: float = MAX_CONCURRENCY
+    ):
+        self.limit = min(INITIAL_CONCURRENCY, max_limit)
+        self.max_limit = max_limit
+        self.in_flight = 0
+        self._condition = asyncio.Condition()
+        self._decreased_at = 0.0
+        self.requests: TokenBucket | None = None
+        self.tokens: TokenBucket | None = None
+        self.set_rate_limit(rate_limit)
+
+    def set_rate_limit(self, rate_limit: RateLimit) -> None:
+        self.requests = (
+            TokenBucket(rate_limit.requests_per_minute)
+            if rate_limit.requests_per_minute
+            else None
+        )
+        self.tokens = (
+            TokenBucket(rate_limit.tokens_per_minute)
+            if rate_limit.tokens_per_minute
+            else None
+        )
+
+    async def acquire(self, tokens: int) -> None:
+        if self.requests is not None:
+            await self.requests.acquire()
+        if self.tokens is not None:
+            await self.tokens.acquire(tokens)
+
+        async with self._condition:
+            await self._condition.wait_for(
+                lambda: self.in_flight < int(self.limit)
+            )
+            self.in_flight += 1
+
+    async def release(self) -> None:
+        async with self._condition:
+            self.in_flight -= 1
+            self._condition.notify_all()
+
+    async def on_success(self) -> None:
+        async with self._condition:
+            self.limit = min(self.max_limit, self.limit + 1 / self.limit)
+            self._condition.notify_all()
+
+    def on_throttled(self, retry_after: float | None, sent_at: float) -> None:
+        """
+        Params:
+            sent_at: float - time.monotonic() when the request was sent
+        """
+        if sent_at >= self._decreased_at:
+            self.limit = max(1.0, self.limit / 2)
+            self._decreased_at = time.monotonic()
+        if retry_after is not None:
+            for bucket in (self.requests, self.tokens):
+                if bucket is not None:
+                    bucket.pause(retry_after)
+
+
+class RequestScheduler:
+    """
+    Runs AI requests with retries and per model rate limiting
+
+    Throttled (429) and transient (5xx, connection) failures are retried
+    with exponential backoff and full jitter, waiting at least as long as
+    the provider's Retry-After header asks for.
+    """
+
+    def __init__(self, max_concurrency: float = MAX_CONCURRENCY):
+        self.max_concurrency = max_concurrency
+        # quotas by model name, models without one are only limited by
+        # the adaptive concurrency
+        self.rate_limits: dict[str, RateLimit] = {}
+        self._limiters: dict[str, _ModelLimiter] = {}
+
+    def limiter(self, model: str) -> _ModelLimiter:
+        if model not in self._limiters:
+            self._limiters[model] = _ModelLimiter(
+                rate_limits.for_model(self.rate_limits, model),
+                self.max_concurrency,
+            )
+        return self._limiters[model]
+
+    def set_rate_limits(self, limits: dict[str, RateLimit]) -> None:
+        """Change the quotas, requests already waiting keep the old ones"""
+        self.rate_limits = limits
+        for model, limiter in self._limiters.items():
+            limiter.set_rate_limit(rate_limits.for_model(limits, model))
+
+    def resize(self, max_concurrency: float) -> None:
+        """Change the concurrency ceiling of every model"""
+        self.max_concurrency = max_concurrency
+        for limiter in self._limiters.values():
+            limiter.max_limit = max_concurrency
+            # a lower limit takes effect as in-flight requests finish
+            limiter.limit = min(limiter.limit, max_concurrency)
+
+    async def run(
+        self, model: str, call: Callable[[], Awaitable[T]], tokens: int = 1
+    ) -> T:
+        limiter = self.limiter(model)
+
+        for attempt in range(MAX_RETRIES + 1):
+            await limiter.acquire(tokens)
+            sent_at = time.monotonic()
+            try:
+                result = await call()
+            except Exception as e:
+                throttled = _is_throttled(e)
+                if not (throttled or _is_transient(e)):
+                    raise
+
+                retry_after = _retry_after(e)
+                if throttled:
+                    limiter.on_throttled(retry_after, sent_at)
+
+                if attempt == MAX_RETRIES:
+                    raise ThrottledError(
+                        f"Request to {model} failed after"
+                        f" {MAX_RETRIES + 1} attempts: {e}"
+                    ) from e
+
+                delay = random.uniform(
+                    0, min(MAX_RETRY_DELAY, BASE_RETRY_DELAY * 2**attempt)
+                )
+                if retry_after is not None:
+                    delay = max(delay, retry_after)
+
+                print(
+                    f"Retrying request to {model} in {delay:.1f}s: {e}",
+                    file=stderr,
+                )
+            else:
+                await limiter.on_success()
+                return result
+            finally:
+                await limiter.release()
+
+            # the slot is free while backing off, other requests go on
+            await asyncio.sleep(delay)
+
+        raise AssertionError("unreachable")
+
+
 class AiClinet:
     def __init__(self):
         self._client_store: dict = {}
+        self.scheduler = RequestScheduler()
+        settings.service.subscribe(self.on_settings_change)
 
-    def get_client(self, company: AiCompany) -> Union[AsyncOpenAI, AsyncAnthropic]:
+    def on_settings_change(self, changes: settings.Changes) -> None:
+        max_concurrency = changes.get(
+            ("Performance", "max-concurrent-requests")
+        )
+        if max_concurrency is not None:
+            self.scheduler.resize(max_concurrency)
+
+        limits = changes.get(("Performance", "rate-limits"))
+        if limits is not None:
+            self.scheduler.set_rate_limits(rate_limits.parse(limits))
+
+    @staticmethod
+    async def _api_key(company: AiCompany, section: str) -> str:
+        """
+        Raises:
+            ValueError: when neither the keyring nor the environment has
+                a key
+        """
+        api_key = await settings.service.get(section, "api-key")
+        if not api_key:
+            api_key = os.environ.get(API_KEY_ENV[company])
+        if not api_key:
+            raise ValueError(
+                "API key is missing from the keyring storage and"
+                f" {API_KEY_ENV[company]} is not set"
+            )
+        return api_key
+
+    async def get_client(
+        self, company: AiCompany
+    ) -> AsyncOpenAI | AsyncAnthropic:
         """
         MAINTENECE WARING: This function work's on the fact,
             that the API key's are stored behind a very specific name.
             So if  that was changed this is going to be the first place that need's refactor
 
-        Returns async clients for making non-blocking API calls
+        Returns async clients for making non-blocking API calls,
+        the keys come from the in-memory settings cache
         """
         client = None
+        timeout = await settings.service.get(
+            "Performance", "request-timeout-seconds"
+        )
 
         match company:
             case AiCompany.OpenAI:
-                api_key = keyring.get_password("atrament", "ChatGPT:api-key")
-                if api_key is None or api_key == "":
-                    raise ValueError("API key is missing from the keyring storage")
-                client = self._client_store.get(
-                    company,
-                    AsyncOpenAI(api_key=api_key),
-                )
+                api_key = await self._api_key(company, "ChatGPT")
+                client = self._client_store.get(company)
+                if (
+                    client is None
+                    or client.api_key != api_key
+                    or client.timeout != timeout
+                ):
+                    # retries are handled by the RequestScheduler
+                    client = AsyncOpenAI(
+                        api_key=api_key, max_retries=0, timeout=timeout
+                    )
+                    self._client_store[company] = client
+            case AiCompany.Anthropic:
+                api_key = await self._api_key(company, "Claude")
+                client = self._client_store.get(company)
+                if (
+                    client is None
+                    or client.api_key != api_key
+                    or client.timeout != timeout
+                ):
+                    # retries are handled by the RequestScheduler
+                    client = AsyncAnthropic(
+                        api_key=api_key, max_retries=0, timeout=timeout
+                    )
+                    self._client_store[company] = client
             case _:
                 raise NotImplementedError(
                     "ai.py::AiClient.get_client(): Currently unimplemented AI soruce",
@@ -68,24 +421,129 @@ class AiClinet:
 
         return client
 
-    async def prompt(self, company: AiCompany, prompt: str, model: str) -> str:
-        try:
-            client = self.get_client(company)
-        except Exception as e:
-            raise e
+    async def prompt(
+        self,
+        company: AiCompany,
+        prompt: str,
+        model: str,
+        context: str | None = None,
+    ) -> AiResponse:
+        """
+        Send `prompt` to `model` and return the response with its usage
+
+        Params:
+            context: str - Large block that rarely changes between requests
+                (e.g. reference files). It is sent in front of the prompt
+                and cached by the provider where supported.
+        """
+        client = await self.get_client(company)
+
+        # responses holding whole files are long, streaming keeps the
+        # connection from timing out while they are generated
+        stream = settings.service.current("Performance", "stream-responses")
 
         match company:
             case AiCompany.OpenAI:
                 if not isinstance(client, AsyncOpenAI):
-                    raise ValueError("Invalid client type for the selected company")
+                    raise TypeError(
+                        "Invalid client type for the selected company"
+                    )
 
+                # OpenAI caches matching prompt prefixes automatically,
+                # so the context just has to come first
                 params = {
                     "model": model,
-                    "input": prompt,
+                    "input": f"{context}\n\n{prompt}" if context else prompt,
                     "tools": [{"type": "web_search"}],
                 }
 
-                return (await client.responses.create(**params)).output_text
+                openai_client = client
+
+                async def request():
+                    if not stream:
+                        return await openai_client.responses.create(**params)
+                    async with openai_client.responses.stream(
+                        **params
+                    ) as response:
+                        return await response.get_final_response()
+
+                response = await self.scheduler.run(
+                    model,
+                    request,
+                    tokens=estimate_tokens(params["input"]),
+                )
+
+                usage = response.usage
+                if usage is None:
+                    return AiResponse(text=response.output_text)
+                return AiResponse(
+                    text=response.output_text,
+                    input_tokens=usage.input_tokens,
+                    cached_tokens=usage.input_tokens_details.cached_tokens,
+                    output_tokens=usage.output_tokens,
+                )
+            case AiCompany.Anthropic:
+                if not isinstance(client, AsyncAnthropic):
+                    raise TypeError(
+                        "Invalid client type for the selected company"
+                    )
+
+                anthropic_client = client
+
+                async def request() -> AiResponse:
+                    # the context is marked as a cache breakpoint so repeated
+                    # runs over the same reference files only pay for it once
+                    system = (
+                        [
+                            {
+                                "type": "text",
+                                "text": context,
+                                "cache_control": {"type": "ephemeral"},
+                            }
+                        ]
+                        if context
+                        else anthropic.NOT_GIVEN
+                    )
+
+                    params = {
+                        "model": model,
+                        "max_tokens": ANTHROPIC_MAX_TOKENS,
+                        "system": system,
+                        "messages": [{"role": "user", "content": prompt}],
+                    }
+                    if stream:
+                        async with anthropic_client.messages.stream(
+                            **params
+                        ) as response:
+                            message = await response.get_final_message()
+                    else:
+                        message = await anthropic_client.messages.create(
+                            **params
+                        )
+
+                    usage = message.usage
+                    cache_read = usage.cache_read_input_tokens or 0
+                    cache_creation = usage.cache_creation_input_tokens or 0
+                    return AiResponse(
+                        text="".join(
+                            block.text
+                            for block in message.content
+                            if block.type == "text"
+                        ),
+                        # Anthropic doesn't count cached tokens as input
+                        input_tokens=usage.input_tokens
+                        + cache_read
+                        + cache_creation,
+                        cached_tokens=cache_read,
+                        output_tokens=usage.output_tokens,
+                    )
+
+                return await self.scheduler.run(
+                    model,
+                    request,
+                    tokens=estimate_tokens(prompt)
+                    + estimate_tokens(context or ""),
+                )
             case _:
                 raise NotImplementedError(
                     "ai.py::AiClient.prompt(): Currently unimplemented AI soruce",
@@ -98,9 +556,9 @@ client = AiClinet()
 async def _get_openai_models() -> list[str]:
     result = []
 
-    cl = client.get_client(AiCompany.OpenAI)
+    cl = await client.get_client(AiCompany.OpenAI)
     if not isinstance(cl, AsyncOpenAI):
-        raise ValueError("Invalid client type")
+        raise TypeError("Invalid client type")
 
     models = await cl.models.list()
     for model in models.data:
@@ -112,6 +570,24 @@ async def _get_openai_models() -> list[str]:
     return result
 
 
+async def _get_anthropic_models() -> list[str]:
+    result = []
+
+    cl = await client.get_client(AiCompany.Anthropic)
+    if not isinstance(cl, AsyncAnthropic):
+        raise TypeError("Invalid client type")
+
+    # model ids carry a date suffix (e.g. claude-sonnet-4-5-20250929)
+    async for model in cl.models.list(limit=100):
+        if any(
+            model.id == wanted or model.id.startswith(f"{wanted}-")
+            for wanted in WANTED_ANTHROPIC_MODELS
+        ):
+            result.append(model.id)
+
+    return result
+
+
 async def get_models() -> list[tuple[AiCompany, str]]:
     """
     Return a list of models that the user can use for the given keys
@@ -126,9 +602,15 @@ async def get_models() -> list[tuple[AiCompany, str]]:
             case AiCompany.OpenAI:
                 try:
                     models = await _get_openai_models()
-                    result.extend(map(lambda x: (company, x), models))
+                    result.extend((company, model) for model in models)
                 except Exception as e:
                     print(f"Error fetching OpenAI models: {e}", file=stderr)
+            case AiCompany.Anthropic:
+                try:
+                    models = await _get_anthropic_models()
+                    result.extend((company, model) for model in models)
+                except Exception as e:
+                    print(f"Error fetching Anthropic models: {e}", file=stderr)
             case _:
                 print(
                     "ai.py::get_models(): Currently unimplemented AI soruce",
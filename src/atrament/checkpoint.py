@@ -0,0 +1,103 @@
+import hashlib
+import json
+import os
+from collections.abc import Callable
+from dataclasses import dataclass, field
+from pathlib import Path
+
+# Hashes the content of a file given by (path, content), lets callers
+# plug in a memoized implementation
+Digest = Callable[[str, str], str]
+
+
+def content_hash(content: str) -> str:
+    return hashlib.sha256(content.encode("utf-8")).hexdigest()
+
+
+@dataclass
+class Checkpoint:
+    """
+    Progress of a run that has not finished yet
+
+    `signature` identifies the run (instructions, model, file lists and
+    source contents), `applied` maps every target file that has already
+    been written to the hash of the content that was written. A retry
+    of the same run skips the files whose content still matches.
+    """
+
+    path: Path
+    signature: str
+    applied: dict[str, str] = field(default_factory=dict)
+
+    @classmethod
+    def load(cls, path: Path, signature: str) -> "Checkpoint | None":
+        """Return the checkpoint at `path` if it belongs to `signature`"""
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return None
+
+        if data.get("signature") != signature:
+            return None
+
+        return cls(path=path, signature=signature, applied=data["applied"])
+
+    def save(self) -> None:
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+
+        # write to a temporary file first so a crash never leaves a
+        # half written checkpoint behind
+        tmp_path = self.path.with_suffix(self.path.suffix + ".tmp")
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(
+                {"signature": self.signature, "applied": self.applied},
+                f,
+                indent=2,
+            )
+        os.replace(tmp_path, self.path)
+
+    def clear(self) -> None:
+        self.path.unlink(missing_ok=True)
+
+    def completed(
+        self, target_files: dict[str, str], digest: Digest | None = None
+    ) -> set[str]:
+        """Files of `target_files` that still hold the applied content"""
+        digest = digest or (lambda _, content: content_hash(content))
+        return {
+            p
+            for p, content in target_files.items()
+            if p in self.applied and self.applied[p] == digest(p, content)
+        }
+
+
+def sources_signature(
+    source_files: dict[str, str], digest: Digest | None = None
+) -> str:
+    """Identifies the contents of every source file of a run"""
+    digest = digest or (lambda _, content: content_hash(content))
+    signature = hashlib.sha256()
+    for p in sorted(source_files):
+        signature.update(b"\0" + p.encode("utf-8"))
+        signature.update(digest(p, source_files[p]).encode("utf-8"))
+    return signature.hexdigest()
+
+
+def run_signature(
+    instructions: str,
+    model: str,
+    target_paths: list[str],
+    source_files: dict[str, str],
+    digest: Digest | None = None,
+) -> str:
+    digest = digest or (lambda _, content: content_hash(content))
+    signature = hashlib.sha256()
+    signature.update(instructions.encode("utf-8"))
+    signature.update(b"\0" + model.encode("utf-8"))
+    for p in sorted(target_paths):
+        signature.update(b"\0" + p.encode("utf-8"))
+    for p in sorted(source_files):
+        signature.update(b"\0" + p.encode("utf-8"))
+        signature.update(digest(p, source_files[p]).encode("utf-8"))
+    return signature.hexdigest()
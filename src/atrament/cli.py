@@ -0,0 +1,164 @@
+"""Headless entry point for running Atrament projects without the Flet UI."""
+
+import argparse
+import asyncio
+import sys
+from pathlib import Path
+
+from atrament import engine, retention, settings, storage
+
+EXIT_OK = 0
+EXIT_FAILURE = 1
+
+
+def _resolve_project_path(arg: str) -> Path:
+    path = Path(arg).expanduser()
+    if path.name == engine.PROJECT_FILE_NAME:
+        path = path.parent
+    return path.resolve()
+
+
+async def run_projects(args: argparse.Namespace) -> int:
+    await settings.service.load()
+    project_paths = [_resolve_project_path(p) for p in args.projects]
+
+    jobs: list[engine.Job] = []
+    failures: dict[Path, BaseException] = {}
+    for project_path in project_paths:
+        try:
+            project_data = engine.load_project(project_path)
+            storage.adopt_legacy_data(
+                project_path, project_data["metadata"]["name"]
+            )
+            job = engine.Job.from_project_data(
+                project_path,
+                project_data,
+                instructions=args.instructions,
+                model_selection=args.model,
+            )
+            job.shard_size = args.shard_size
+            if args.changed_only:
+                job.incremental = True
+            if args.source_budget is not None:
+                job.source_token_budget = args.source_budget
+            if args.max_file_mb is not None:
+                job.max_file_bytes = int(args.max_file_mb * 1024 * 1024)
+            if args.max_request_mb is not None:
+                job.max_request_bytes = int(args.max_request_mb * 1024 * 1024)
+            jobs.append(job)
+        except Exception as e:
+            failures[project_path] = e
+
+    results = await engine.run_jobs(jobs, max_requests=args.max_requests)
+    stats: dict[Path, engine.RunStats] = {}
+    for job, result in zip(jobs, results):
+        if isinstance(result, BaseException):
+            failures[job.project_path] = result
+        else:
+            stats[job.project_path] = result.stats
+
+    for project_path in project_paths:
+        if project_path in failures:
+            print(
+                f"FAILED {project_path}: {failures[project_path]}",
+                file=sys.stderr,
+            )
+        else:
+            print(f"OK     {project_path}: {stats[project_path].describe()}")
+
+    if args.cleanup:
+        # there's no daemon when running headless, clean up after the runs
+        await retention.daemon.collect()
+
+    return EXIT_FAILURE if failures else EXIT_OK
+
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(
+        prog="atrament-batch",
+        description="Run Atrament projects headlessly",
+    )
+    parser.add_argument(
+        "projects",
+        nargs="+",
+        help="project directories or paths to their atrament.json",
+    )
+    parser.add_argument(
+        "-j",
+        "--max-requests",
+        type=int,
+        default=4,
+        help="maximum number of concurrent AI requests (default: 4)",
+    )
+    parser.add_argument(
+        "--shard-size",
+        type=int,
+        default=None,
+        help="number of target files sent per request (default: all)",
+    )
+    parser.add_argument(
+        "--source-budget",
+        type=int,
+        default=None,
+        help="send only the source chunks most relevant to the"
+        " instructions, up to this many estimated tokens",
+    )
+    parser.add_argument(
+        "--max-file-mb",
+        type=float,
+        default=None,
+        help="refuse larger target files and truncate larger source files"
+        f" (default: {engine.MAX_FILE_BYTES // 1024 // 1024})",
+    )
+    parser.add_argument(
+        "--max-request-mb",
+        type=float,
+        default=None,
+        help="maximum file content per request, larger runs are sharded"
+        f" (default: {engine.MAX_REQUEST_BYTES // 1024 // 1024})",
+    )
+    parser.add_argument(
+        "--changed-only",
+        action="store_true",
+        help="send only the target files that changed since an earlier run"
+        " with the same instructions, model and sources processed them",
+    )
+    parser.add_argument(
+        "--cleanup",
+        action="store_true",
+        help="apply the retention settings to the backups of every project"
+        " of this user and delete unused backup data after the runs",
+    )
+    parser.add_argument(
+        "-i",
+        "--instructions",
+        help="override the instructions stored in the projects",
+    )
+    parser.add_argument(
+        "-m",
+        "--model",
+        help='override the model, e.g. "OpenAI:gpt-5"',
+    )
+    return parser
+
+
+def main(argv: list[str] | None = None) -> int:
+    parser = build_parser()
+    args = parser.parse_args(argv)
+
+    if args.max_requests < 1:
+        parser.error("--max-requests must be at least 1")
+    if args.shard_size is not None and args.shard_size < 1:
+        parser.error("--shard-size must be at least 1")
+    if args.source_budget is not None and args.source_budget < 1:
+        parser.error("--source-budget must be at least 1")
+    for option in ("max_file_mb", "max_request_mb"):
+        value = getattr(args, option)
+        if value is not None and value <= 0:
+            parser.error(f"--{option.replace('_', '-')} must be positive")
+
+    return asyncio.run(run_projects(args))
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,10 +1,11 @@
+import asyncio
 import datetime
 import json
 from pathlib import Path
-from urllib.parse import quote
 
 import flet as ft
 
+from .. import jobs, storage, ui_scheduler, view_cache
 from ..const import PROJECT_TRACKER_FILE, PROJECT_TRACKER_LOCK
 from ..page_ref import get_page_ref
 
@@ -17,8 +18,9 @@ class ProjectEntry(ft.Button):
 
     async def open_project(self, _):
         """Route to the project section with the encoded project path."""
-        encoded_path = quote(self.project_path, safe="")
-        await get_page_ref().push_route(f"/project/{encoded_path}")
+        await get_page_ref().push_route(
+            view_cache.project_route(self.project_path)
+        )
 
     async def delete_project(self, _):
         """Delete the project from tracker file and remove metadata."""
@@ -46,6 +48,13 @@ class ProjectEntry(ft.Button):
         if metadata_file.exists():
             metadata_file.unlink()
 
+        # backups, reports and caches of the project, shared blobs are
+        # left to the retention daemon
+        await asyncio.to_thread(
+            storage.forget_project, storage.project_id(project_dir)
+        )
+
+        view_cache.invalidate(view_cache.project_route(self.project_path))
         get_page_ref().update()
 
     async def rename_project(self, _):
@@ -106,6 +115,9 @@ class ProjectEntry(ft.Button):
                 with open(metadata_file, "w", encoding="utf-8") as f:
                     json.dump(project_data, f, indent=4)
 
+            # the cached project view still shows the old name
+            view_cache.invalidate(view_cache.project_route(self.project_path))
+
             # Update UI
             self.project_name = (
                 safe_name if len(safe_name) <= 15 else safe_name[:15] + "..."
@@ -157,6 +169,15 @@ class ProjectEntry(ft.Button):
             f"{self.last_time_edited}", size=10, color=ft.Colors.GREY_100
         )
 
+        # Progress of the project's background job, hidden while idle
+        self.job_label = ft.Text(
+            "", size=10, color=ft.Colors.ORANGE, visible=False
+        )
+        self._unsubscribe = None
+        queued = jobs.queue.latest_for(Path(self.project_path))
+        if queued is not None:
+            self.show_job(queued)
+
         self.project_options = ft.PopupMenuButton(
             content=ft.Icon(ft.Icons.MORE_VERT, color=ft.Colors.WHITE),
             items=[
@@ -177,12 +198,38 @@ class ProjectEntry(ft.Button):
         self.content = ft.Row(
             [
                 self.project_title,
-                ft.Row([self.date_label, self.project_options]),
+                ft.Row([self.job_label, self.date_label, self.project_options]),
             ],
             alignment=ft.MainAxisAlignment.SPACE_BETWEEN,
         )
         self.on_click = self.open_project
 
+    def did_mount(self):
+        self._unsubscribe = jobs.queue.subscribe(self.on_job_update)
+
+    def will_unmount(self):
+        if self._unsubscribe is not None:
+            self._unsubscribe()
+            self._unsubscribe = None
+
+    def show_job(self, queued: jobs.QueuedJob):
+        self.job_label.value = queued.describe()
+        self.job_label.visible = True
+        match queued.status:
+            case jobs.JobStatus.Done:
+                self.job_label.color = ft.Colors.GREEN
+            case jobs.JobStatus.Failed:
+                self.job_label.color = ft.Colors.RED
+            case _:
+                self.job_label.color = ft.Colors.ORANGE
+
+    def on_job_update(self, queued: jobs.QueuedJob):
+        if queued.job.project_path != Path(self.project_path):
+            return
+
+        self.show_job(queued)
+        ui_scheduler.update(self.job_label)
+
 
 @ft.control
 class PreviouseProjectList(ft.Column):
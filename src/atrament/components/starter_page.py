@@ -6,6 +6,7 @@ from urllib.parse import quote
 import aiofiles
 import flet as ft
 
+from atrament import ui_scheduler, view_cache
 from atrament.const import PROJECT_TRACKER_FILE, PROJECT_TRACKER_LOCK
 from atrament.page_ref import get_page_ref
 
@@ -65,9 +66,9 @@ async def open_project() -> None:
         ) as f:
             await f.write(entry)
 
-    await get_page_ref().push_route(
-        f"/project/{quote(str(project_path), safe='')}"
-    )
+    # the project file may have changed since its view was cached
+    view_cache.invalidate(view_cache.project_route(str(project_path)))
+    await get_page_ref().push_route(view_cache.project_route(str(project_path)))
 
 
 async def settings() -> None:
@@ -135,6 +136,7 @@ class StarterPageAction(ft.Row):
 @ft.control
 class StarterPage(ft.Container):
     def init(self):
+        self._unsubscribe_resize = None
         self.alignment = ft.Alignment.CENTER
         self.align = ft.Alignment.CENTER_RIGHT
         self.bgcolor = ft.Colors.BLACK_12
@@ -197,37 +199,26 @@ class StarterPage(ft.Container):
 
     def did_mount(self):
         """Called when the control is added to the page."""
-        page_ref = get_page_ref()
-        if page_ref:
-            page_ref.on_resize = self._handle_resize
-            self._handle_resize(None)
+        scheduler = ui_scheduler.for_page(get_page_ref())
+        self._unsubscribe_resize = scheduler.on_resize(self._handle_resize)
+        self._handle_resize(scheduler.width, scheduler.height)
+
+    def will_unmount(self):
+        if self._unsubscribe_resize is not None:
+            self._unsubscribe_resize()
+            self._unsubscribe_resize = None
 
-    def _handle_resize(self, e):
+    def _handle_resize(self, width: float, _height: float):
         """Hide description text when window is too small."""
-        page_ref = get_page_ref()
-        if page_ref:
-            # Hide description if window width is less than MIN_WIDTH_FOR_DESCRIPTIONS
-            current_width = (
-                page_ref.window.width or 800
-            )  # Default to 800 if None
-            should_show_descriptions = (
-                current_width >= MIN_WIDTH_FOR_DESCRIPTIONS
+        # Hide descriptions below MIN_WIDTH_FOR_DESCRIPTIONS
+        should_show_descriptions = width >= MIN_WIDTH_FOR_DESCRIPTIONS
+
+        # only the descriptions whose visibility flipped are sent
+        changed = [
+            action.description_text
+            for action in (self.create_action, self.open_action)
+            if ui_scheduler.set_visible(
+                action.description_text, should_show_descriptions
             )
-
-            # Update all action descriptions
-            if (
-                hasattr(self, "create_action")
-                and self.create_action.description_text
-            ):
-                self.create_action.description_text.visible = (
-                    should_show_descriptions
-                )
-            if (
-                hasattr(self, "open_action")
-                and self.open_action.description_text
-            ):
-                self.open_action.description_text.visible = (
-                    should_show_descriptions
-                )
-
-            self.update()
+        ]
+        ui_scheduler.update(*changed)
@@ -19,9 +19,3 @@ USER_SETTINGS_LOCK = FileLock(
     USER_SETTINGS_FILE.with_suffix(USER_SETTINGS_FILE.suffix + ".lock"),
     timeout=5,
 )
-
-DEFAULT_SETTINGS = {
-    "ChatGPT": {
-        "api-key": None,
-    }
-}
@@ -0,0 +1,1068 @@
+import asyncio
+import json
+import os
+import sys
+from collections.abc import Awaitable, Callable
+from contextlib import AbstractAsyncContextManager
+from dataclasses import asdict, dataclass, field
+from enum import Enum
+from pathlib import Path
+from typing import Any
+
+import aiofiles
+
+from atrament import ai, file_cache, settings, storage
+from atrament.checkpoint import (
+    Checkpoint,
+    Digest,
+    content_hash,
+    run_signature,
+    sources_signature,
+)
+from atrament.index import SourceIndex
+from atrament.prompt import build_prompt
+from atrament.response import IncompleteResponseError, parse_response
+from atrament.storage import (
+    backup_dir_for,
+    checkpoint_path_for,
+    index_path_for,
+    report_dir_for,
+)
+
+PROJECT_FILE_NAME = "atrament.json"
+
+# Defaults well above what fits in a model's context window, they only
+# exist so huge files fail early instead of exhausting memory
+MAX_FILE_BYTES: int = 4 * 1024 * 1024
+MAX_REQUEST_BYTES: int = 8 * 1024 * 1024
+# Shards of a run with a request limit that are in flight at once, every
+# one holds a prompt with all sources, memory peaks at about this many
+# requests
+MAX_SHARDS_IN_FLIGHT: int = 2
+
+# Block size used when streaming oversized source files
+READ_CHUNK_BYTES: int = 64 * 1024
+
+
+class FileTooLargeError(ValueError):
+    pass
+
+
+def peak_rss_bytes() -> int | None:
+    """Peak resident set size of the process, None where unsupported"""
+    try:
+        import resource
+    except ImportError:  # Windows
+        return None
+
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # reported in bytes on macOS and in kilobytes everywhere else
+    return peak if sys.platform == "darwin" else peak * 1024
+
+
+def default_project(project_path: Path) -> dict:
+    """Project data of a project without any configuration yet"""
+    return {
+        "metadata": {
+            "name": project_path.name,
+            "description": "",
+        },
+        "workdata": {
+            "ai-configuration": {
+                "prompt": "",
+                "model": None,
+            },
+            "files": {"target-files": [], "source-files": []},
+        },
+    }
+
+
+def _check_type(value, expected: type | tuple, where: str) -> None:
+    if not isinstance(value, expected):
+        raise ValueError(f"{PROJECT_FILE_NAME}: {where} has the wrong type")
+
+
+def validate_project(project_path: Path, data) -> dict:
+    """
+    Fill the keys missing from `data` with their defaults
+
+    Raises:
+        ValueError: when a present key has the wrong type
+    """
+    _check_type(data, dict, "the project")
+    defaults = default_project(project_path)
+
+    for section in ("metadata", "workdata"):
+        _check_type(data.setdefault(section, {}), dict, section)
+    metadata, workdata = data["metadata"], data["workdata"]
+    metadata.setdefault("name", defaults["metadata"]["name"])
+    _check_type(metadata["name"], str, "metadata.name")
+
+    ai_configuration = workdata.setdefault("ai-configuration", {})
+    _check_type(ai_configuration, dict, "workdata.ai-configuration")
+    ai_configuration.setdefault("prompt", "")
+    ai_configuration.setdefault("model", None)
+    _check_type(ai_configuration["prompt"], str, "the prompt")
+    _check_type(ai_configuration["model"], (str, type(None)), "the model")
+
+    files = workdata.setdefault("files", {})
+    _check_type(files, dict, "workdata.files")
+    for filetype in ("target-files", "source-files"):
+        _check_type(files.setdefault(filetype, []), list, filetype)
+        for p in files[filetype]:
+            _check_type(p, str, f"an entry of {filetype}")
+
+    return data
+
+
+def load_project(project_path: Path) -> dict:
+    """
+    Read the atrament.json of the project located at `project_path`
+
+    Keys missing from the file are filled with their defaults.
+
+    Raises:
+        FileNotFoundError: when the project has no atrament.json
+        json.JSONDecodeError: when the project file is not valid JSON
+        ValueError: when a value in the project file has the wrong type
+    """
+    with open(project_path / PROJECT_FILE_NAME, "r", encoding="utf-8") as f:
+        return validate_project(project_path, json.load(f))
+
+
+def parse_model_selection(selection: str) -> tuple[ai.AiCompany, str]:
+    """
+    Parse a model selection in the format "{AiCompany.value}:{model}"
+
+    The company part may also be given by name (e.g. "OpenAI:gpt-5")
+    so that the selection can be typed by hand on the command line.
+    """
+    company, sep, model = selection.partition(":")
+    if not sep or not model:
+        raise ValueError(f"Invalid model selection: {selection!r}")
+
+    if company.isdigit():
+        return ai.AiCompany(int(company)), model
+
+    try:
+        return ai.AiCompany[company], model
+    except KeyError:
+        raise ValueError(f"Unknown AI company: {company!r}") from None
+
+
+class Stage(Enum):
+    Load = "load"
+    Backup = "backup"
+    Prompt = "prompt"
+    Apply = "apply"
+    Done = "done"
+
+
+@dataclass
+class Job:
+    """
+    Plain-data description of one processing run over a project
+
+    Everything the pipeline needs is captured here so a job can be built
+    from the UI, from the command line or from a background worker alike.
+    """
+
+    project_path: Path
+    project_name: str
+    instructions: str
+    company: ai.AiCompany
+    model: str
+    target_files: list[str] = field(default_factory=list)
+    source_files: list[str] = field(default_factory=list)
+    backup_dir: Path | None = None
+    report_dir: Path | None = None
+    checkpoint_path: Path | None = None
+    index_path: Path | None = None
+    # number of target files sent per request, None sends all at once
+    shard_size: int | None = None
+    # target files above max_file_bytes are refused, source files above it
+    # are cut down to it; requests are sharded to stay under
+    # max_request_bytes of file content
+    max_file_bytes: int | None = MAX_FILE_BYTES
+    max_request_bytes: int | None = MAX_REQUEST_BYTES
+    # estimated tokens of source context sent per request, when set only
+    # the source chunks most relevant to the instructions are sent
+    source_token_budget: int | None = None
+    # send only the target files earlier runs didn't already produce an
+    # output for, with the same instructions, model and sources
+    incremental: bool = False
+    # target files sent even when incremental would skip them
+    flagged: list[str] = field(default_factory=list)
+
+    def __post_init__(self):
+        if self.backup_dir is None:
+            self.backup_dir = backup_dir_for(self.project_path)
+        if self.report_dir is None:
+            self.report_dir = report_dir_for(self.project_path)
+        if self.checkpoint_path is None:
+            self.checkpoint_path = checkpoint_path_for(self.project_path)
+        if self.index_path is None:
+            self.index_path = index_path_for(self.project_path)
+
+    def shards(
+        self,
+        target_paths: list[str],
+        sizes: dict[str, int] | None = None,
+        byte_budget: int | None = None,
+    ) -> list[list[str]]:
+        """
+        Split `target_paths` into the groups sent in one request each
+
+        A group holds at most `shard_size` files and, when `byte_budget`
+        is given, at most `byte_budget` bytes (by `sizes`) unless a
+        single file is bigger on its own.
+        """
+        shards: list[list[str]] = []
+        current: list[str] = []
+        current_bytes = 0
+
+        for p in target_paths:
+            size = sizes.get(p, 0) if sizes is not None else 0
+            if current and (
+                (
+                    self.shard_size is not None
+                    and len(current) >= self.shard_size
+                )
+                or (
+                    byte_budget is not None
+                    and current_bytes + size > byte_budget
+                )
+            ):
+                shards.append(current)
+                current, current_bytes = [], 0
+
+            current.append(p)
+            current_bytes += size
+
+        if current:
+            shards.append(current)
+        return shards
+
+    @classmethod
+    def from_project_data(
+        cls,
+        project_path: Path,
+        project_data: dict,
+        instructions: str | None = None,
+        model_selection: str | None = None,
+    ) -> "Job":
+        """
+        Build a job from the contents of an atrament.json
+
+        `instructions` and `model_selection` override the stored values.
+        """
+        ai_configuration = project_data["workdata"]["ai-configuration"]
+        files = project_data["workdata"]["files"]
+
+        model_selection = model_selection or ai_configuration["model"]
+        if not model_selection:
+            raise ValueError("You need to select a model")
+        company, model = parse_model_selection(model_selection)
+
+        return cls(
+            project_path=project_path,
+            project_name=project_data["metadata"]["name"],
+            instructions=(
+                instructions
+                if instructions is not None
+                else ai_configuration["prompt"]
+            ),
+            company=company,
+            model=model,
+            target_files=list(files["target-files"]),
+            source_files=list(files["source-files"]),
+            source_token_budget=ai_configuration.get("source-token-budget"),
+            incremental=ai_configuration.get("incremental", False),
+        )
+
+
+@dataclass
+class RunStats:
+    requests: int = 0
+    input_tokens: int = 0
+    cached_tokens: int = 0
+    output_tokens: int = 0
+    peak_rss_bytes: int | None = None
+    # source files cut down to max_file_bytes
+    truncated_files: list[str] = field(default_factory=list)
+
+    def add(self, response: ai.AiResponse) -> None:
+        self.requests += 1
+        self.input_tokens += response.input_tokens
+        self.cached_tokens += response.cached_tokens
+        self.output_tokens += response.output_tokens
+
+    @property
+    def cache_hit_ratio(self) -> float:
+        if self.input_tokens == 0:
+            return 0.0
+        return self.cached_tokens / self.input_tokens
+
+    def describe(self) -> str:
+        description = (
+            f"{self.requests} request(s), {self.input_tokens} input tokens"
+            f" ({self.cached_tokens} cached, {self.cache_hit_ratio:.0%}),"
+            f" {self.output_tokens} output tokens"
+        )
+        if self.peak_rss_bytes is not None:
+            description += (
+                f", peak memory {self.peak_rss_bytes / 1024 / 1024:.0f} MB"
+            )
+        if self.truncated_files:
+            description += (
+                f", {len(self.truncated_files)} oversized source file(s)"
+                " truncated"
+            )
+        return description
+
+
+@dataclass
+class JobResult:
+    job: Job
+    changed_files: list[str] = field(default_factory=list)
+    # target files skipped because a previous attempt already applied them
+    skipped_files: list[str] = field(default_factory=list)
+    stats: RunStats = field(default_factory=RunStats)
+    # the backup of the run, None if it was dropped already
+    manifest: storage.Manifest | None = None
+    # incremental runs: target files already holding their output, and
+    # target files that got the output of an earlier run without a request
+    up_to_date_files: list[str] = field(default_factory=list)
+    reused_files: list[str] = field(default_factory=list)
+
+
+StageHook = Callable[[Job, Stage], Awaitable[None]]
+
+
+@dataclass
+class JobHooks:
+    """
+    Async callbacks the pipeline calls into while a job is running
+
+    on_stage is awaited right before every stage starts (and once with
+    Stage.Done at the end), on_error is awaited with the failing stage
+    before the exception is re-raised.
+    """
+
+    on_stage: StageHook | None = None
+    on_error: Callable[[Job, Stage, Exception], Awaitable[None]] | None = None
+
+
+async def load_files_content(
+    file_paths: list[str], cache: file_cache.FileCache | None = None
+) -> dict[str, str]:
+    result = {}
+
+    for p in file_paths:
+        if cache is not None:
+            result[p] = await cache.read(p)
+            continue
+
+        async with aiofiles.open(p, mode="r") as f:
+            content = await f.read()
+            result[p] = content
+
+    return result
+
+
+async def read_head(path: str, limit: int) -> str:
+    """
+    Read at most `limit` bytes of `path` block by block
+
+    Used for oversized files so they are never held in memory whole.
+    """
+    blocks = []
+    remaining = limit
+    async with aiofiles.open(path, mode="rb") as f:
+        while remaining > 0:
+            block = await f.read(min(READ_CHUNK_BYTES, remaining))
+            if not block:
+                break
+            blocks.append(block)
+            remaining -= len(block)
+
+    total = os.path.getsize(path)
+    # a cut multibyte character at the end is dropped by errors="ignore"
+    head = b"".join(blocks).decode("utf-8", errors="ignore")
+    return f"{head}\n[... truncated {total - limit} bytes ...]"
+
+
+async def load_bounded_files(
+    file_paths: list[str],
+    max_file_bytes: int,
+    cache: file_cache.FileCache | None = None,
+) -> tuple[dict[str, str], list[str]]:
+    """
+    Load `file_paths` cutting files above `max_file_bytes` down to size
+
+    Returns:
+        tuple[dict[str, str], list[str]]: the contents and the paths of
+            the truncated files
+    """
+    result = {}
+    truncated = []
+
+    for p in file_paths:
+        if os.path.getsize(p) > max_file_bytes:
+            # bypass the cache, it only holds complete contents
+            result[p] = await read_head(p, max_file_bytes)
+            truncated.append(p)
+        else:
+            result.update(await load_files_content([p], cache))
+
+    return result, truncated
+
+
+def check_missing_files(job: "Job") -> None:
+    """
+    Raises:
+        FileNotFoundError: listing every file of the job that is missing
+    """
+    missing = [
+        p for p in job.target_files + job.source_files if not os.path.isfile(p)
+    ]
+    if missing:
+        raise FileNotFoundError(
+            f"{len(missing)} file(s) are missing: {', '.join(missing)}"
+        )
+
+
+def check_memory_limits(job: "Job") -> dict[str, int]:
+    """
+    Validate the job's files against its byte limits before any work
+
+    Returns:
+        dict[str, int]: size in bytes of every target file
+
+    Raises:
+        FileTooLargeError: when a target file exceeds max_file_bytes or
+            the sources alone don't leave room for any target file
+    """
+    sizes = {p: os.path.getsize(p) for p in job.target_files}
+
+    if job.max_file_bytes is not None:
+        too_large = [
+            p for p, size in sizes.items() if size > job.max_file_bytes
+        ]
+        if too_large:
+            raise FileTooLargeError(
+                f"{len(too_large)} target file(s) exceed the limit of"
+                f" {job.max_file_bytes} bytes: {', '.join(too_large)}"
+            )
+
+    if job.max_request_bytes is not None and job.source_token_budget is None:
+        source_bytes = sum(
+            min(os.path.getsize(p), job.max_file_bytes or sys.maxsize)
+            for p in job.source_files
+        )
+        if source_bytes >= job.max_request_bytes:
+            raise FileTooLargeError(
+                f"Source files take {source_bytes} bytes, more than the"
+                f" request limit of {job.max_request_bytes} bytes."
+                " Set a source token budget to send only relevant parts."
+            )
+
+    return sizes
+
+
+async def backup_files(
+    files: dict[str, str],
+    project_path: Path,
+    backup_dir_path: Path,
+    **details: Any,
+) -> storage.Manifest:
+    """
+    Store the contents of `files` as a new backup of the project
+
+    Contents go compressed to the blob store shared by all projects, the
+    backup only records their hashes. Backups beyond the retention setting
+    are dropped, their blobs are left to the retention daemon.
+
+    Params:
+        details: Any - Fields of the manifest, e.g. the run's instructions
+
+    Returns:
+        storage.Manifest: the new backup
+    """
+    manifest = storage.new_manifest(backup_dir_path, project_path, **details)
+
+    async def backup_file(p: str, content: str) -> None:
+        relative_file_path = Path(p).relative_to(project_path).as_posix()
+        manifest.files[relative_file_path] = await storage.put_blob(content)
+
+    tasks = [backup_file(p, content) for p, content in files.items()]
+    await asyncio.gather(*tasks)
+
+    manifest.save()
+    storage.keep_latest_runs(
+        backup_dir_path, settings.service.current("Storage", "backup-keep-runs")
+    )
+    return manifest
+
+
+def backed_up_digests(
+    project_path: Path, backup_dir_path: Path, files: list[str]
+) -> dict[str, str | None]:
+    """
+    Blob hash of the backed up contents of each of `files`, None for files
+    the latest backup doesn't contain
+    """
+    manifest = storage.latest_run(backup_dir_path)
+    backed_up = manifest.files if manifest is not None else {}
+
+    return {
+        p: backed_up.get(Path(p).relative_to(project_path).as_posix())
+        for p in files
+    }
+
+
+async def apply_response(
+    response: str,
+    cache: file_cache.FileCache | None = None,
+    expected: list[str] | None = None,
+) -> tuple[dict[str, str], list[str]]:
+    """
+    Write the files returned by the model
+
+    A malformed response is repaired as far as possible, every complete
+    file in it is written. Files cut off or missing are never written.
+
+    Params:
+        expected: list[str] - Paths sent to the model, other paths in the
+            response are ignored
+
+    Returns:
+        tuple[dict[str, str], list[str]]: content hash of every written
+            file by its path and the expected files that were lost
+
+    Raises:
+        ValueError: when no file could be read from the response
+    """
+    parsed = parse_response(response, expected)
+    if parsed.repaired:
+        print(
+            f"Repaired a malformed response, recovered {len(parsed.files)}"
+            f" file(s) and lost {len(parsed.lost)}",
+            file=sys.stderr,
+        )
+    for path in parsed.unexpected:
+        print(f"Ignoring unexpected file in response: {path}", file=sys.stderr)
+    output_files = parsed.files
+
+    async def save_file(file_path: str, contents: str) -> None:
+        async with aiofiles.open(file_path, "w") as file:
+            await file.write(contents)
+        if cache is not None:
+            cache.remember(file_path, contents)
+
+    tasks = [
+        save_file(file_path, content)
+        for file_path, content in output_files.items()
+    ]
+    await asyncio.gather(*tasks)
+
+    return {
+        file_path: content_hash(content)
+        for file_path, content in output_files.items()
+    }, parsed.lost
+
+
+async def restore_backup(
+    project_path: Path,
+    backup_dir_path: Path,
+    checkpoint_path: Path | None = None,
+    cache: file_cache.FileCache | None = None,
+) -> None:
+    """
+    Restore every file from the latest backup and delete it afterwards
+
+    The checkpoint at `checkpoint_path` is discarded as well, a run can't
+    be resumed once its backup is gone.
+    """
+    manifest = storage.latest_run(backup_dir_path)
+    if manifest is None:
+        raise FileNotFoundError(f"No backup in {backup_dir_path}")
+
+    await write_backed_up(project_path, manifest.files, cache)
+
+    # Delete the backup after successful rollback, the one before it (if
+    # kept) can be rolled back to next
+    manifest.path.unlink(missing_ok=True)
+
+    if checkpoint_path is not None:
+        checkpoint_path.unlink(missing_ok=True)
+
+
+async def write_backed_up(
+    project_path: Path,
+    files: dict[str, str],
+    cache: file_cache.FileCache | None = None,
+) -> None:
+    """Write the backed up contents of `files` (path -> blob) in parallel"""
+
+    async def write_file(relative_path: str, digest: str) -> None:
+        original_file_path = project_path / relative_path
+
+        # Read and decompress backup content
+        content = await asyncio.to_thread(storage.read_blob, digest)
+
+        # Write to original location
+        original_file_path.parent.mkdir(parents=True, exist_ok=True)
+        async with aiofiles.open(original_file_path, "w") as f:
+            await f.write(content)
+        if cache is not None:
+            cache.remember(str(original_file_path), content)
+
+    await asyncio.gather(
+        *(write_file(path, digest) for path, digest in files.items())
+    )
+
+
+async def reject_files(
+    project_path: Path,
+    manifest: storage.Manifest,
+    files: list[str],
+    cache: file_cache.FileCache | None = None,
+) -> None:
+    """
+    Roll back `files` of the run of `manifest` and keep the other ones
+
+    Unlike a restore no backup is taken, the files get the contents they
+    had before the run and the run remembers them as rejected.
+
+    Params:
+        files: list[str] - Project relative paths of files of the run
+
+    Raises:
+        KeyError: when a file isn't part of the run
+    """
+    selected = {path: manifest.files[path] for path in files}
+    await write_backed_up(project_path, selected, cache)
+
+    manifest.rejected = sorted({*manifest.rejected, *selected})
+    await asyncio.to_thread(manifest.save)
+
+
+async def restore_run(
+    project_path: Path,
+    backup_dir_path: Path,
+    manifest: storage.Manifest,
+    files: list[str] | None = None,
+    checkpoint_path: Path | None = None,
+    cache: file_cache.FileCache | None = None,
+) -> storage.Manifest:
+    """
+    Bring back the files as they were before the run of `manifest`
+
+    The current contents are backed up first, so the restore shows up in
+    the history and can be undone like a run. The checkpoint at
+    `checkpoint_path` is discarded.
+
+    Params:
+        files: list[str] - Project relative paths to restore, every file
+            of the run when None
+
+    Returns:
+        storage.Manifest: the backup taken before restoring
+
+    Raises:
+        KeyError: when a file isn't part of the run
+    """
+    selected = {
+        path: manifest.files[path]
+        for path in (files if files is not None else manifest.files)
+    }
+
+    existing = [
+        str(project_path / relative_path)
+        for relative_path in selected
+        if (project_path / relative_path).exists()
+    ]
+    current = await load_files_content(existing, cache)
+
+    undo = await backup_files(
+        current,
+        project_path,
+        backup_dir_path,
+        kind="restore",
+        instructions=(
+            f"Restore of {len(selected)} file(s) from {manifest.created}"
+        ),
+        status="done",
+    )
+    await write_backed_up(project_path, selected, cache)
+
+    if checkpoint_path is not None:
+        checkpoint_path.unlink(missing_ok=True)
+    return undo
+
+
+def plan_incremental(
+    job: Job,
+    target_files: dict[str, str],
+    sources: str,
+    runs: list[storage.Manifest],
+    digest: Digest | None = None,
+) -> tuple[list[str], dict[str, str]]:
+    """
+    Find the target files earlier runs already produced an output for
+
+    Only runs with the same instructions, model and sources count. Files
+    flagged by the user or rejected in the latest of these runs are
+    always sent, and a rejected output is never reused.
+
+    Returns:
+        tuple[list[str], dict[str, str]]: the files holding such an output
+            already, and the blob of the output by file for files that
+            hold the input it was produced from
+    """
+    digest = digest or (lambda _, content: content_hash(content))
+    model = f"{job.company.name}:{job.model}"
+
+    matching = [
+        manifest
+        for manifest in reversed(runs)
+        if manifest.kind == "run"
+        and (manifest.instructions, manifest.model, manifest.sources)
+        == (job.instructions, model, sources)
+    ]
+    # a later run produces the same output for the same input, so an
+    # output rejected once must not come back from any other run
+    rejected = {
+        (relative_path, manifest.outputs[relative_path])
+        for manifest in matching
+        for relative_path in manifest.rejected
+        if relative_path in manifest.outputs
+    }
+    rejected_last = set(matching[0].rejected) if matching else set()
+
+    # (relative path, input blob) -> output blob, newest run first
+    memo: dict[tuple[str, str], str] = {}
+    produced: dict[str, set[str]] = {}
+    for manifest in matching:
+        for relative_path, output in manifest.outputs.items():
+            if relative_path not in manifest.files:
+                continue
+            if (relative_path, output) in rejected:
+                continue
+            key = (relative_path, manifest.files[relative_path])
+            memo.setdefault(key, output)
+            produced.setdefault(relative_path, set()).add(output)
+
+    up_to_date: list[str] = []
+    reuse: dict[str, str] = {}
+    flagged = set(job.flagged)
+    for p, content in target_files.items():
+        if p in flagged:
+            continue
+
+        relative_path = Path(os.path.relpath(p, job.project_path)).as_posix()
+        if relative_path in rejected_last:
+            continue
+        current = digest(p, content)
+        if current in produced.get(relative_path, ()):
+            up_to_date.append(p)
+        elif (relative_path, current) in memo:
+            reuse[p] = memo[(relative_path, current)]
+    return up_to_date, reuse
+
+
+def select_sources(
+    index_path: Path,
+    query: str,
+    source_files: dict[str, str],
+    token_budget: int,
+) -> dict[str, str]:
+    """Update the project's source index and pick chunks within budget"""
+    index = SourceIndex.load(index_path)
+    if index.update(source_files):
+        index.save()
+    return index.select(query, source_files, token_budget)
+
+
+def has_backup(backup_dir_path: Path) -> bool:
+    return storage.latest_run(backup_dir_path) is not None
+
+
+async def run_job(
+    job: Job,
+    hooks: JobHooks | None = None,
+    request_limit: AbstractAsyncContextManager | None = None,
+) -> JobResult:
+    """
+    Run the load/backup/prompt/apply pipeline for `job`
+
+    Progress is checkpointed after every applied shard. When a previous
+    attempt of the very same run failed partway, only the target files
+    that weren't applied yet are sent again and the original backup is
+    kept.
+
+    Params:
+        hooks: JobHooks - Optional callbacks used to report progress.
+        request_limit: AbstractAsyncContextManager - Optional semaphore held
+            while an AI request is in flight, shared between jobs to cap the
+            number of concurrent requests.
+    """
+    hooks = hooks or JobHooks()
+    assert job.backup_dir is not None
+    assert job.checkpoint_path is not None
+
+    cache = file_cache.for_project(job.project_path)
+    stats = RunStats()
+    # the backup of this run, it records the outcome for the history
+    manifest: storage.Manifest | None = None
+    changed_files: list[str] = []
+    up_to_date: list[str] = []
+    reuse: dict[str, str] = {}
+
+    def relative(p: str) -> str:
+        return Path(os.path.relpath(p, job.project_path)).as_posix()
+
+    stage = Stage.Load
+
+    async def enter(next_stage: Stage) -> None:
+        nonlocal stage
+        stage = next_stage
+        if hooks.on_stage is not None:
+            await hooks.on_stage(job, stage)
+
+    async def prompt(text: str, context: str) -> ai.AiResponse:
+        if request_limit is None:
+            return await ai.client.prompt(job.company, text, job.model, context)
+        async with request_limit:
+            return await ai.client.prompt(job.company, text, job.model, context)
+
+    try:
+        await enter(Stage.Load)
+        check_missing_files(job)
+        target_sizes = check_memory_limits(job)
+        target_files = await load_files_content(job.target_files, cache)
+        if job.max_file_bytes is not None:
+            source_files, stats.truncated_files = await load_bounded_files(
+                job.source_files, job.max_file_bytes, cache
+            )
+        else:
+            source_files = await load_files_content(job.source_files, cache)
+
+        truncated = set(stats.truncated_files)
+
+        def digest(path: str, content: str) -> str:
+            # the head of a truncated file isn't the file's content, the
+            # cache would remember its hash for the whole file
+            if path in truncated:
+                return content_hash(content)
+            return cache.digest(path, content)
+
+        signature = run_signature(
+            job.instructions,
+            f"{job.company.name}:{job.model}",
+            job.target_files,
+            source_files,
+            digest,
+        )
+        checkpoint = Checkpoint.load(job.checkpoint_path, signature)
+        sources = sources_signature(source_files, digest)
+
+        if job.incremental:
+            runs = await asyncio.to_thread(storage.list_runs, job.backup_dir)
+            up_to_date, reuse = plan_incremental(
+                job, target_files, sources, runs, digest
+            )
+            # files holding their output already are neither backed up
+            # nor sent
+            for p in up_to_date:
+                del target_files[p]
+
+        if job.source_token_budget is not None:
+            assert job.index_path is not None
+            # ranking is CPU bound, keep it off the event loop
+            source_files = await asyncio.to_thread(
+                select_sources,
+                job.index_path,
+                job.instructions,
+                source_files,
+                job.source_token_budget,
+            )
+
+        await enter(Stage.Backup)
+        if checkpoint is None:
+            # an incremental run with nothing left to do leaves no trace
+            # in the history, it would push out useful backups
+            if target_files:
+                manifest = await backup_files(
+                    target_files,
+                    job.project_path,
+                    job.backup_dir,
+                    instructions=job.instructions,
+                    model=f"{job.company.name}:{job.model}",
+                    sources=sources,
+                )
+            checkpoint = Checkpoint(job.checkpoint_path, signature)
+            checkpoint.save()
+        else:
+            # the backup of the failed attempt holds the originals
+            manifest = storage.latest_run(job.backup_dir)
+            if manifest is not None:
+                manifest.status = "running"
+
+        completed = checkpoint.completed(target_files, digest)
+
+        if reuse:
+            await write_backed_up(
+                job.project_path,
+                {relative(p): output for p, output in reuse.items()},
+                cache,
+            )
+            checkpoint.applied.update(reuse)
+            checkpoint.save()
+            changed_files.extend(reuse)
+            if manifest is not None:
+                manifest.outputs.update(
+                    {relative(p): output for p, output in reuse.items()}
+                )
+
+        pending = [
+            p
+            for p in job.target_files
+            if p in target_files and p not in completed and p not in reuse
+        ]
+
+        async def run_shard(shard: list[str]) -> None:
+            async with shards_in_flight:
+                await send_shard(shard)
+
+        async def send_shard(shard: list[str]) -> None:
+            # every shard shares the same context so its cache entry is
+            # reused, only the target files and instructions differ
+            request = build_prompt(
+                job.instructions,
+                {p: target_files[p] for p in shard},
+                source_files,
+            )
+            nonlocal waiting
+            try:
+                response = await prompt(request.prompt, request.context)
+            finally:
+                # the prompt holds a copy of every file, don't keep it
+                # around while the response is applied
+                del request
+                waiting -= 1
+            stats.add(response)
+
+            if waiting == 0:
+                await enter(Stage.Apply)
+
+            applied, lost = await apply_response(response.text, cache, shard)
+            del response
+
+            checkpoint.applied.update(applied)
+            checkpoint.save()
+            changed_files.extend(applied)
+
+            if manifest is not None:
+                # keep the outputs, an incremental run can reuse them
+                for p, output in applied.items():
+                    await storage.put_blob(await cache.read(p))
+                    manifest.outputs[relative(p)] = output
+
+            if lost:
+                # the recovered files are checkpointed, a retry only sends
+                # the lost ones
+                raise IncompleteResponseError(list(map(relative, lost)))
+
+        source_bytes = sum(
+            len(content.encode("utf-8")) for content in source_files.values()
+        )
+        shards = job.shards(
+            pending,
+            target_sizes,
+            (
+                max(1, job.max_request_bytes - source_bytes)
+                if job.max_request_bytes is not None
+                else None
+            ),
+        )
+
+        # the request limit bounds memory, so do the shards in flight
+        shards_in_flight = asyncio.Semaphore(
+            MAX_SHARDS_IN_FLIGHT
+            if job.max_request_bytes is not None
+            else max(1, len(shards))
+        )
+
+        # shards share the job's stage, it stays Prompt until the last
+        # of them got its response
+        waiting = len(shards)
+
+        await enter(Stage.Prompt)
+        results = await asyncio.gather(
+            *(run_shard(shard) for shard in shards),
+            return_exceptions=True,
+        )
+        # release the loaded contents before the job result is handed out
+        target_files.clear()
+        source_files.clear()
+        # the other shards are checkpointed, surface the first failure
+        lost = []
+        for result in results:
+            if isinstance(result, IncompleteResponseError):
+                lost.extend(result.lost)
+            elif isinstance(result, BaseException):
+                raise result
+        if lost:
+            raise IncompleteResponseError(lost)
+
+        checkpoint.clear()
+        await enter(Stage.Done)
+    except Exception as e:
+        if manifest is not None:
+            manifest.status = "failed"
+        if hooks.on_error is not None:
+            await hooks.on_error(job, stage, e)
+        raise
+    finally:
+        cache.save()
+        stats.peak_rss_bytes = peak_rss_bytes()
+        if manifest is not None:
+            if manifest.status == "running":
+                manifest.status = "done"
+            manifest.stats = asdict(stats)
+            manifest.changed = sorted(
+                {*manifest.changed, *map(relative, changed_files)}
+            )
+            manifest.save()
+
+    return JobResult(
+        job=job,
+        changed_files=changed_files,
+        skipped_files=[p for p in job.target_files if p in completed],
+        stats=stats,
+        manifest=manifest,
+        up_to_date_files=up_to_date,
+        reused_files=list(reuse),
+    )
+
+
+async def run_jobs(
+    jobs: list[Job],
+    hooks: JobHooks | None = None,
+    max_requests: int | None = None,
+) -> list[JobResult | BaseException]:
+    """
+    Run many jobs concurrently, each in its own task
+
+    Returns one entry per job in the same order, either its JobResult or
+    the exception it failed with.
+    """
+    request_limit = (
+        asyncio.Semaphore(max_requests) if max_requests is not None else None
+    )
+    tasks = [
+        asyncio.create_task(run_job(job, hooks, request_limit)) for job in jobs
+    ]
+    return await asyncio.gather(*tasks, return_exceptions=True)
@@ -0,0 +1,181 @@
+import json
+import os
+import sys
+from collections import OrderedDict
+from pathlib import Path
+
+import aiofiles
+
+from atrament import settings, storage
+from atrament.checkpoint import content_hash
+
+DEFAULT_MAX_BYTES: int = 64 * 1024 * 1024
+
+# (mtime_ns, size) of a file, a changed file never matches its old key
+StatKey = tuple[int, int]
+
+
+def _stat_key(path: str) -> StatKey:
+    stat = os.stat(path)
+    return stat.st_mtime_ns, stat.st_size
+
+
+class FileCache:
+    """
+    Contents of a project's files keyed by (path, mtime_ns, size)
+
+    Contents are kept in memory up to `max_bytes` and evicted least
+    recently used first. Content hashes are also remembered on disk, so
+    unchanged files aren't hashed again after a restart.
+    """
+
+    def __init__(
+        self,
+        max_bytes: int = DEFAULT_MAX_BYTES,
+        digest_path: Path | None = None,
+    ):
+        self.max_bytes = max_bytes
+        self.digest_path = digest_path
+        self.size_bytes = 0
+        self._contents: OrderedDict[str, tuple[StatKey, str]] = OrderedDict()
+        self._digests: dict[str, tuple[StatKey, str]] = {}
+        self._digests_changed = False
+
+        if digest_path is not None:
+            self._load_digests()
+
+    def _load_digests(self) -> None:
+        assert self.digest_path is not None
+        try:
+            with open(self.digest_path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return
+
+        for path, (mtime_ns, size, digest) in data.items():
+            self._digests[path] = ((mtime_ns, size), digest)
+
+    def save(self) -> None:
+        """Persist the content hashes if any were added"""
+        if self.digest_path is None or not self._digests_changed:
+            return
+
+        self.digest_path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = self.digest_path.with_suffix(
+            self.digest_path.suffix + ".tmp"
+        )
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(
+                {
+                    path: [key[0], key[1], digest]
+                    for path, (key, digest) in self._digests.items()
+                },
+                f,
+            )
+        os.replace(tmp_path, self.digest_path)
+        self._digests_changed = False
+
+    def _insert(self, path: str, key: StatKey, content: str) -> None:
+        self.invalidate(path)
+
+        size = sys.getsizeof(content)
+        if size > self.max_bytes:
+            return
+
+        self._contents[path] = (key, content)
+        self.size_bytes += size
+        self._evict()
+
+    def _evict(self) -> None:
+        while self.size_bytes > self.max_bytes and self._contents:
+            _, (_, content) = self._contents.popitem(last=False)
+            self.size_bytes -= sys.getsizeof(content)
+
+    def resize(self, max_bytes: int) -> None:
+        self.max_bytes = max_bytes
+        self._evict()
+
+    def invalidate(self, path: str) -> None:
+        entry = self._contents.pop(path, None)
+        if entry is not None:
+            self.size_bytes -= sys.getsizeof(entry[1])
+
+    def clear(self) -> None:
+        self._contents.clear()
+        self.size_bytes = 0
+
+    async def read(self, path: str) -> str:
+        """Return the content of `path`, from memory if it didn't change"""
+        key = _stat_key(path)
+
+        entry = self._contents.get(path)
+        if entry is not None and entry[0] == key:
+            self._contents.move_to_end(path)
+            return entry[1]
+
+        async with aiofiles.open(path, mode="r") as f:
+            content = await f.read()
+
+        # only trust the content if the file didn't change while reading
+        if _stat_key(path) == key:
+            self._insert(path, key, content)
+        return content
+
+    def remember(self, path: str, content: str) -> None:
+        """Record `content` that was just written to `path` by us"""
+        self._insert(path, _stat_key(path), content)
+
+    def digest(self, path: str, content: str) -> str:
+        """
+        Hash of `content`, which has to be the current content of `path`
+
+        The hash is looked up by the file's stat key before hashing.
+        """
+        try:
+            key = _stat_key(path)
+        except OSError:
+            return content_hash(content)
+
+        entry = self._digests.get(path)
+        if entry is not None and entry[0] == key:
+            return entry[1]
+
+        digest = content_hash(content)
+        self._digests[path] = (key, digest)
+        self._digests_changed = True
+        return digest
+
+
+_caches: dict[str, FileCache] = {}
+
+
+def _max_bytes() -> int:
+    return (
+        settings.service.current("Performance", "file-cache-mb") * 1024 * 1024
+    )
+
+
+def for_project(project_path: Path) -> FileCache:
+    """
+    Cache shared by everything that works on the project's files
+
+    Shared by all sessions too, entries are keyed by the files' stats so
+    nobody ever gets stale content.
+    """
+    key = storage.project_id(project_path)
+    if key not in _caches:
+        _caches[key] = FileCache(
+            max_bytes=_max_bytes(),
+            digest_path=storage.digest_path_for(project_path),
+        )
+    return _caches[key]
+
+
+def _on_settings_change(changes: settings.Changes) -> None:
+    if ("Performance", "file-cache-mb") not in changes:
+        return
+    for cache in _caches.values():
+        cache.resize(_max_bytes())
+
+
+settings.service.subscribe(_on_settings_change)
@@ -0,0 +1,229 @@
+import json
+import math
+import os
+import re
+from collections import Counter
+from dataclasses import dataclass
+from pathlib import Path
+
+from atrament.ai import estimate_tokens
+
+CHUNK_LINES: int = 40
+
+# BM25 parameters
+K1: float = 1.5
+B: float = 0.75
+
+_WORD_RE = re.compile(r"[A-Za-z_][A-Za-z0-9_]*|\d+")
+_CAMEL_RE = re.compile(r"[A-Z]+(?=[A-Z][a-z])|[A-Z]?[a-z]+|[A-Z]+|\d+")
+
+
+def tokenize(text: str) -> list[str]:
+    """
+    Split `text` into lowercase terms
+
+    Identifiers are kept whole and also split into their snake_case and
+    camelCase parts, so "loadFilesContent" matches "load files".
+    """
+    terms = []
+    for word in _WORD_RE.findall(text):
+        lower = word.lower()
+        terms.append(lower)
+
+        parts = [
+            part.lower()
+            for piece in word.split("_")
+            for part in _CAMEL_RE.findall(piece)
+        ]
+        if len(parts) > 1:
+            terms.extend(parts)
+    return terms
+
+
+@dataclass
+class Chunk:
+    path: str
+    start: int  # first line, 1 based
+    end: int  # last line, inclusive
+    terms: dict[str, int]
+    length: int
+
+    @property
+    def key(self) -> str:
+        return f"{self.path}:{self.start}-{self.end}"
+
+
+def chunk_text(path: str, text: str) -> list[Chunk]:
+    lines = text.splitlines(keepends=True)
+    chunks = []
+    for i in range(0, len(lines), CHUNK_LINES):
+        terms = tokenize("".join(lines[i : i + CHUNK_LINES]))
+        chunks.append(
+            Chunk(
+                path=path,
+                start=i + 1,
+                end=min(i + CHUNK_LINES, len(lines)),
+                terms=dict(Counter(terms)),
+                length=len(terms),
+            )
+        )
+    return chunks
+
+
+class SourceIndex:
+    """
+    Lexical (BM25) index over the source files of a project
+
+    Only term statistics are stored on disk, the chunk texts are cut from
+    the file contents that are loaded for the run anyway. Files are
+    re-indexed only when their mtime or size changes.
+    """
+
+    def __init__(self, path: Path):
+        self.path = path
+        # source path -> (mtime_ns, size, chunks)
+        self._files: dict[str, tuple[int, int, list[Chunk]]] = {}
+
+    @classmethod
+    def load(cls, path: Path) -> "SourceIndex":
+        index = cls(path)
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return index
+
+        for source_path, entry in data.get("files", {}).items():
+            index._files[source_path] = (
+                entry["mtime_ns"],
+                entry["size"],
+                [Chunk(path=source_path, **chunk) for chunk in entry["chunks"]],
+            )
+        return index
+
+    def save(self) -> None:
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        data = {
+            "files": {
+                source_path: {
+                    "mtime_ns": mtime_ns,
+                    "size": size,
+                    "chunks": [
+                        {
+                            "start": chunk.start,
+                            "end": chunk.end,
+                            "terms": chunk.terms,
+                            "length": chunk.length,
+                        }
+                        for chunk in chunks
+                    ],
+                }
+                for source_path, (mtime_ns, size, chunks) in self._files.items()
+            }
+        }
+
+        tmp_path = self.path.with_suffix(self.path.suffix + ".tmp")
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(data, f)
+        os.replace(tmp_path, self.path)
+
+    def update(self, source_files: dict[str, str]) -> bool:
+        """
+        Bring the index in line with `source_files`
+
+        Returns:
+            bool: whether anything changed and the index should be saved
+        """
+        changed = False
+
+        for source_path in list(self._files):
+            if source_path not in source_files:
+                del self._files[source_path]
+                changed = True
+
+        for source_path, text in source_files.items():
+            stat = os.stat(source_path)
+            indexed = self._files.get(source_path)
+            if indexed is not None and indexed[:2] == (
+                stat.st_mtime_ns,
+                stat.st_size,
+            ):
+                continue
+
+            self._files[source_path] = (
+                stat.st_mtime_ns,
+                stat.st_size,
+                chunk_text(source_path, text),
+            )
+            changed = True
+
+        return changed
+
+    def rank(self, query: str) -> list[tuple[float, Chunk]]:
+        chunks = [chunk for _, _, cs in self._files.values() for chunk in cs]
+        if not chunks:
+            return []
+
+        query_terms = set(tokenize(query))
+        average_length = sum(c.length for c in chunks) / len(chunks) or 1.0
+        document_frequency = Counter(
+            term for c in chunks for term in query_terms if term in c.terms
+        )
+
+        ranked = []
+        for chunk in chunks:
+            score = 0.0
+            for term in query_terms:
+                frequency = chunk.terms.get(term, 0)
+                if frequency == 0:
+                    continue
+                df = document_frequency[term]
+                idf = math.log(1 + (len(chunks) - df + 0.5) / (df + 0.5))
+                score += idf * (
+                    frequency
+                    * (K1 + 1)
+                    / (
+                        frequency
+                        + K1 * (1 - B + B * chunk.length / average_length)
+                    )
+                )
+            ranked.append((score, chunk))
+
+        ranked.sort(key=lambda x: x[0], reverse=True)
+        return ranked
+
+    def select(
+        self, query: str, source_files: dict[str, str], token_budget: int
+    ) -> dict[str, str]:
+        """
+        Pick the chunks most relevant to `query` that fit in `token_budget`
+
+        Sources that fit the budget as a whole are returned unchanged.
+        Otherwise the result maps "path:start-end" to the chunk's text.
+        """
+        if (
+            sum(estimate_tokens(t) for t in source_files.values())
+            <= token_budget
+        ):
+            return source_files
+
+        lines = {
+            source_path: text.splitlines(keepends=True)
+            for source_path, text in source_files.items()
+        }
+
+        result = {}
+        used = 0
+        for score, chunk in self.rank(query):
+            if score <= 0:
+                break
+
+            text = "".join(lines[chunk.path][chunk.start - 1 : chunk.end])
+            tokens = estimate_tokens(text)
+            if used + tokens > token_budget:
+                continue
+
+            result[chunk.key] = text
+            used += tokens
+
+        return result
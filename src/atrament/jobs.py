@@ -0,0 +1,248 @@
+import asyncio
+import itertools
+from collections.abc import Callable
+from dataclasses import dataclass, field
+from enum import Enum
+from pathlib import Path
+from sys import stderr
+
+from atrament import ai, engine, settings
+
+MAX_CONCURRENT_JOBS: int = 4
+MAX_REQUESTS_PER_COMPANY: int = 2
+
+
+class Limit:
+    """
+    Semaphore whose size can change while it is in use
+
+    Shrinking never interrupts holders, new acquirers just wait until
+    enough of them released.
+    """
+
+    def __init__(self, size: int):
+        self.size = size
+        self.in_use = 0
+        self._condition = asyncio.Condition()
+
+    async def resize(self, size: int) -> None:
+        async with self._condition:
+            self.size = size
+            self._condition.notify_all()
+
+    async def __aenter__(self) -> None:
+        async with self._condition:
+            await self._condition.wait_for(lambda: self.in_use < self.size)
+            self.in_use += 1
+
+    async def __aexit__(self, *_) -> None:
+        async with self._condition:
+            self.in_use -= 1
+            self._condition.notify_all()
+
+
+class JobStatus(Enum):
+    Queued = "queued"
+    Running = "running"
+    Done = "done"
+    Failed = "failed"
+
+
+@dataclass
+class QueuedJob:
+    id: int
+    job: engine.Job
+    status: JobStatus = JobStatus.Queued
+    stage: engine.Stage | None = None
+    result: engine.JobResult | None = None
+    error: Exception | None = None
+    task: asyncio.Task | None = field(default=None, repr=False)
+
+    @property
+    def finished(self) -> bool:
+        return self.status in (JobStatus.Done, JobStatus.Failed)
+
+    def describe(self) -> str:
+        """Short human readable progress of the job"""
+        match self.status:
+            case JobStatus.Running if self.stage not in (
+                None,
+                engine.Stage.Done,
+            ):
+                return f"{self.stage.value}..."
+            case _:
+                return self.status.value
+
+    async def wait(self) -> engine.JobResult:
+        """
+        Wait for the job to finish and return its result
+
+        The job task is shielded so a cancelled waiter (e.g. a handler of a
+        view that was closed) doesn't take the job down with it.
+        """
+        assert self.task is not None
+        await asyncio.shield(self.task)
+
+        if self.error is not None:
+            raise self.error
+        assert self.result is not None
+        return self.result
+
+
+JobListener = Callable[[QueuedJob], None]
+
+
+class JobQueue:
+    """
+    Process-wide queue running jobs in the background
+
+    Jobs outlive the view they were started from. The number of jobs
+    running at once is capped globally and the number of in-flight AI
+    requests is capped per company, so several projects can share the
+    API quota. Listeners are notified on every progress change.
+    """
+
+    def __init__(
+        self,
+        max_concurrent_jobs: int = MAX_CONCURRENT_JOBS,
+        max_requests_per_company: int = MAX_REQUESTS_PER_COMPANY,
+    ):
+        self._job_limit = Limit(max_concurrent_jobs)
+        self._max_requests_per_company = max_requests_per_company
+        self._request_limits: dict[ai.AiCompany, Limit] = {}
+        self._jobs: list[QueuedJob] = []
+        self._listeners: list[JobListener] = []
+        self._ids = itertools.count(1)
+        self._resizing: asyncio.Task | None = None
+
+    def subscribe(self, listener: JobListener) -> Callable[[], None]:
+        """Register a listener and return a function that removes it"""
+        self._listeners.append(listener)
+
+        def unsubscribe() -> None:
+            if listener in self._listeners:
+                self._listeners.remove(listener)
+
+        return unsubscribe
+
+    def _notify(self, queued: QueuedJob) -> None:
+        # copy, listeners are allowed to unsubscribe while being notified
+        for listener in list(self._listeners):
+            try:
+                listener(queued)
+            except Exception as e:
+                print(f"Job listener failed: {e}", file=stderr)
+
+    def _request_limit(self, company: ai.AiCompany) -> Limit:
+        if company not in self._request_limits:
+            self._request_limits[company] = Limit(
+                self._max_requests_per_company
+            )
+        return self._request_limits[company]
+
+    async def resize(
+        self,
+        max_concurrent_jobs: int | None = None,
+        max_requests_per_company: int | None = None,
+    ) -> None:
+        """Change the limits, running jobs keep their slots"""
+        if max_concurrent_jobs is not None:
+            await self._job_limit.resize(max_concurrent_jobs)
+        if max_requests_per_company is not None:
+            self._max_requests_per_company = max_requests_per_company
+            for limit in self._request_limits.values():
+                await limit.resize(max_requests_per_company)
+
+    def on_settings_change(self, changes: settings.Changes) -> None:
+        max_jobs = changes.get(("Performance", "max-concurrent-jobs"))
+        max_requests = changes.get(("Performance", "max-requests-per-company"))
+        if max_jobs is None and max_requests is None:
+            return
+        # the event loop only keeps a weak reference to tasks, and resizes
+        # have to be applied in the order the settings changed
+        self._resizing = asyncio.create_task(
+            self._resize_after(self._resizing, max_jobs, max_requests)
+        )
+
+    async def _resize_after(
+        self,
+        previous: asyncio.Task | None,
+        max_concurrent_jobs: int | None,
+        max_requests_per_company: int | None,
+    ) -> None:
+        if previous is not None:
+            await asyncio.wait([previous])
+        try:
+            await self.resize(max_concurrent_jobs, max_requests_per_company)
+        except Exception as e:
+            print(f"Resizing the job queue failed: {e}", file=stderr)
+
+    def jobs(self) -> list[QueuedJob]:
+        return list(self._jobs)
+
+    def latest_for(self, project_path: Path) -> QueuedJob | None:
+        for queued in reversed(self._jobs):
+            if queued.job.project_path == project_path:
+                return queued
+        return None
+
+    def active_for(self, project_path: Path) -> QueuedJob | None:
+        queued = self.latest_for(project_path)
+        if queued is None or queued.finished:
+            return None
+        return queued
+
+    def submit(self, job: engine.Job) -> QueuedJob:
+        """
+        Queue `job` for execution and return its handle
+
+        Raises:
+            RuntimeError: when the project already has a job queued or
+                running, two runs over the same files would clobber each
+                other's backups
+        """
+        if self.active_for(job.project_path) is not None:
+            raise RuntimeError(
+                f"Project {job.project_name} is already being processed"
+            )
+
+        # only the latest finished job of a project is worth remembering
+        self._jobs = [
+            queued
+            for queued in self._jobs
+            if queued.job.project_path != job.project_path
+        ]
+
+        queued = QueuedJob(id=next(self._ids), job=job)
+        self._jobs.append(queued)
+        queued.task = asyncio.create_task(self._run(queued))
+        self._notify(queued)
+        return queued
+
+    async def _run(self, queued: QueuedJob) -> None:
+        async def on_stage(_job: engine.Job, stage: engine.Stage) -> None:
+            queued.stage = stage
+            self._notify(queued)
+
+        async with self._job_limit:
+            queued.status = JobStatus.Running
+            self._notify(queued)
+
+            try:
+                queued.result = await engine.run_job(
+                    queued.job,
+                    engine.JobHooks(on_stage=on_stage),
+                    self._request_limit(queued.job.company),
+                )
+            except Exception as e:
+                queued.status = JobStatus.Failed
+                queued.error = e
+                self._notify(queued)
+                return
+
+            queued.status = JobStatus.Done
+            self._notify(queued)
+
+
+queue = JobQueue()
+settings.service.subscribe(queue.on_settings_change)
@@ -4,13 +4,24 @@ _main_page_ref: ft.Page | None = None
 
 
 def set_page_ref(page: ft.Page):
-    """Set the global page reference."""
+    """Set the fallback page reference used outside of a session's context."""
     global _main_page_ref
     _main_page_ref = page
 
 
 def get_page_ref() -> ft.Page:
-    """Get the global page reference."""
+    """
+    Get the page of the session the caller runs in.
+
+    Every session served in web mode has its own page, handlers and the
+    tasks they start see theirs through Flet's context. The page set by
+    set_page_ref() is only used where no session is known.
+    """
+    try:
+        return ft.context.page
+    except RuntimeError:
+        pass
+
     if _main_page_ref is None:
         raise RuntimeError("Page not initialized. Call set_page() first.")
     return _main_page_ref
@@ -0,0 +1,59 @@
+import json
+from dataclasses import dataclass
+
+# Never changes between runs, so it always starts the cached prefix
+SYSTEM_RULES = """You are an AI assistant that modifies files based on user instructions.
+
+INPUT STRUCTURE:
+- source_files: Reference files that may contain relevant information (provided as JSON)
+- target_files: Files to be edited (provided as JSON)
+- user_instructions: Specific editing instructions to apply (given last)
+
+OUTPUT REQUIREMENTS:
+Return ONLY a valid JSON object with the same structure as target_files, containing the updated file contents.
+- Use proper JSON formatting with correctly escaped newlines (use \\n for line breaks, not literal backslash-n)
+- When the JSON is parsed by Python's json.loads(), the \\n sequences should become actual newline characters
+- Do not double-escape newlines (do not use \\\\n)
+- Do not include any explanations, greetings, or additional text outside the JSON
+- The response must be valid JSON that can be parsed directly
+
+Example: {"file.txt": "first line\\nsecond line\\nthird line"} will correctly produce newlines when parsed."""
+
+
+@dataclass
+class Prompt:
+    """
+    A prompt split by how often its parts change
+
+    `context` holds the system rules and the source files, it is identical
+    between runs over the same reference files. `prompt` holds the target
+    files followed by the user instructions, which change the most.
+    Providers cache matching prefixes, so the order matters.
+    """
+
+    context: str
+    prompt: str
+
+
+def _dump_files(files: dict[str, str]) -> str:
+    # sorted keys keep the text identical no matter the selection order
+    return json.dumps(files, indent=2, sort_keys=True)
+
+
+def build_prompt(
+    instructions: str,
+    target_files: dict[str, str],
+    source_files: dict[str, str],
+) -> Prompt:
+    context = f"""{SYSTEM_RULES}
+
+SOURCE FILES:
+{_dump_files(source_files)}"""
+
+    prompt = f"""TARGET FILES:
+{_dump_files(target_files)}
+
+USER INSTRUCTIONS:
+{instructions}"""
+
+    return Prompt(context=context, prompt=prompt)
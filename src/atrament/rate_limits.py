@@ -0,0 +1,59 @@
+from dataclasses import dataclass
+
+# Entry applying to every model without an entry of its own
+ANY_MODEL: str = "*"
+
+
+@dataclass(frozen=True)
+class RateLimit:
+    """Quota of a model, None means the limit is unknown/unbounded"""
+
+    requests_per_minute: float | None = None
+    tokens_per_minute: float | None = None
+
+
+def _per_minute(text: str, entry: str) -> float | None:
+    text = text.strip()
+    if not text:
+        return None
+    try:
+        value = float(text)
+    except ValueError:
+        raise ValueError(f"{text!r} in {entry!r} is not a number") from None
+    if value < 0:
+        raise ValueError(f"{text!r} in {entry!r} is negative")
+    return value or None
+
+
+def parse(text: str) -> dict[str, RateLimit]:
+    """
+    Read quotas written as `model=requests/tokens` per minute, separated
+    by `;`
+
+    Either number can be left out or 0 for no limit, `*` stands for the
+    models without an entry, e.g. `gpt-4o=500/30000; *=/40000`.
+
+    Raises:
+        ValueError: when an entry can't be read
+    """
+    limits: dict[str, RateLimit] = {}
+    for entry in text.split(";"):
+        entry = entry.strip()
+        if not entry:
+            continue
+
+        model, separator, quota = entry.partition("=")
+        model = model.strip()
+        if not separator or not model:
+            raise ValueError(f"Expected model=requests/tokens, got {entry!r}")
+
+        requests, _, tokens = quota.partition("/")
+        limits[model] = RateLimit(
+            requests_per_minute=_per_minute(requests, entry),
+            tokens_per_minute=_per_minute(tokens, entry),
+        )
+    return limits
+
+
+def for_model(limits: dict[str, RateLimit], model: str) -> RateLimit:
+    return limits.get(model) or limits.get(ANY_MODEL) or RateLimit()
@@ -0,0 +1,164 @@
+import json
+import re
+from dataclasses import dataclass, field
+from json.decoder import scanstring
+
+_FENCE = re.compile(r"^\s*```[\w-]*\s*\n(.*?)(?:\n\s*```\s*)?$", re.DOTALL)
+_WHITESPACE = " \t\n\r"
+
+
+class IncompleteResponseError(ValueError):
+    """Raised when the model's response is missing some of the files"""
+
+    def __init__(self, lost: list[str]):
+        self.lost = lost
+        super().__init__(
+            f"The response was incomplete, {len(lost)} file(s) were lost"
+            f", running again only regenerates those: {', '.join(lost)}"
+        )
+
+
+@dataclass
+class ParsedResponse:
+    files: dict[str, str] = field(default_factory=dict)
+    # expected files missing from the response or cut off within it
+    lost: list[str] = field(default_factory=list)
+    # files in the response nobody asked for or whose content isn't text,
+    # they are never written
+    unexpected: list[str] = field(default_factory=list)
+    # whether the response needed any repair to be read
+    repaired: bool = False
+
+
+def _strip_fences(text: str) -> str:
+    match = _FENCE.match(text)
+    return match.group(1) if match else text
+
+
+def _skip_whitespace(text: str, i: int) -> int:
+    while i < len(text) and text[i] in _WHITESPACE:
+        i += 1
+    return i
+
+
+def _salvage(text: str) -> dict[str, str]:
+    """
+    Read the complete "path": "content" entries of a possibly broken
+    object, stops at the first entry that can't be read
+    """
+    files: dict[str, str] = {}
+    i = _skip_whitespace(text, text.find("{") + 1)
+
+    while i < len(text) and text[i] != "}":
+        try:
+            if text[i] != '"':
+                break
+            key, i = scanstring(text, i + 1)
+            i = _skip_whitespace(text, i)
+            if i >= len(text) or text[i] != ":":
+                break
+            i = _skip_whitespace(text, i + 1)
+            if i >= len(text) or text[i] != '"':
+                break
+            value, i = scanstring(text, i + 1)
+        except json.JSONDecodeError:
+            # the entry was cut off
+            break
+
+        files[key] = value
+        i = _skip_whitespace(text, i)
+        if i < len(text) and text[i] == ",":
+            i = _skip_whitespace(text, i + 1)
+    return files
+
+
+def _objects(body: str) -> list[dict]:
+    """
+    Every top-level object in text, a broken one is salvaged and ends it
+    """
+    decoder = json.JSONDecoder()
+    objects: list[dict] = []
+    i = body.find("{")
+    while i != -1:
+        try:
+            value, end = decoder.raw_decode(body, i)
+        except json.JSONDecodeError:
+            salvaged = _salvage(body[i:])
+            if salvaged:
+                objects.append(salvaged)
+                break
+            # braces in the text around the objects
+            i = body.find("{", i + 1)
+            continue
+
+        if isinstance(value, dict):
+            objects.append(value)
+        i = body.find("{", end)
+    return objects
+
+
+def _merge(objects: list[dict]) -> dict:
+    """
+    Entries of all objects, a path given different contents is dropped
+    """
+    merged: dict = {}
+    conflicting: set[str] = set()
+    for files in objects:
+        for path, content in files.items():
+            if path in merged and merged[path] != content:
+                conflicting.add(path)
+            merged.setdefault(path, content)
+    for path in conflicting:
+        del merged[path]
+    return merged
+
+
+def parse_response(
+    text: str, expected: list[str] | None = None
+) -> ParsedResponse:
+    """
+    Read the files of a model response, as much of them as possible
+
+    Well-formed responses are parsed by `json.loads` alone. Otherwise code
+    fences and text around the objects are dropped, and when an object is
+    still broken (e.g. the response was cut off) every complete entry
+    before the damage is kept. The files of several objects are merged, a
+    file they give different contents is lost. Entries whose content isn't
+    a string are reported as unexpected.
+
+    Params:
+        expected: list[str] - Paths that were sent, when given only these
+            are returned and the missing ones are reported as lost
+
+    Raises:
+        ValueError: when not a single entry could be read
+    """
+    parsed = ParsedResponse()
+
+    files = None
+    try:
+        files = json.loads(text)
+    except json.JSONDecodeError:
+        parsed.repaired = True
+
+    if not isinstance(files, dict):
+        parsed.repaired = True
+        body = _strip_fences(text)
+        if "{" not in body:
+            raise ValueError("The response contains no JSON object")
+        files = _merge(_objects(body))
+
+    for path, content in files.items():
+        if not isinstance(content, str) or (
+            expected is not None and path not in expected
+        ):
+            parsed.unexpected.append(path)
+            continue
+        parsed.files[path] = content
+
+    if expected is not None:
+        parsed.lost = [p for p in expected if p not in parsed.files]
+
+    if not parsed.files and (expected is None or expected):
+        raise ValueError("No file could be read from the response")
+    return parsed
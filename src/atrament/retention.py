@@ -0,0 +1,273 @@
+import asyncio
+import datetime
+import shutil
+from collections.abc import Callable
+from dataclasses import dataclass
+from pathlib import Path
+from sys import stderr
+from typing import Self
+
+from atrament import engine, jobs, settings, storage
+from atrament.const import USER_DATA_PATH
+
+PROJECTS_DIR: Path = USER_DATA_PATH / "projects"
+REPORTS_DIR: Path = USER_DATA_PATH / "reports"
+
+# Time between two collections and between checks whether jobs finished
+RETENTION_INTERVAL_SECONDS: float = 30 * 60
+IDLE_POLL_SECONDS: float = 5
+
+# Data of a project whose atrament.json is gone is kept this long, the
+# project might just live on a drive that isn't mounted right now
+ORPHAN_GRACE_DAYS: float = 7
+
+
+@dataclass(frozen=True)
+class RetentionPolicy:
+    keep_runs: int = 5
+    max_age_days: float = 30  # 0 keeps backups and reports forever
+    quota_mb: int = 2048  # 0 for no limit
+
+    @classmethod
+    def from_settings(cls) -> "RetentionPolicy":
+        return cls(
+            keep_runs=settings.service.current("Storage", "backup-keep-runs"),
+            max_age_days=settings.service.current(
+                "Storage", "backup-max-age-days"
+            ),
+            quota_mb=settings.service.current("Storage", "quota-mb"),
+        )
+
+
+@dataclass
+class RetentionReport:
+    runs_removed: int = 0
+    reports_removed: int = 0
+    projects_removed: int = 0
+    bytes_freed: int = 0
+
+    def __iadd__(self, other: "RetentionReport") -> Self:
+        self.runs_removed += other.runs_removed
+        self.reports_removed += other.reports_removed
+        self.projects_removed += other.projects_removed
+        self.bytes_freed += other.bytes_freed
+        return self
+
+    def describe(self) -> str:
+        return (
+            f"reclaimed {self.bytes_freed / 1024 / 1024:.1f} MB,"
+            f" {self.runs_removed} backup(s), {self.reports_removed} report(s)"
+            f" and {self.projects_removed} deleted project(s)"
+        )
+
+
+def _now() -> datetime.datetime:
+    return datetime.datetime.now(datetime.UTC)
+
+
+def _is_orphan(runs: list[storage.Manifest], now: datetime.datetime) -> bool:
+    if not runs or not runs[-1].project:
+        return False
+    if (Path(runs[-1].project) / engine.PROJECT_FILE_NAME).exists():
+        return False
+    grace = datetime.timedelta(days=ORPHAN_GRACE_DAYS)
+    return now - runs[-1].created_at > grace
+
+
+def _prune_reports(
+    report_dir: Path, cutoff: datetime.datetime | None, drop_all: bool
+) -> RetentionReport:
+    report = RetentionReport()
+    if not report_dir.exists():
+        return report
+
+    for path in report_dir.iterdir():
+        try:
+            stat = path.stat()
+            modified = datetime.datetime.fromtimestamp(
+                stat.st_mtime, datetime.UTC
+            )
+            if not drop_all and (cutoff is None or modified > cutoff):
+                continue
+            if path.is_dir():
+                report.bytes_freed += storage.dir_size(path)
+                shutil.rmtree(path)
+            else:
+                report.bytes_freed += stat.st_size
+                path.unlink()
+            report.reports_removed += 1
+        except OSError:
+            pass
+    return report
+
+
+def prune_project(
+    project_id: str,
+    policy: RetentionPolicy,
+    now: datetime.datetime | None = None,
+) -> RetentionReport:
+    """
+    Apply the count and age limits of `policy` to one project
+
+    Blobs of the dropped backups are only freed by `collect_garbage`.
+    """
+    now = now or _now()
+    report = RetentionReport()
+    backup_dir = PROJECTS_DIR / project_id
+    runs = storage.list_runs(backup_dir)
+
+    if _is_orphan(runs, now):
+        report.runs_removed += len(runs)
+        report.projects_removed += 1
+        report.bytes_freed += storage.forget_project(project_id)
+        return report
+
+    cutoff = None
+    if policy.max_age_days > 0:
+        cutoff = now - datetime.timedelta(days=policy.max_age_days)
+
+    dropped = storage.keep_latest_runs(backup_dir, policy.keep_runs)
+    if cutoff is not None:
+        for manifest in storage.list_runs(backup_dir):
+            if manifest.created_at < cutoff:
+                manifest.path.unlink(missing_ok=True)
+                dropped.append(manifest)
+    report.runs_removed += len(dropped)
+
+    # a report compares against a backup, without one it's stale
+    report += _prune_reports(
+        REPORTS_DIR / project_id,
+        cutoff,
+        drop_all=not storage.list_runs(backup_dir),
+    )
+    return report
+
+
+def enforce_quota(policy: RetentionPolicy) -> RetentionReport:
+    """
+    Drop the oldest backups until blobs and reports fit in the quota
+
+    Older backups of a project go before the latest one of any project.
+    """
+    report = RetentionReport()
+    if policy.quota_mb <= 0:
+        return report
+
+    quota = policy.quota_mb * 1024 * 1024
+    runs: list[tuple[bool, str, storage.Manifest]] = []
+    for backup_dir in PROJECTS_DIR.iterdir() if PROJECTS_DIR.exists() else []:
+        project_runs = storage.list_runs(backup_dir)
+        for i, manifest in enumerate(project_runs):
+            latest = i == len(project_runs) - 1
+            runs.append((latest, manifest.created, manifest))
+    runs.sort(key=lambda run: run[:2])
+
+    references: dict[str, int] = {}
+    for _, _, manifest in runs:
+        for digest in manifest.blobs():
+            references[digest] = references.get(digest, 0) + 1
+
+    total = storage.dir_size(storage.BLOBS_DIR) + storage.dir_size(REPORTS_DIR)
+    for _, _, manifest in runs:
+        if total <= quota:
+            break
+
+        manifest.path.unlink(missing_ok=True)
+        report.runs_removed += 1
+        for digest in manifest.blobs():
+            references[digest] -= 1
+            if references[digest] == 0:
+                path = storage.find_blob(digest)
+                try:
+                    if path is not None:
+                        total -= path.stat().st_size
+                except OSError:
+                    pass
+    return report
+
+
+class RetentionDaemon:
+    """
+    Applies the retention settings in the background
+
+    Projects are pruned one at a time in a worker thread and only while
+    no job runs, so a collection never competes with a run for the disk
+    or removes the backup a run is about to take.
+    """
+
+    def __init__(self, interval: float = RETENTION_INTERVAL_SECONDS):
+        self.interval = interval
+        self.last_report: RetentionReport | None = None
+        self._task: asyncio.Task[None] | None = None
+        self._lock = asyncio.Lock()
+        self._listeners: list[Callable[[RetentionReport], None]] = []
+
+    def subscribe(
+        self, listener: Callable[[RetentionReport], None]
+    ) -> Callable[[], None]:
+        """Register a listener and return a function that removes it"""
+        self._listeners.append(listener)
+
+        def unsubscribe() -> None:
+            if listener in self._listeners:
+                self._listeners.remove(listener)
+
+        return unsubscribe
+
+    async def start(self) -> None:
+        """Start collecting periodically, does nothing when running already"""
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run_forever())
+
+    def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+    async def _run_forever(self) -> None:
+        while True:
+            await asyncio.sleep(self.interval)
+            try:
+                await self.collect()
+            except Exception as e:
+                print(f"Storage cleanup failed: {e}", file=stderr)
+
+    @staticmethod
+    async def _wait_until_idle() -> None:
+        while any(not queued.finished for queued in jobs.queue.jobs()):
+            await asyncio.sleep(IDLE_POLL_SECONDS)
+
+    async def collect(
+        self, policy: RetentionPolicy | None = None
+    ) -> RetentionReport:
+        """Run one collection over every project and return what it freed"""
+        async with self._lock:
+            policy = policy or RetentionPolicy.from_settings()
+            report = RetentionReport()
+
+            project_ids = (
+                [p.name for p in PROJECTS_DIR.iterdir() if p.is_dir()]
+                if PROJECTS_DIR.exists()
+                else []
+            )
+            for project_id in project_ids:
+                await self._wait_until_idle()
+                report += await asyncio.to_thread(
+                    prune_project, project_id, policy
+                )
+
+            await self._wait_until_idle()
+            report += await asyncio.to_thread(enforce_quota, policy)
+            report.bytes_freed += await asyncio.to_thread(
+                storage.collect_garbage
+            )
+
+            self.last_report = report
+            if report.bytes_freed:
+                print(f"Storage cleanup {report.describe()}", file=stderr)
+            for listener in list(self._listeners):
+                listener(report)
+            return report
+
+
+daemon = RetentionDaemon()
@@ -4,10 +4,13 @@ from urllib.parse import unquote
 import flet as ft
 import platformdirs
 
+from atrament import retention, settings, view_cache
 from atrament.page_ref import get_page_ref, set_page_ref
 from atrament.sections.create_project import CreateProjectSection
+from atrament.sections.history import HistorySection
 from atrament.sections.home import HomeSection
 from atrament.sections.project import ProjectSection
+from atrament.sections.section import Section
 from atrament.sections.settings import SettingsSection
 
 MAX_HISTORY: int = 3
@@ -31,20 +34,38 @@ def change_section(section_path: str, outside_routing: bool = False) -> None:
             page_ref.update()
             return
 
-    if troute.match(HomeSection.route()):
-        page_ref.views.append(HomeSection().render())
-    elif troute.match(ProjectSection.route()):
-        encoded = getattr(troute, "encoded_path", "")
-        page_ref.views.append(ProjectSection(unquote(encoded)).render())
-    elif troute.match(CreateProjectSection.route()):
-        encoded = getattr(troute, "encoded_path", "")
-        page_ref.views.append(CreateProjectSection(unquote(encoded)).render())
-    elif troute.match(SettingsSection.route()):
-        page_ref.views.append(SettingsSection().render())
+    views = view_cache.for_page(page_ref)
+    cached = views.get(section_path)
+    if cached is not None:
+        # a view can only be shown once, move it to the top of the history
+        if cached in page_ref.views:
+            page_ref.views.remove(cached)
+        page_ref.views.append(cached)
     else:
-        page_ref.views.append(
-            ft.View(controls=[ft.Text("This URL dosent exist Error 404")])
-        )
+        section: Section | None = None
+        if troute.match(HomeSection.route()):
+            section = HomeSection()
+        elif troute.match(ProjectSection.route()):
+            encoded = getattr(troute, "encoded_path", "")
+            section = ProjectSection(unquote(encoded))
+        elif troute.match(CreateProjectSection.route()):
+            encoded = getattr(troute, "encoded_path", "")
+            section = CreateProjectSection(unquote(encoded))
+        elif troute.match(SettingsSection.route()):
+            section = SettingsSection()
+        elif troute.match(HistorySection.route()):
+            encoded = getattr(troute, "encoded_path", "")
+            section = HistorySection(unquote(encoded))
+
+        if section is not None:
+            view = section.render()
+            if section.cacheable:
+                views.put(section_path, view)
+        else:
+            view = ft.View(
+                controls=[ft.Text("This URL dosent exist Error 404")]
+            )
+        page_ref.views.append(view)
 
     while len(page_ref.views) > MAX_HISTORY:
         page_ref.views.pop(0)
@@ -68,11 +89,11 @@ def setup_user() -> None:
 def main(page: ft.Page):
     setup_user()
     set_page_ref(page)
-    
+
     page.window.min_height = 700
     page.window.min_width = 1000
     page.window.width = page.window.min_width
-    page.window.height = page.window.min_height 
+    page.window.height = page.window.min_height
 
     page.title = "Atrament"
 
@@ -84,6 +105,10 @@ def main(page: ft.Page):
     page.on_route_change = route_change
     change_section(page.route, True)
 
+    # limits and caches pick up the user's settings once they are read
+    page.run_task(settings.service.load)
+    page.run_task(retention.daemon.start)
+
 
 def run():
     ft.run(main)
@@ -1,10 +1,10 @@
 import datetime
 import json
 from pathlib import Path
-from urllib.parse import quote
 
 import flet as ft
 
+from atrament import engine, ui_scheduler, view_cache
 from atrament.const import PROJECT_TRACKER_FILE, PROJECT_TRACKER_LOCK
 from atrament.page_ref import get_page_ref
 from atrament.sections.section import Section
@@ -12,6 +12,8 @@ from atrament.sections.section import Section
 
 class CreateProjectSection(Section):
     _route: str = "/create_project/:encoded_path"
+    # a fresh form every time
+    cacheable = False
 
     def __init__(self, path_to_project: str):
         self.path_to_project = path_to_project
@@ -35,7 +37,7 @@ class CreateProjectSection(Section):
         name = self.name_field.value
         if not name:
             self.name_field.error = "Name is required"
-            self.name_field.update()
+            ui_scheduler.update(self.name_field)
             return
 
         # Sanitize name (simple CSV protection)
@@ -45,19 +47,9 @@ class CreateProjectSection(Section):
         project_dir = Path(self.path_to_project)
         project_dir.mkdir(parents=True, exist_ok=True)
 
-        project_data = {
-            "metadata": {
-                "name": name,
-                "description": self.description_field.value,
-            },
-            "workdata": {
-                "ai-configuration": {
-                    "prompt": "",
-                    "model": None,
-                },
-                "files": {"target-files": [], "source-files": []},
-            },
-        }
+        project_data = engine.default_project(project_dir)
+        project_data["metadata"]["name"] = name
+        project_data["metadata"]["description"] = self.description_field.value
 
         with open(project_dir / "atrament.json", "w", encoding="utf-8") as f:
             json.dump(project_data, f, indent=4)
@@ -74,8 +66,10 @@ class CreateProjectSection(Section):
             with open(PROJECT_TRACKER_FILE, "a", encoding="utf-8") as f:
                 f.write(entry)
 
+        # a project created over an old one must not show the old view
+        view_cache.invalidate(view_cache.project_route(self.path_to_project))
         await get_page_ref().push_route(
-            f"/project/{quote(self.path_to_project, safe='')}"
+            view_cache.project_route(self.path_to_project)
         )
 
     async def cancel(self, _):
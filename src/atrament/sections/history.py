@@ -0,0 +1,267 @@
+import asyncio
+import datetime
+from pathlib import Path
+from sys import stderr
+from typing import Any
+
+import flet as ft
+
+from atrament import engine, file_cache, jobs, storage, ui_scheduler, view_cache
+from atrament.page_ref import get_page_ref
+from atrament.sections.project import ProjectSection
+from atrament.sections.section import Section
+
+# Characters of the instructions shown in the title of a run
+INSTRUCTIONS_PREVIEW: int = 80
+
+
+def describe_stats(stats: dict[str, int]) -> str:
+    if not stats:
+        return "no requests"
+    return (
+        f"{stats.get('requests', 0)} request(s),"
+        f" {stats.get('input_tokens', 0)} input tokens,"
+        f" {stats.get('output_tokens', 0)} output tokens"
+    )
+
+
+@ft.control
+class HistoryLoader(ft.Column):
+    """Placeholder shown while the runs are being read"""
+
+    def __init__(self, section: "HistorySection", **kwargs: Any) -> None:
+        self.section = section
+        self._task: asyncio.Task[None] | None = None
+        super().__init__(**kwargs)
+
+    def init(self) -> None:
+        self.expand = True
+        self.alignment = ft.MainAxisAlignment.CENTER
+        self.horizontal_alignment = ft.CrossAxisAlignment.CENTER
+        self.controls = [ft.ProgressRing(), ft.Text("Loading history...")]
+
+    def did_mount(self) -> None:
+        self._task = asyncio.create_task(self.section.load())
+
+    def will_unmount(self) -> None:
+        # the runs of a view that was left don't need listing
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+
+class HistorySection(Section):
+    """
+    Past runs of a project, newest first
+
+    Every run can be restored as a whole or file by file. A restore backs
+    up the files it overwrites first, so it shows up here as well and can
+    be undone.
+    """
+
+    _route: str = "/history/:encoded_path"
+    # runs are added by every job and restore
+    cacheable = False
+
+    def __init__(self, path_to_project: str):
+        self.path_to_project = Path(path_to_project)
+        self.backup_dir = storage.backup_dir_for(self.path_to_project)
+        self.body = ft.Container(expand=True)
+
+    @staticmethod
+    def route() -> str:
+        return HistorySection._route
+
+    async def load(self) -> None:
+        """Read the runs in a worker thread and list them"""
+        try:
+            runs = await asyncio.to_thread(storage.list_runs, self.backup_dir)
+        except OSError as e:
+            print(f"Could not read the history: {e}", file=stderr)
+            self.body.content = ft.Text(
+                f"Could not read the history: {e}", color=ft.Colors.RED
+            )
+            ui_scheduler.update(self.body)
+            return
+
+        if not runs:
+            self.body.content = ft.Text("No runs were backed up yet")
+        else:
+            self.body.content = ft.ListView(
+                controls=[self.build_run(m) for m in reversed(runs)],
+                expand=True,
+            )
+        ui_scheduler.update(self.body)
+
+    def build_run(self, manifest: storage.Manifest) -> ft.Control:
+        created = f"{manifest.created_at.astimezone():%Y-%m-%d %H:%M:%S}"
+        instructions = manifest.instructions.strip().replace("\n", " ")
+        if len(instructions) > INSTRUCTIONS_PREVIEW:
+            instructions = instructions[:INSTRUCTIONS_PREVIEW] + "..."
+
+        match manifest.kind, manifest.status:
+            case "restore", _:
+                icon = ft.Icons.RESTORE
+            case _, "failed":
+                icon = ft.Icons.ERROR_OUTLINE
+            case _, "running":
+                icon = ft.Icons.HOURGLASS_EMPTY
+            case _:
+                icon = ft.Icons.CHECK_CIRCLE_OUTLINE
+
+        details = [manifest.model or manifest.kind, manifest.status]
+        if manifest.kind == "run":
+            details.append(describe_stats(manifest.stats))
+        details.append(f"{len(manifest.files)} file(s) backed up")
+
+        def describe_file(relative_path: str) -> str | None:
+            if relative_path in manifest.rejected:
+                return "changed by the run, rejected"
+            if relative_path in manifest.changed:
+                return "changed by the run"
+            return None
+
+        file_rows: list[ft.Control] = [
+            ft.ListTile(
+                title=relative_path,
+                subtitle=describe_file(relative_path),
+                trailing=ft.IconButton(
+                    icon=ft.Icons.RESTORE,
+                    tooltip="Restore this file",
+                    on_click=lambda e, p=relative_path: self.confirm_restore(
+                        manifest, [p]
+                    ),
+                ),
+            )
+            for relative_path in sorted(manifest.files)
+        ]
+
+        return ft.ExpansionTile(
+            title=f"{created}  {instructions}",
+            subtitle=" · ".join(details),
+            leading=icon,
+            controls=[
+                ft.Row(
+                    [
+                        ft.Button(
+                            "Restore all files",
+                            icon=ft.Icons.RESTORE,
+                            on_click=lambda e: self.confirm_restore(manifest),
+                        )
+                    ],
+                    alignment=ft.MainAxisAlignment.END,
+                ),
+                *file_rows,
+            ],
+        )
+
+    def confirm_restore(
+        self, manifest: storage.Manifest, files: list[str] | None = None
+    ) -> None:
+        if jobs.queue.active_for(self.path_to_project) is not None:
+            self.show_message("Wait for the running job to finish")
+            return
+
+        what = files[0] if files and len(files) == 1 else "all files"
+
+        async def perform_restore(_: Any) -> None:
+            get_page_ref().pop_dialog()
+            await self.restore(manifest, files)
+
+        get_page_ref().show_dialog(
+            ft.AlertDialog(
+                title="Confirm Restore",
+                content=ft.Text(
+                    f"Restore {what} to the state before the run of"
+                    f" {manifest.created_at.astimezone():%Y-%m-%d %H:%M}?"
+                    " The current contents are backed up first."
+                ),
+                actions=[
+                    ft.TextButton("Restore", on_click=perform_restore),
+                    ft.TextButton(
+                        "Cancel",
+                        on_click=lambda _: get_page_ref().pop_dialog(),
+                    ),
+                ],
+            )
+        )
+
+    async def restore(
+        self, manifest: storage.Manifest, files: list[str] | None = None
+    ) -> None:
+        started = datetime.datetime.now()
+        try:
+            await engine.restore_run(
+                self.path_to_project,
+                self.backup_dir,
+                manifest,
+                files,
+                storage.checkpoint_path_for(self.path_to_project),
+                file_cache.for_project(self.path_to_project),
+            )
+        except Exception as e:
+            print(f"Restore failed: {e}", file=stderr)
+            self.show_message(f"Restore failed: {e}")
+            return
+
+        # the project view shows whether a rollback is available
+        view_cache.invalidate(
+            view_cache.project_route(str(self.path_to_project))
+        )
+
+        elapsed = (datetime.datetime.now() - started).total_seconds()
+        count = len(files) if files is not None else len(manifest.files)
+        self.show_message(f"Restored {count} file(s) in {elapsed:.1f}s")
+        await self.load()
+
+    @staticmethod
+    def show_message(message: str) -> None:
+        get_page_ref().show_dialog(ft.SnackBar(ft.Text(message)))
+
+    async def go_back(self, _: Any) -> None:
+        page = get_page_ref()
+        page.views.pop()
+
+        # the project view below is shown again, unless a restore made it
+        # stale, then it's rendered again in its place
+        route = view_cache.project_route(str(self.path_to_project))
+        if (
+            page.views
+            and page.views[-1].route == ProjectSection.route()
+            and route not in view_cache.for_page(page)
+        ):
+            page.views.pop()
+        await page.push_route(route)
+
+    def render(self) -> ft.View:
+        self.body.content = HistoryLoader(self)
+
+        return ft.View(
+            route=self._route,
+            controls=[
+                ft.Container(
+                    content=ft.Column(
+                        [
+                            ft.Row(
+                                [
+                                    ft.IconButton(
+                                        icon=ft.Icons.ARROW_BACK,
+                                        on_click=self.go_back,
+                                    ),
+                                    ft.Text(
+                                        f"History: {self.path_to_project.name}",
+                                        size=30,
+                                        weight=ft.FontWeight.BOLD,
+                                    ),
+                                ]
+                            ),
+                            ft.Divider(),
+                            self.body,
+                        ],
+                        expand=True,
+                    ),
+                    padding=20,
+                    expand=True,
+                )
+            ],
+        )
@@ -2,15 +2,25 @@ import asyncio
 import difflib
 import json
 import os
+import shutil
 import webbrowser
+from dataclasses import dataclass
 from enum import Enum
 from pathlib import Path
+from sys import stderr
 
-import aiofiles
 import flet as ft
 
-from atrament import ai
-from atrament.const import USER_DATA_PATH
+from atrament import (
+    ai,
+    engine,
+    file_cache,
+    jobs,
+    storage,
+    ui_scheduler,
+    view_cache,
+    watcher,
+)
 from atrament.page_ref import get_page_ref
 from atrament.sections.section import Section
 
@@ -20,6 +30,11 @@ def save_project_data(data: dict, project_file: Path) -> None:
         json.dump(data, f, indent=2)
 
 
+def missing_files(paths: list[str]) -> set[str]:
+    """Files of `paths` deleted or moved outside of the app, blocking"""
+    return {p for p in paths if not os.path.isfile(p)}
+
+
 @ft.control
 class ProjectHeader(ft.Row):
     project_name: str = ""
@@ -77,6 +92,7 @@ class ProjectConfiguration(ft.Column):
     def __init__(self, project_path: Path, project_data: dict = {}, **kwargs):
         self.project_path = project_path
         self.project_data = project_data
+        self._models_task: asyncio.Task | None = None
         super().__init__(**kwargs)
 
     def on_prompt_change(self, e):
@@ -87,6 +103,32 @@ class ProjectConfiguration(ft.Column):
             self.project_data, self.project_path / "atrament.json"
         )
 
+    def on_budget_change(self, e):
+        value = (e.control.value or "").strip()
+        if value and not value.isdigit():
+            e.control.error = "Must be a whole number"
+            ui_scheduler.update(e.control)
+            return
+
+        if e.control.error:
+            e.control.error = None
+            ui_scheduler.update(e.control)
+
+        self.project_data["workdata"]["ai-configuration"][
+            "source-token-budget"
+        ] = int(value) if value else None
+        save_project_data(
+            self.project_data, self.project_path / "atrament.json"
+        )
+
+    def on_incremental_change(self, e):
+        self.project_data["workdata"]["ai-configuration"]["incremental"] = bool(
+            e.control.value
+        )
+        save_project_data(
+            self.project_data, self.project_path / "atrament.json"
+        )
+
     def on_model_select(self, e):
         self.project_data["workdata"]["ai-configuration"]["model"] = (
             e.control.value
@@ -119,13 +161,50 @@ class ProjectConfiguration(ft.Column):
             on_select=self.on_model_select,
         )
 
+        # Empty sends every source file in full
+        budget = self.project_data["workdata"]["ai-configuration"].get(
+            "source-token-budget"
+        )
+        self.budget_field = ft.TextField(
+            label="Source token budget",
+            hint_text="All source files",
+            value=str(budget) if budget is not None else "",
+            keyboard_type=ft.KeyboardType.NUMBER,
+            border_color=ft.Colors.BLUE_200,
+            width=200,
+            on_change=self.on_budget_change,
+        )
+
+        # Skips the target files earlier runs already produced output for
+        self.incremental_switch = ft.Switch(
+            label="Only changed files",
+            value=self.project_data["workdata"]["ai-configuration"].get(
+                "incremental", False
+            ),
+            tooltip="Send only target files whose content, instructions or"
+            " sources changed since they were last processed, and flagged"
+            " files",
+            on_change=self.on_incremental_change,
+        )
+
         self.controls = [
             ft.Text("Configuration", size=18, weight=ft.FontWeight.BOLD),
             self.instruction_field,
-            self.model_dropdown,
+            ft.Row(
+                [
+                    self.model_dropdown,
+                    self.budget_field,
+                    self.incremental_switch,
+                ]
+            ),
         ]
 
     def did_mount(self):
+        # a cached view is mounted again on every visit, the models only
+        # have to be fetched once
+        if self.model_dropdown.options:
+            return
+
         # Load models asynchronously after component is mounted
         async def load_models():
             models = await ai.get_models()
@@ -140,10 +219,16 @@ class ProjectConfiguration(ft.Column):
                 )
             )
             self.model_dropdown.options = options
-            self.model_dropdown.update()
+            ui_scheduler.update(self.model_dropdown)
 
         # Create task to run async function
-        asyncio.create_task(load_models())
+        self._models_task = asyncio.create_task(load_models())
+
+    def will_unmount(self):
+        # fetched again on the next visit, the options are still empty
+        if self._models_task is not None:
+            self._models_task.cancel()
+            self._models_task = None
 
 
 class FileType(Enum):
@@ -169,6 +254,9 @@ class FileList(ft.Column):
 
         self.title = kwargs.pop("title", "")
         self.initial_directory = kwargs.pop("initial_directory", "")
+        self.missing: set[str] | None = kwargs.pop("missing", None)
+        # target files sent by the next run even when unchanged
+        self.flagged: set[str] = set()
 
         super().__init__(**kwargs)
 
@@ -177,6 +265,14 @@ class FileList(ft.Column):
         self.files: list[str] = self.project_data["workdata"]["files"][
             self.filetype.value
         ]
+        # files deleted or moved outside of the app, usually checked by
+        # the project loader off the UI thread
+        if self.missing is None:
+            self.missing = missing_files(self.files)
+        else:
+            self.missing = self.missing & set(self.files)
+        self._stop_watching = None
+        self._task: asyncio.Task | None = None
 
         self.file_list_view = ft.ListView(
             expand=True, spacing=5, padding=5, height=140
@@ -215,6 +311,46 @@ class FileList(ft.Column):
 
     def did_mount(self):
         self.update_list()
+        self._task = asyncio.create_task(self.watch_files())
+
+    async def watch_files(self):
+        """Check the files again and subscribe to their changes"""
+        # nothing watched the files while the list wasn't mounted, they may
+        # have been deleted or restored in the meantime
+        missing = await asyncio.to_thread(missing_files, list(self.files))
+        self._stop_watching = watcher.watch(
+            self.project_path, self.on_files_changed, self.files
+        )
+        if missing != self.missing:
+            self.missing = missing
+            self.update_list()
+
+    def will_unmount(self):
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+        if self._stop_watching is not None:
+            self._stop_watching()
+            self._stop_watching = None
+
+    def on_files_changed(self, changes: watcher.Changes):
+        cache = file_cache.for_project(self.project_path)
+
+        relevant = False
+        for p in self.files:
+            event = changes.get(os.path.abspath(p))
+            if event is None:
+                continue
+
+            relevant = True
+            cache.invalidate(p)
+            if event is watcher.FileEvent.Deleted:
+                self.missing.add(p)
+            else:
+                self.missing.discard(p)
+
+        if relevant:
+            self.update_list()
 
     async def pick_files(self, _):
         result = await ft.FilePicker().pick_files(
@@ -241,11 +377,14 @@ class FileList(ft.Column):
 
             if f.path not in self.files:
                 self.files.append(f.path)
+                watcher.track(self.project_path, [f.path])
+            self.missing.discard(f.path)
             self.update_list()
 
     def remove_file(self, file_path: str):
         if file_path in self.files:
             self.files.remove(file_path)
+            self.missing.discard(file_path)
             self.update_list()
 
     def _make_delete_handler(self, file_path: str):
@@ -254,6 +393,22 @@ class FileList(ft.Column):
 
         return handler
 
+    def _make_flag_handler(self, file_path: str):
+        def handler(e):
+            if file_path in self.flagged:
+                self.flagged.discard(file_path)
+            else:
+                self.flagged.add(file_path)
+            self.update_list()
+
+        return handler
+
+    def clear_flags(self):
+        if self.flagged:
+            self.flagged.clear()
+            self.update_list()
+
+    @ui_scheduler.measured("file list")
     def update_list(self, _=None):
         search_filter = (self.search_field.value or "").lower()
         self.file_list_view.controls = []
@@ -266,14 +421,41 @@ class FileList(ft.Column):
             if len(file_name) > 25:
                 file_name = file_name[:22] + "..."
 
+            is_missing = p in self.missing
             row = ft.Row(
                 controls=[
-                    ft.Text(file_name, size=16, margin=ft.Margin.only(left=10)),
-                    ft.IconButton(
-                        ft.Icons.DELETE,
-                        icon_color=ft.Colors.RED,
-                        on_click=self._make_delete_handler(str(p)),
-                        margin=ft.Margin.only(right=10),
+                    ft.Text(
+                        file_name,
+                        size=16,
+                        margin=ft.Margin.only(left=10),
+                        color=ft.Colors.RED if is_missing else None,
+                        style=ft.TextStyle(
+                            decoration=ft.TextDecoration.LINE_THROUGH
+                        )
+                        if is_missing
+                        else None,
+                        tooltip="File is missing" if is_missing else None,
+                    ),
+                    ft.Row(
+                        [
+                            ft.IconButton(
+                                ft.Icons.FLAG
+                                if p in self.flagged
+                                else ft.Icons.OUTLINED_FLAG,
+                                icon_color=ft.Colors.ORANGE,
+                                tooltip="Send on the next run even if"
+                                " unchanged",
+                                on_click=self._make_flag_handler(str(p)),
+                                visible=self.filetype is FileType.Target,
+                            ),
+                            ft.IconButton(
+                                ft.Icons.DELETE,
+                                icon_color=ft.Colors.RED,
+                                on_click=self._make_delete_handler(str(p)),
+                                margin=ft.Margin.only(right=10),
+                            ),
+                        ],
+                        spacing=0,
                     ),
                 ],
                 alignment=ft.MainAxisAlignment.SPACE_BETWEEN,
@@ -288,7 +470,200 @@ class FileList(ft.Column):
                 self.project_data, self.project_path / "atrament.json"
             )
 
-        self.file_list_view.update()
+        ui_scheduler.update(self.file_list_view)
+
+
+@ft.control
+class ProjectActions(ft.Column):
+    """Rollback and process buttons reflecting the project's queued job"""
+
+    def __init__(
+        self,
+        project_path: Path,
+        on_process=None,
+        on_rollback=None,
+        on_history=None,
+        has_backup: bool = False,
+        **kwargs,
+    ):
+        self.project_path = project_path
+        self.on_process = on_process
+        self.on_rollback = on_rollback
+        self.on_history = on_history
+        self.has_backup = has_backup
+        self._mounted = False
+        self._unsubscribe = None
+        # status the process button shows, progress within it isn't shown
+        self._shown_status: jobs.JobStatus | None = None
+        super().__init__(**kwargs)
+
+    def init(self):
+        self.process_button = ft.Button(
+            "Process Files",
+            icon=ft.Icons.PLAY_ARROW,
+            bgcolor=ft.Colors.BLUE,
+            color=ft.Colors.WHITE,
+            height=50,
+            on_click=self.on_process,
+        )
+
+        self.rollback_button = ft.Button(
+            "Rollback",
+            icon=ft.Icons.BACKUP,
+            color=ft.Colors.WHITE,
+            height=50,
+            on_click=self.on_rollback,
+        )
+        self.set_rollback_available(self.has_backup)
+
+        self.history_button = ft.TextButton(
+            "History",
+            icon=ft.Icons.HISTORY,
+            on_click=self.on_history,
+        )
+
+        self.controls = [
+            ft.Container(
+                content=self.history_button,
+                padding=ft.Padding.only(left=20),
+                alignment=ft.Alignment.CENTER,
+            ),
+            ft.Container(
+                content=self.rollback_button,
+                padding=ft.Padding.only(left=20),
+                alignment=ft.Alignment.CENTER,
+            ),
+            ft.Container(
+                content=self.process_button,
+                padding=ft.Padding.only(left=20),
+                alignment=ft.Alignment.CENTER,
+            ),
+        ]
+
+    def did_mount(self):
+        self._mounted = True
+        self._unsubscribe = jobs.queue.subscribe(self.on_job_update)
+
+        # a job might have been started before we navigated here
+        active = jobs.queue.active_for(self.project_path)
+        if active is not None:
+            self.on_job_update(active)
+
+    def will_unmount(self):
+        self._mounted = False
+        if self._unsubscribe is not None:
+            self._unsubscribe()
+            self._unsubscribe = None
+
+    def refresh(self):
+        if self._mounted:
+            ui_scheduler.update(self)
+
+    def set_rollback_available(self, available: bool):
+        self.rollback_button.disabled = not available
+        self.rollback_button.bgcolor = (
+            ft.Colors.RED
+            if available
+            else ft.Colors.with_opacity(0.5, ft.Colors.RED)
+        )
+
+    def reset_process_button(self):
+        self.process_button.content = "Process Files"
+        self.process_button.bgcolor = ft.Colors.BLUE
+        self.process_button.disabled = False
+
+    def on_job_update(self, queued: jobs.QueuedJob):
+        if (
+            queued.job.project_path != self.project_path
+            or queued.status is self._shown_status
+        ):
+            return
+        self._shown_status = queued.status
+
+        match queued.status:
+            case jobs.JobStatus.Queued:
+                self.process_button.content = "Queued..."
+                self.process_button.bgcolor = ft.Colors.ORANGE
+                self.process_button.disabled = True
+            case jobs.JobStatus.Running:
+                self.process_button.content = "Processing..."
+                self.process_button.bgcolor = ft.Colors.ORANGE
+                self.process_button.disabled = True
+            case jobs.JobStatus.Done:
+                self.process_button.content = "Done!"
+                self.process_button.bgcolor = ft.Colors.GREEN
+                self.process_button.disabled = False
+                # Enable rollback button after processing
+                self.set_rollback_available(True)
+            case jobs.JobStatus.Failed:
+                self.reset_process_button()
+
+        self.refresh()
+
+
+@dataclass
+class LoadedProject:
+    data: dict
+    missing: set[str]
+    has_backup: bool
+    # why the project file couldn't be used, defaults are shown then
+    warning: str | None = None
+
+
+def load_project_state(project_path: Path) -> LoadedProject:
+    """
+    Everything the project view needs from disk, blocking
+
+    A missing or unreadable project file falls back to the defaults.
+    """
+    warning = None
+    try:
+        data = engine.load_project(project_path)
+    except FileNotFoundError:
+        data = engine.default_project(project_path)
+        warning = (
+            f"{engine.PROJECT_FILE_NAME} was not found, it will be created."
+        )
+    except (OSError, ValueError) as e:
+        data = engine.default_project(project_path)
+        warning = (
+            f"{engine.PROJECT_FILE_NAME} could not be read ({e}), showing an"
+            " empty project. Changing it overwrites the file."
+        )
+
+    files = data["workdata"]["files"]
+    missing = missing_files(files["target-files"] + files["source-files"])
+    storage.adopt_legacy_data(project_path, data["metadata"]["name"])
+    has_backup = engine.has_backup(engine.backup_dir_for(project_path))
+    return LoadedProject(data, missing, has_backup, warning)
+
+
+@ft.control
+class ProjectSkeleton(ft.Column):
+    """Placeholder shown while the project is being loaded"""
+
+    def __init__(self, section: "ProjectSection", **kwargs):
+        self.section = section
+        self._task: asyncio.Task | None = None
+        super().__init__(**kwargs)
+
+    def init(self):
+        self.expand = True
+        self.alignment = ft.MainAxisAlignment.CENTER
+        self.horizontal_alignment = ft.CrossAxisAlignment.CENTER
+        self.controls = [
+            ft.ProgressRing(),
+            ft.Text(f"Loading {self.section.project_name}..."),
+        ]
+
+    def did_mount(self):
+        self._task = asyncio.create_task(self.section.load())
+
+    def will_unmount(self):
+        # a view left while loading loads again when it's shown next
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
 
 
 class ProjectSection(Section):
@@ -298,18 +673,25 @@ class ProjectSection(Section):
         self.path_to_project = Path(path_to_project)
         self.project_name = self.path_to_project.name
         self.project_data: dict = {}
+        self.body = ft.Container(padding=20, expand=True)
 
-        # Try to load project name from atrament.json
+    async def load(self):
+        """Read the project in a worker thread and show it"""
         try:
-            config_path = self.path_to_project / "atrament.json"
-            if config_path.exists():
-                with open(config_path, "r") as f:
-                    data = json.load(f)
-                    self.project_data = data
-                    if "metadata" in data and "name" in data["metadata"]:
-                        self.project_name = data["metadata"]["name"]
-        except Exception:
-            pass
+            loaded = await asyncio.to_thread(
+                load_project_state, self.path_to_project
+            )
+        except Exception as e:
+            print(f"Could not load {self.path_to_project}: {e}", file=stderr)
+            self.body.content = ft.Text(
+                f"Could not load the project: {e}", color=ft.Colors.RED
+            )
+            ui_scheduler.update(self.body)
+            return
+
+        self.project_data = loaded.data
+        self.project_name = loaded.data["metadata"]["name"]
+
         # Components
         self.header = ProjectHeader(
             self.path_to_project,
@@ -325,6 +707,7 @@ class ProjectSection(Section):
             project_data=self.project_data,
             title="Files to Edit",
             initial_directory=str(self.path_to_project),
+            missing=loaded.missing,
         )
         self.source_files = FileList(
             FileType.Source,
@@ -332,138 +715,84 @@ class ProjectSection(Section):
             project_data=self.project_data,
             title="Source Files",
             initial_directory=str(self.path_to_project),
+            missing=loaded.missing,
+        )
+        self.actions = ProjectActions(
+            self.path_to_project,
+            on_process=self.process_files,
+            on_rollback=self.rollback_files,
+            on_history=self.open_history,
+            has_backup=loaded.has_backup,
         )
 
+        controls: list[ft.Control] = [self.header, ft.Divider()]
+        if loaded.warning is not None:
+            controls.append(ft.Text(loaded.warning, color=ft.Colors.ORANGE))
+        controls += [
+            # Config & Process
+            ft.Row(
+                [
+                    self.config,
+                    self.actions,
+                ],
+                vertical_alignment=ft.CrossAxisAlignment.END,
+            ),
+            ft.Divider(),
+            # Files
+            ft.Row(
+                controls=[
+                    self.target_files,
+                    self.source_files,
+                ],
+                expand=True,
+            ),
+        ]
+
+        self.body.content = ft.Column(controls=controls, expand=True)
+        ui_scheduler.update(self.body)
+
     @staticmethod
     def route() -> str:
         return ProjectSection._route
 
-    async def load_files_content(self, file_paths: list[str]) -> dict[str, str]:
-        result = {}
-
-        for p in file_paths:
-            async with aiofiles.open(p, mode="r") as f:
-                content = await f.read()
-                result[p] = content
-
-        return result
-
-    async def backup_files(self, files: dict[str, str]) -> None:
-        backup_dir_path = USER_DATA_PATH / "projects" / self.project_name
-
-        # Clear the backup directory if it exists
-        if backup_dir_path.exists():
-            import shutil
-
-            shutil.rmtree(backup_dir_path)
-        backup_dir_path.mkdir(parents=True, exist_ok=True)
-
-        async def backup_file(p: str, content: str) -> None:
-            relative_file_path = Path(p).relative_to(self.path_to_project)
-            backup_file_path = backup_dir_path / relative_file_path
-
-            backup_file_path.parent.mkdir(parents=True, exist_ok=True)
-            async with aiofiles.open(backup_file_path, mode="w") as f:
-                await f.write(content)
-
-        tasks = [backup_file(p, content) for p, content in files.items()]
-        await asyncio.gather(*tasks)
-
-    async def prompt_ai(
-        self, target_files: dict[str, str], source_files: dict[str, str]
-    ) -> str:
-        prompt = f"""You are an AI assistant that modifies files based on user instructions.
-
-        INPUT STRUCTURE:
-        - target_files: Files to be edited (provided as JSON)
-        - source_files: Reference files that may contain relevant information (provided as JSON)
-        - user_instructions: Specific editing instructions to apply
-
-        USER INSTRUCTIONS:
-        {self.config.instruction_field.value}
-
-        TARGET FILES:
-        {json.dumps(target_files, indent=2)}
-
-        SOURCE FILES:
-        {json.dumps(source_files, indent=2)}
-
-        OUTPUT REQUIREMENTS:
-        Return ONLY a valid JSON object with the same structure as target_files, containing the updated file contents.
-        - Use proper JSON formatting with correctly escaped newlines (use \\n for line breaks, not literal backslash-n)
-        - When the JSON is parsed by Python's json.loads(), the \\n sequences should become actual newline characters
-        - Do not double-escape newlines (do not use \\\\n)
-        - Do not include any explanations, greetings, or additional text outside the JSON
-        - The response must be valid JSON that can be parsed directly
-
-        Example: {{"file.txt": "first line\\nsecond line\\nthird line"}} will correctly produce newlines when parsed."""
-
-        model_selection = (
-            self.config.model_dropdown.value
-        )  # format of this is "{AiCompany.value}:{model}"
-        if model_selection is None:
-            self.config.model_dropdown.error_text = "You need to select a model"
-            raise ValueError("You need to select a model")
-
-        company, model = model_selection.split(":")
-        company = ai.AiCompany(int(company))
-
-        try:
-            return await ai.client.prompt(company, prompt, model)
-        except Exception as e:
-            raise e
-
-    async def apply_response(self, response: str) -> None:
-        output_files = json.loads(response)
-
-        async def save_file(file_path: str, contents: str) -> None:
-            async with aiofiles.open(file_path, "w") as file:
-                await file.write(contents)
-
-        tasks = [
-            save_file(file_path, content)
-            for file_path, content in output_files.items()
-        ]
-        await asyncio.gather(*tasks)
-
     async def see_change_report(self, _) -> None:
-        backup_dir_path = USER_DATA_PATH / "projects" / self.project_name
-        report_dir = USER_DATA_PATH / "reports" / self.project_name
+        report_dir = engine.report_dir_for(self.path_to_project)
+        cache = file_cache.for_project(self.path_to_project)
 
-        # Create reports directory
-        os.makedirs(report_dir, exist_ok=True)
+        # Reports are regenerated from scratch, possibly with another codec
+        await asyncio.to_thread(shutil.rmtree, report_dir, ignore_errors=True)
+        await asyncio.to_thread(os.makedirs, report_dir, exist_ok=True)
 
         new_file_paths = self.target_files.files
-        backup_file_paths = list(
-            map(
-                lambda x: str(
-                    backup_dir_path / Path(x).relative_to(self.path_to_project)
-                ),
-                self.target_files.files,
-            )
+        backed_up = await asyncio.to_thread(
+            engine.backed_up_digests,
+            self.path_to_project,
+            engine.backup_dir_for(self.path_to_project),
+            new_file_paths,
         )
+        backup_digests = [backed_up[p] for p in new_file_paths]
 
         # Generate diff reports
         differ = difflib.HtmlDiff()
         diff_files = []
 
-        for idx, (new_file_path, old_file_path) in enumerate(
-            zip(new_file_paths, backup_file_paths)
+        for idx, (new_file_path, old_digest) in enumerate(
+            zip(new_file_paths, backup_digests)
         ):
-            # Read file contents
+            # Read file contents, the new ones are usually still cached
             try:
-                async with aiofiles.open(
-                    old_file_path, "r", encoding="utf-8"
-                ) as f:
-                    old_lines = await f.readlines()
+                if old_digest is None:
+                    raise FileNotFoundError(new_file_path)
+                old_lines = (
+                    await asyncio.to_thread(storage.read_blob, old_digest)
+                ).splitlines(keepends=True)
             except Exception:
                 old_lines = ["(File did not exist in backup)\n"]
 
             try:
-                async with aiofiles.open(
-                    new_file_path, "r", encoding="utf-8"
-                ) as f:
-                    new_lines = await f.readlines()
+                new_lines = (await cache.read(new_file_path)).splitlines(
+                    keepends=True
+                )
             except Exception:
                 new_lines = ["(File does not exist)\n"]
 
@@ -477,12 +806,11 @@ class ProjectSection(Section):
                 numlines=3,
             )
 
-            # Save individual diff file
+            # Save individual diff file, HtmlDiff output compresses well
             diff_filename = f"diff_{idx}_{Path(new_file_path).stem}.html"
-            diff_path = report_dir / diff_filename
-
-            with open(diff_path, "w", encoding="utf-8") as f:
-                f.write(diff_html)
+            await asyncio.to_thread(
+                storage.write_compressed, report_dir / diff_filename, diff_html
+            )
 
             diff_files.append((Path(new_file_path).name, diff_filename))
 
@@ -517,65 +845,211 @@ class ProjectSection(Section):
         index_html.extend(["</ul>", "</body></html>"])
 
         # Write index file
-        index_path = report_dir / "index.html"
-        with open(index_path, "w", encoding="utf-8") as f:
-            f.write("\n".join(index_html))
+        await asyncio.to_thread(
+            storage.write_compressed,
+            report_dir / "index.html",
+            "\n".join(index_html),
+        )
+
+        # Open the decompressed copy in the browser
+        view_dir = await asyncio.to_thread(storage.extract_reports, report_dir)
+        webbrowser.open(f"file://{os.path.abspath(view_dir / 'index.html')}")
 
-        # Open in browser
-        webbrowser.open(f"file://{os.path.abspath(index_path)}")
+    def show_error(self, title: str, error: Exception) -> None:
+        get_page_ref().show_dialog(
+            ft.AlertDialog(
+                title=title,
+                content=ft.Text(f"error: {error}"),
+                actions=[
+                    ft.TextButton(
+                        "Dismiss",
+                        on_click=lambda _: get_page_ref().pop_dialog(),
+                    )
+                ],
+            )
+        )
 
-    async def process_files(self, e):
-        # Placeholder logic
-        e.control.content = "Processing..."
-        e.control.bgcolor = ft.Colors.ORANGE
-        e.control.update()
+    @ui_scheduler.measured("process files")
+    async def process_files(self, e, only: list[str] | None = None):
+        """
+        Params:
+            only: list[str] - Target files to send, all of them when None
+        """
+        if self.config.model_dropdown.value is None:
+            self.config.model_dropdown.error_text = "You need to select a model"
+            ui_scheduler.update(self.config.model_dropdown)
+            return
 
-        # ----- FUNCTION LIST ----- #
-        # load content's of target and source files
-        # make a backup at a specific location
-        # make a prompt to LLM with our request
-        # parse a response for new file content's
-        # push a popup that transition's the user to a window where they can view the changes
+        missing = self.target_files.missing | self.source_files.missing
+        if missing:
+            self.show_error(
+                "Missing files",
+                FileNotFoundError(
+                    "Remove or restore these files first: "
+                    + ", ".join(sorted(missing))
+                ),
+            )
+            return
 
-        target_files = await self.load_files_content(self.target_files.files)
-        source_files = await self.load_files_content(self.source_files.files)
+        try:
+            job = engine.Job.from_project_data(
+                self.path_to_project,
+                self.project_data,
+                instructions=self.config.instruction_field.value or "",
+                model_selection=self.config.model_dropdown.value,
+            )
+        except ValueError as error:
+            self.show_error("Invalid configuration", error)
+            return
+        if only is not None:
+            job.target_files = only
+        job.flagged = list(self.target_files.flagged)
 
-        await self.backup_files(target_files)
+        try:
+            queued = jobs.queue.submit(job)
+        except RuntimeError as error:
+            self.show_error("Project is busy", error)
+            return
 
         try:
-            response = await self.prompt_ai(target_files, source_files)
-        except Exception as e:
-            get_page_ref().show_dialog(
-                ft.AlertDialog(
-                    title="Fetching Response problem",
-                    content=ft.Text(f"error: {e}"),
-                    actions=[
-                        ft.TextButton(
-                            "Dismiss",
-                            on_click=lambda _: get_page_ref().pop_dialog(),
-                        )
-                    ],
+            result = await queued.wait()
+        except Exception as error:
+            match queued.stage:
+                case engine.Stage.Prompt:
+                    self.show_error("Fetching Response problem", error)
+                case None:
+                    self.show_error("Processing problem", error)
+                case stage:
+                    self.show_error(f"Problem during {stage.value}", error)
+            return
+
+        self.target_files.clear_flags()
+        self.show_change_summary(
+            result.manifest,
+            "Job done",
+            [
+                ft.Text(
+                    "The task is done you can check the change report."
+                    + (
+                        f" {len(result.skipped_files)} file(s) were"
+                        " already applied by a previous attempt and"
+                        " were skipped."
+                        if result.skipped_files
+                        else ""
+                    )
+                    + (
+                        f" {len(result.up_to_date_files)} file(s) were"
+                        " unchanged since they were last processed."
+                        if result.up_to_date_files
+                        else ""
+                    )
+                    + (
+                        f" {len(result.reused_files)} file(s) got the"
+                        " output of an earlier run without a request."
+                        if result.reused_files
+                        else ""
+                    )
+                ),
+                ft.Text(
+                    result.stats.describe(),
+                    size=12,
+                    color=ft.Colors.GREY,
+                ),
+            ],
+        )
+
+        await asyncio.sleep(0.5)
+
+        self.actions.reset_process_button()
+        self.actions.refresh()
+
+    def show_change_summary(
+        self,
+        manifest: storage.Manifest | None,
+        title: str,
+        intro: list[ft.Control],
+    ) -> None:
+        """Files a run changed, the ones the user unchecks are rolled back"""
+        changed = (
+            [
+                p
+                for p in manifest.changed
+                if p in manifest.files and p not in manifest.rejected
+            ]
+            if manifest is not None
+            else []
+        )
+        checkboxes = {p: ft.Checkbox(label=p, value=True) for p in changed}
+
+        async def keep_checked(_):
+            get_page_ref().pop_dialog()
+            rejected = [p for p, box in checkboxes.items() if not box.value]
+            if manifest is None or not rejected:
+                return
+
+            try:
+                await engine.reject_files(
+                    self.path_to_project,
+                    manifest,
+                    rejected,
+                    file_cache.for_project(self.path_to_project),
                 )
+            except Exception as error:
+                self.show_error("Rollback failed", error)
+                return
+            self.show_rejected(rejected)
+
+        content: list[ft.Control] = list(intro)
+        actions: list[ft.Control] = [
+            ft.TextButton("Check Report", on_click=self.see_change_report)
+        ]
+        if checkboxes:
+            content += [
+                ft.Text(
+                    "Uncheck the files to roll back:",
+                    weight=ft.FontWeight.BOLD,
+                ),
+                ft.Column(
+                    list(checkboxes.values()),
+                    scroll=ft.ScrollMode.AUTO,
+                    height=min(40 * len(checkboxes), 300),
+                ),
+            ]
+            actions.append(
+                ft.TextButton("Keep Checked Files", on_click=keep_checked)
             )
+        actions.append(
+            ft.TextButton(
+                "Dismiss", on_click=lambda _: get_page_ref().pop_dialog()
+            )
+        )
 
-            return
+        get_page_ref().show_dialog(
+            ft.AlertDialog(
+                title=title,
+                content=ft.Column(content, tight=True),
+                actions=actions,
+            )
+        )
 
-        await self.apply_response(response)
+    def show_rejected(self, rejected: list[str]) -> None:
+        """Offer to send only the rolled back files again"""
 
-        e.control.content = "Done!"
-        e.control.bgcolor = ft.Colors.GREEN
-        e.control.update()
+        async def rerun(_):
+            get_page_ref().pop_dialog()
+            await self.process_files(
+                None, only=[str(self.path_to_project / p) for p in rejected]
+            )
 
         get_page_ref().show_dialog(
             ft.AlertDialog(
-                title="Job done",
+                title="Files rolled back",
                 content=ft.Text(
-                    "The task is done you can check the change report."
+                    f"{len(rejected)} file(s) were rolled back. Adjust the"
+                    " instructions and re-run just these files if needed."
                 ),
                 actions=[
-                    ft.TextButton(
-                        "Check Report", on_click=self.see_change_report
-                    ),
+                    ft.TextButton("Re-run Them", on_click=rerun),
                     ft.TextButton(
                         "Dismiss",
                         on_click=lambda _: get_page_ref().pop_dialog(),
@@ -584,60 +1058,39 @@ class ProjectSection(Section):
             )
         )
 
-        await asyncio.sleep(0.5)
-
-        e.control.content = "Process Files"
-        e.control.bgcolor = ft.Colors.BLUE
-        e.control.update()
-
-        # Enable rollback button after processing
-        self.rollback_button.disabled = False
-        self.rollback_button.bgcolor = ft.Colors.RED
-        self.rollback_button.update()
-
-    def is_there_available_backup(self) -> bool:
-        backup_dir_path = USER_DATA_PATH / "projects" / self.project_name
-
-        # Check if backup directory exists and has files
-        if not backup_dir_path.exists():
-            return False
-
-        # Check if there are any backup files
-        return any(backup_dir_path.iterdir())
+    async def open_history(self, _):
+        await get_page_ref().push_route(
+            view_cache.history_route(str(self.path_to_project))
+        )
 
     async def rollback_files(self, e):
+        if jobs.queue.active_for(self.path_to_project) is not None:
+            self.show_error(
+                "Project is busy",
+                RuntimeError("Wait for the running job to finish"),
+            )
+            return
+
+        @ui_scheduler.measured("rollback")
         async def perform_rollback(_):
             get_page_ref().pop_dialog()
 
-            backup_dir_path = USER_DATA_PATH / "projects" / self.project_name
-
-            # Restore each file from backup
-            for backup_file_path in backup_dir_path.rglob("*"):
-                if backup_file_path.is_file():
-                    relative_path = backup_file_path.relative_to(
-                        backup_dir_path
-                    )
-                    original_file_path = self.path_to_project / relative_path
-
-                    # Read backup content
-                    async with aiofiles.open(backup_file_path, "r") as f:
-                        content = await f.read()
-
-                    # Write to original location
-                    async with aiofiles.open(original_file_path, "w") as f:
-                        await f.write(content)
-
-            # Delete backup directory after successful rollback
-            import shutil
-
-            shutil.rmtree(backup_dir_path)
+            try:
+                await engine.restore_backup(
+                    self.path_to_project,
+                    engine.backup_dir_for(self.path_to_project),
+                    engine.checkpoint_path_for(self.path_to_project),
+                    file_cache.for_project(self.path_to_project),
+                )
+            except Exception as error:
+                self.show_error("Rollback failed", error)
+                return
 
-            # Disable rollback button
-            self.rollback_button.disabled = True
-            self.rollback_button.bgcolor = ft.Colors.with_opacity(
-                0.5, ft.Colors.RED
+            # Older backups (if kept) can be rolled back to next
+            self.actions.set_rollback_available(
+                engine.has_backup(engine.backup_dir_for(self.path_to_project))
             )
-            self.rollback_button.update()
+            self.actions.refresh()
 
             # Show success message
             get_page_ref().show_dialog(
@@ -658,6 +1111,13 @@ class ProjectSection(Section):
         async def cancel_rollback(_):
             get_page_ref().pop_dialog()
 
+        async def choose_files(_):
+            get_page_ref().pop_dialog()
+            manifest = await asyncio.to_thread(
+                storage.latest_run, engine.backup_dir_for(self.path_to_project)
+            )
+            self.show_change_summary(manifest, "Choose Files", [])
+
         # Show confirmation dialog with options
         get_page_ref().show_dialog(
             ft.AlertDialog(
@@ -671,6 +1131,10 @@ class ProjectSection(Section):
                         "See Change Report",
                         on_click=self.see_change_report,
                     ),
+                    ft.TextButton(
+                        "Choose Files",
+                        on_click=choose_files,
+                    ),
                     ft.TextButton(
                         "Rollback",
                         on_click=perform_rollback,
@@ -684,75 +1148,11 @@ class ProjectSection(Section):
         )
 
     def render(self):
-        self.process_button = ft.Button(
-            "Process Files",
-            icon=ft.Icons.PLAY_ARROW,
-            bgcolor=ft.Colors.BLUE,
-            color=ft.Colors.WHITE,
-            height=50,
-            on_click=self.process_files,
-        )
-
-        has_backup = self.is_there_available_backup()
-        self.rollback_button = ft.Button(
-            "Rollback",
-            icon=ft.Icons.BACKUP,
-            bgcolor=ft.Colors.RED
-            if has_backup
-            else ft.Colors.with_opacity(0.5, ft.Colors.RED),
-            color=ft.Colors.WHITE,
-            height=50,
-            on_click=self.rollback_files,
-            disabled=not has_backup,
-        )
+        # the project is read after the view is shown, opening a project
+        # with many files doesn't block the UI
+        self.body.content = ProjectSkeleton(self)
 
         return ft.View(
             route=self._route,
-            controls=[
-                ft.Container(
-                    padding=20,
-                    content=ft.Column(
-                        controls=[
-                            self.header,
-                            ft.Divider(),
-                            # Config & Process
-                            ft.Row(
-                                [
-                                    self.config,
-                                    ft.Column(
-                                        [
-                                            ft.Container(
-                                                content=self.rollback_button,
-                                                padding=ft.Padding.only(
-                                                    left=20
-                                                ),
-                                                alignment=ft.Alignment.CENTER,
-                                            ),
-                                            ft.Container(
-                                                content=self.process_button,
-                                                padding=ft.Padding.only(
-                                                    left=20
-                                                ),
-                                                alignment=ft.Alignment.CENTER,
-                                            ),
-                                        ]
-                                    ),
-                                ],
-                                vertical_alignment=ft.CrossAxisAlignment.END,
-                            ),
-                            ft.Divider(),
-                            # Files
-                            ft.Row(
-                                controls=[
-                                    self.target_files,
-                                    self.source_files,
-                                ],
-                                expand=True,
-                            ),
-                        ],
-                        expand=True,
-                    ),
-                    expand=True,
-                ),
-            ],
+            controls=[self.body],
         )
@@ -4,6 +4,9 @@ import flet as ft
 
 
 class Section(ABC):
+    # whether the rendered view may be reused when the route is revisited
+    cacheable: bool = True
+
     @staticmethod
     @abstractmethod
     def route() -> str: ...
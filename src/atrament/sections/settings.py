@@ -1,77 +1,166 @@
-import json
+import asyncio
+from sys import stderr
 from typing import Any
 
 import flet as ft
-import keyring
 
-from atrament.const import (
-    DEFAULT_SETTINGS,
-    USER_SETTINGS_FILE,
-    USER_SETTINGS_LOCK,
-)
+from atrament import retention, settings, ui_scheduler
 from atrament.page_ref import get_page_ref
 from atrament.sections.section import Section
 
 
-def is_secret(key: str) -> bool:
-    return "key" in key.lower() or "password" in key.lower()
+@ft.control
+class SettingsLoader(ft.Container):
+    """Fills the settings inputs once the settings service has loaded"""
+
+    def __init__(self, section: "SettingsSection", **kwargs: Any) -> None:
+        super().__init__(**kwargs)
+        self.section = section
+        self._task: asyncio.Task[None] | None = None
+
+    def init(self) -> None:
+        self.height = 0
+
+    def did_mount(self) -> None:
+        async def load_settings() -> None:
+            try:
+                values = await settings.service.load()
+            except Exception as e:
+                print(f"Could not load the settings: {e}", file=stderr)
+                values = {}
+            self.section.fill_inputs(values)
+
+        self._task = asyncio.create_task(load_settings())
+
+    def will_unmount(self) -> None:
+        # the inputs of a view that was left don't need filling
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
 
 
 class SettingsSection(Section):
     _route = "/settings/"
 
-    def __init__(self):
+    def __init__(self) -> None:
         self.inputs: dict[str, dict[str, Any]] = {}
         self.save_button: ft.Button | None = None
+        self.storage_status = ft.Text()
 
     @staticmethod
     def route() -> str:
         return SettingsSection._route
 
-    def save_settings(self, e):
-        """Save current input values to settings file."""
-        new_settings = {}
+    def build_input(self, setting: settings.Setting) -> ft.Control:
+        if setting.type is bool:
+            return ft.Switch(
+                label=setting.description or setting.key,
+                value=setting.default,
+                on_change=self.reset_save_button,
+            )
+
+        if setting.choices:
+            return ft.Dropdown(
+                label=setting.key,
+                hint_text=setting.description or None,
+                value=str(setting.default),
+                options=[
+                    ft.DropdownOption(key=str(choice))
+                    for choice in setting.choices
+                ],
+                on_select=self.reset_save_button,
+            )
+
+        return ft.TextField(
+            label=setting.key,
+            hint_text=setting.description or None,
+            password=setting.secret,
+            can_reveal_password=setting.secret,
+            keyboard_type=ft.KeyboardType.NUMBER
+            if setting.type in (int, float)
+            else ft.KeyboardType.TEXT,
+            border_color=ft.Colors.BLUE_200,
+            on_click=self.reset_save_button,
+        )
+
+    @staticmethod
+    def set_input_value(control: Any, value: Any) -> None:
+        if isinstance(control, ft.Switch):
+            control.value = bool(value)
+        else:
+            control.value = str(value) if value is not None else ""
+
+    def fill_inputs(self, values: settings.Settings) -> None:
+        for section, fields in self.inputs.items():
+            section_values = values.get(section, {})
+            for key, control in fields.items():
+                if key in section_values:
+                    self.set_input_value(control, section_values[key])
+                control.disabled = False
+                ui_scheduler.update(control)
+
+        if self.save_button is not None:
+            self.save_button.disabled = False
+            ui_scheduler.update(self.save_button)
+
+    async def save_settings(self, e: ft.Event[ft.Button]) -> None:
+        """Save the input values that changed"""
+        new_settings: settings.Settings = {}
 
         # Reconstruct settings dictionary from inputs
         for section, fields in self.inputs.items():
             new_settings[section] = {}
             for key, control in fields.items():
-                value = control.value
-                # Convert empty strings back to None if that matches the default type
-                if not value:
-                    value = None
-
-                # special handling of secret data
-                if is_secret(key):
-                    keyring.set_password(
-                        "atrament", f"{section}:{key}", value or ""
-                    )
-                    new_settings[section][key] = None
+                if isinstance(control, ft.Switch):
+                    new_settings[section][key] = bool(control.value)
                 else:
-                    new_settings[section][key] = value
-
-        # Ensure directory exists
-        USER_SETTINGS_FILE.parent.mkdir(parents=True, exist_ok=True)
+                    # empty strings become None, the default is used then
+                    new_settings[section][key] = control.value or None
 
-        # Write to file
-        with USER_SETTINGS_LOCK:
-            with open(USER_SETTINGS_FILE, "w") as f:
-                json.dump(new_settings, f, indent=4)
+        try:
+            await settings.service.save(new_settings)
+        except ValueError as e_value:
+            e.control.content = str(e_value)
+            e.control.bgcolor = ft.Colors.RED
+            ui_scheduler.update(e.control)
+            return
+        except Exception as e_save:
+            print(f"Could not save the settings: {e_save}", file=stderr)
+            e.control.content = "Saving failed"
+            e.control.bgcolor = ft.Colors.RED
+            ui_scheduler.update(e.control)
+            return
 
         # Show feedback
         e.control.content = "Saved!"
         e.control.bgcolor = ft.Colors.GREEN
-        e.control.update()
+        ui_scheduler.update(e.control)
 
-    def reset_save_button(self, _):
+    async def clean_up_storage(self, e: ft.Event[ft.OutlinedButton]) -> None:
+        """Apply the storage settings right away and show what was freed"""
+        e.control.disabled = True
+        self.storage_status.value = "Cleaning up..."
+        ui_scheduler.update(e.control, self.storage_status)
+
+        try:
+            report = await retention.daemon.collect()
+            self.storage_status.value = f"Cleanup {report.describe()}"
+        except Exception as e_clean:
+            print(f"Storage cleanup failed: {e_clean}", file=stderr)
+            self.storage_status.value = "Cleanup failed"
+
+        e.control.disabled = False
+        ui_scheduler.update(e.control, self.storage_status)
+
+    def reset_save_button(self, _: Any) -> None:
         if self.save_button is None:
             return
 
         self.save_button.content = "Save Settings"
         self.save_button.bgcolor = ft.Colors.BLUE
-        self.save_button.update()
+        ui_scheduler.update(self.save_button)
 
-    async def go_back(self, _):
+    async def go_back(self, _: Any) -> None:
         page = get_page_ref()
         if len(page.views) > 1:
             page.views.pop()
@@ -81,19 +170,13 @@ class SettingsSection(Section):
             page.views.pop()
             await page.push_route("/")
 
-    def render(self):
-        # Load user settings from file
-        user_settings = {}
-        if USER_SETTINGS_FILE.exists():
-            with USER_SETTINGS_LOCK:
-                try:
-                    with open(USER_SETTINGS_FILE, "r") as f:
-                        user_settings = json.load(f)
-                except Exception:
-                    pass  # Ignore errors, will fall back to defaults
+    def render(self) -> ft.View:
+        # the inputs start disabled until the settings are loaded,
+        # unless a previous visit already loaded them
+        user_settings = settings.service.cached()
 
         self.inputs = {}  # Reset inputs map
-        controls_list = []
+        controls_list: list[ft.Control] = []
 
         # Header
         controls_list.append(
@@ -112,52 +195,37 @@ class SettingsSection(Section):
         )
         controls_list.append(ft.Divider())
 
-        # Iterate through DEFAULT_SETTINGS to build UI structure
+        # Iterate through the settings schema to build UI structure
         # This ensures we always show all available settings, even if not in user file yet
-        for section_name, default_section_values in DEFAULT_SETTINGS.items():
-            # Section Title
-            controls_list.append(
-                ft.Text(
-                    section_name,
-                    size=20,
-                    weight=ft.FontWeight.BOLD,
-                    color=ft.Colors.BLUE,
+        for setting in settings.SCHEMA:
+            if setting.section not in self.inputs:
+                if self.inputs:
+                    controls_list.append(
+                        ft.Divider(height=20, color=ft.Colors.TRANSPARENT)
+                    )
+                # Section Title
+                controls_list.append(
+                    ft.Text(
+                        setting.section,
+                        size=20,
+                        weight=ft.FontWeight.BOLD,
+                        color=ft.Colors.BLUE,
+                    )
                 )
-            )
+                self.inputs[setting.section] = {}
 
-            self.inputs[section_name] = {}
-
-            # Get user values for this section if they exist
-            user_section_values = user_settings.get(section_name, {})
-
-            if isinstance(default_section_values, dict):
-                for key, default_val in default_section_values.items():
-                    # Determine value: user value > default value
-                    # handle secret values
-                    if is_secret(key):
-                        current_val = keyring.get_password(
-                            "atrament", f"{section_name}:{key}"
-                        )
-                    else:
-                        current_val = user_section_values.get(key, default_val)
-
-                    # Determine if it looks like a password/key for masking
-                    is_password = is_secret(key)  # cache the value
-
-                    tf = ft.TextField(
-                        label=key,
-                        value=current_val if current_val is not None else "",
-                        password=is_password,
-                        can_reveal_password=is_password,
-                        border_color=ft.Colors.BLUE_200,
-                        on_click=self.reset_save_button,
-                    )
-                    self.inputs[section_name][key] = tf
-                    controls_list.append(tf)
+            control = self.build_input(setting)
+            if user_settings is not None:
+                self.set_input_value(
+                    control, user_settings[setting.section][setting.key]
+                )
+            else:
+                control.disabled = True
 
-            controls_list.append(
-                ft.Divider(height=20, color=ft.Colors.TRANSPARENT)
-            )
+            self.inputs[setting.section][setting.key] = control
+            controls_list.append(control)
+
+        controls_list.append(ft.Divider(height=20, color=ft.Colors.TRANSPARENT))
 
         # Save Button
         self.save_button = ft.Button(
@@ -167,12 +235,32 @@ class SettingsSection(Section):
             color=ft.Colors.WHITE,
             on_click=self.save_settings,
             height=50,
+            disabled=user_settings is None,
+        )
+
+        last_report = retention.daemon.last_report
+        self.storage_status = ft.Text(
+            f"Last cleanup {last_report.describe()}" if last_report else ""
         )
 
         controls_list.append(ft.Divider())
         controls_list.append(self.save_button)
+        controls_list.append(
+            ft.Row(
+                [
+                    ft.OutlinedButton(
+                        "Clean up storage now",
+                        icon=ft.Icons.CLEANING_SERVICES,
+                        on_click=self.clean_up_storage,
+                    ),
+                    self.storage_status,
+                ]
+            )
+        )
         # Add some bottom padding
         controls_list.append(ft.Container(height=50))
+        if user_settings is None:
+            controls_list.append(SettingsLoader(self))
 
         return ft.View(
             route=self.route(),
@@ -0,0 +1,415 @@
+import asyncio
+import copy
+import json
+from collections.abc import Callable
+from dataclasses import dataclass
+from sys import stderr
+from typing import Any
+
+import keyring
+import keyring.errors
+
+from atrament import rate_limits
+from atrament.const import USER_SETTINGS_FILE, USER_SETTINGS_LOCK
+
+KEYRING_SERVICE: str = "atrament"
+
+# Version of the layout of USER_SETTINGS_FILE, files written before the
+# version was stored are version 1
+SCHEMA_VERSION: int = 2
+VERSION_KEY: str = "schema-version"
+
+Settings = dict[str, dict[str, Any]]
+# (section, key) -> new value
+Changes = dict[tuple[str, str], Any]
+ChangeListener = Callable[[Changes], None]
+
+
+def is_secret(key: str) -> bool:
+    return "key" in key.lower() or "password" in key.lower()
+
+
+def _secret_name(section: str, key: str) -> str:
+    return f"{section}:{key}"
+
+
+@dataclass(frozen=True)
+class Setting:
+    section: str
+    key: str
+    type: type
+    default: Any
+    description: str = ""
+    minimum: float | None = None
+    # the only values allowed, any value of the type when empty
+    choices: tuple[Any, ...] = ()
+    # further validation of the parsed value, raises ValueError
+    check: Callable[[Any], Any] | None = None
+
+    @property
+    def secret(self) -> bool:
+        return is_secret(self.key)
+
+    def parse(self, value: Any) -> Any:
+        """
+        Convert `value` (e.g. the text of an input) to the setting's type
+
+        Raises:
+            ValueError: when the value can't be converted or is too small
+        """
+        if value is None or value == "":
+            return self.default
+
+        if self.type is bool:
+            if isinstance(value, str):
+                return value.strip().lower() in ("1", "true", "yes", "on")
+            return bool(value)
+
+        try:
+            parsed = self.type(value)
+        except (TypeError, ValueError):
+            raise ValueError(
+                f"{self.key} has to be a {self.type.__name__}, got {value!r}"
+            )
+
+        if self.minimum is not None and parsed < self.minimum:
+            raise ValueError(f"{self.key} has to be at least {self.minimum}")
+        if self.choices and parsed not in self.choices:
+            choices = ", ".join(map(str, self.choices))
+            raise ValueError(f"{self.key} has to be one of {choices}")
+        if self.check is not None:
+            try:
+                self.check(parsed)
+            except ValueError as e:
+                raise ValueError(f"{self.key}: {e}") from None
+        return parsed
+
+
+SCHEMA: list[Setting] = [
+    Setting("ChatGPT", "api-key", str, None),
+    Setting("Claude", "api-key", str, None),
+    Setting(
+        "Performance",
+        "max-concurrent-jobs",
+        int,
+        4,
+        "Projects processed at the same time",
+        minimum=1,
+    ),
+    Setting(
+        "Performance",
+        "max-requests-per-company",
+        int,
+        2,
+        "AI requests in flight per provider",
+        minimum=1,
+    ),
+    Setting(
+        "Performance",
+        "max-concurrent-requests",
+        int,
+        32,
+        "Upper bound of the adaptive per model concurrency",
+        minimum=1,
+    ),
+    Setting(
+        "Performance",
+        "file-cache-mb",
+        int,
+        64,
+        "Memory used to cache file contents, per project",
+        minimum=1,
+    ),
+    Setting(
+        "Performance",
+        "request-timeout-seconds",
+        float,
+        600.0,
+        "Time an AI request may take before it is retried",
+        minimum=1,
+    ),
+    Setting(
+        "Performance",
+        "rate-limits",
+        str,
+        "",
+        "Quotas per model as model=requests/tokens per minute separated"
+        " by ;, * for any other model, e.g. gpt-4o=500/30000",
+        check=rate_limits.parse,
+    ),
+    Setting(
+        "Performance",
+        "stream-responses",
+        bool,
+        True,
+        "Stream AI responses instead of waiting for the whole response",
+    ),
+    Setting(
+        "Storage",
+        "backup-keep-runs",
+        int,
+        5,
+        "Backups kept per project",
+        minimum=1,
+    ),
+    Setting(
+        "Storage",
+        "backup-max-age-days",
+        float,
+        30.0,
+        "Days backups and reports are kept, 0 keeps them forever",
+        minimum=0,
+    ),
+    Setting(
+        "Storage",
+        "quota-mb",
+        int,
+        2048,
+        "Disk space for backups and reports of all projects, 0 for no limit",
+        minimum=0,
+    ),
+    Setting(
+        "Storage",
+        "compression",
+        str,
+        "gzip",
+        "Compression of new backups and reports, zstd needs the"
+        " compression extra",
+        choices=("none", "gzip", "zstd"),
+    ),
+]
+
+DEFAULT_SETTINGS: Settings = {}
+for _setting in SCHEMA:
+    DEFAULT_SETTINGS.setdefault(_setting.section, {})[_setting.key] = (
+        _setting.default
+    )
+
+
+def _migrate_v1(data: dict[str, Any]) -> dict[str, Any]:
+    # version 1 was a free-form dump of the settings inputs, values were
+    # whatever the text fields held and secrets were stored as None
+    return {
+        section: {
+            key: value
+            for key, value in values.items()
+            if not is_secret(key) and value not in (None, "")
+        }
+        for section, values in data.items()
+        if isinstance(values, dict)
+    }
+
+
+# version -> function upgrading the file contents to the next version
+MIGRATIONS: dict[int, Callable[[dict[str, Any]], dict[str, Any]]] = {
+    1: _migrate_v1,
+}
+
+
+def migrate(data: dict[str, Any]) -> tuple[dict[str, Any], bool]:
+    """
+    Upgrade the contents of a settings file to SCHEMA_VERSION
+
+    Returns:
+        tuple[dict, bool]: the settings without the version key and
+            whether any migration ran
+    """
+    data = dict(data)
+    version = data.pop(VERSION_KEY, 1)
+    migrated = False
+    while version < SCHEMA_VERSION:
+        data = MIGRATIONS[version](data)
+        version += 1
+        migrated = True
+    return data, migrated
+
+
+class SettingsService:
+    """
+    User settings and secrets, read once and kept in memory
+
+    The settings file and the keyring are only touched from worker
+    threads, secret-service backends can take a long time per call.
+    Secrets live in the keyring, the settings file stores None for them.
+    Listeners get every value on load and the changed values on save.
+    """
+
+    def __init__(self) -> None:
+        self._values: Settings | None = None
+        self._lock = asyncio.Lock()
+        self._listeners: list[ChangeListener] = []
+
+    @property
+    def loaded(self) -> bool:
+        return self._values is not None
+
+    def subscribe(self, listener: ChangeListener) -> Callable[[], None]:
+        """Register a listener and return a function that removes it"""
+        self._listeners.append(listener)
+
+        def unsubscribe() -> None:
+            if listener in self._listeners:
+                self._listeners.remove(listener)
+
+        return unsubscribe
+
+    def _notify(self, changes: Changes) -> None:
+        for listener in list(self._listeners):
+            try:
+                listener(changes)
+            except Exception as e:
+                print(f"Settings listener failed: {e}", file=stderr)
+
+    def cached(self) -> Settings | None:
+        """Copy of the settings if they were loaded already, never blocks"""
+        if self._values is None:
+            return None
+        return copy.deepcopy(self._values)
+
+    def current(self, section: str, key: str) -> Any:
+        """Value of a setting without waiting, the default until loaded"""
+        if self._values is not None:
+            return self._values[section][key]
+        return DEFAULT_SETTINGS[section][key]
+
+    @staticmethod
+    def _read() -> Settings:
+        data: dict[str, Any] = {}
+        if USER_SETTINGS_FILE.exists():
+            with USER_SETTINGS_LOCK:
+                try:
+                    with open(USER_SETTINGS_FILE, "r") as f:
+                        data = json.load(f)
+                except (OSError, ValueError) as e:
+                    print(f"Could not read the settings file: {e}", file=stderr)
+
+        user_settings, migrated = migrate(data)
+
+        values: Settings = {}
+        for setting in SCHEMA:
+            section = values.setdefault(setting.section, {})
+            if setting.secret:
+                # cleared secrets are stored as empty strings
+                try:
+                    section[setting.key] = (
+                        keyring.get_password(
+                            KEYRING_SERVICE,
+                            _secret_name(setting.section, setting.key),
+                        )
+                        or None
+                    )
+                except keyring.errors.KeyringError as e:
+                    # e.g. a server without a secret service
+                    print(
+                        f"Could not read {setting.section} {setting.key}: {e}",
+                        file=stderr,
+                    )
+                    section[setting.key] = None
+                continue
+
+            try:
+                section[setting.key] = setting.parse(
+                    user_settings.get(setting.section, {}).get(setting.key)
+                )
+            except ValueError as e:
+                print(f"Ignoring invalid setting: {e}", file=stderr)
+                section[setting.key] = setting.default
+
+        if migrated and data:
+            SettingsService._write(values, {}, True)
+        return values
+
+    @staticmethod
+    def _write(
+        values: Settings, secrets: dict[str, str | None], write_file: bool
+    ) -> None:
+        for name, secret in secrets.items():
+            keyring.set_password(KEYRING_SERVICE, name, secret or "")
+
+        if not write_file:
+            return
+
+        stored: dict[str, Any] = {VERSION_KEY: SCHEMA_VERSION}
+        for section, section_values in values.items():
+            stored[section] = {
+                key: None if is_secret(key) else value
+                for key, value in section_values.items()
+            }
+
+        USER_SETTINGS_FILE.parent.mkdir(parents=True, exist_ok=True)
+        with USER_SETTINGS_LOCK, open(USER_SETTINGS_FILE, "w") as f:
+            json.dump(stored, f, indent=4)
+
+    async def load(self) -> Settings:
+        """Return the settings, reading them on first use"""
+        async with self._lock:
+            if self._values is None:
+                self._values = await asyncio.to_thread(self._read)
+                self._notify(
+                    {
+                        (section, key): value
+                        for section, section_values in self._values.items()
+                        for key, value in section_values.items()
+                    }
+                )
+            return copy.deepcopy(self._values)
+
+    async def get(self, section: str, key: str) -> Any:
+        values = await self.load()
+        return values[section][key]
+
+    async def save(self, new_values: dict[str, dict[str, Any]]) -> Changes:
+        """
+        Store the values that differ from the current settings
+
+        Values are parsed by the schema first, so the text of inputs can
+        be passed in as is.
+
+        Returns:
+            Changes: the settings that changed
+
+        Raises:
+            ValueError: when a value doesn't fit its setting, nothing is
+                saved then
+        """
+        schema = {(s.section, s.key): s for s in SCHEMA}
+        await self.load()
+
+        async with self._lock:
+            assert self._values is not None
+            merged = copy.deepcopy(self._values)
+            secrets: dict[str, str | None] = {}
+            changes: Changes = {}
+
+            for section, section_values in new_values.items():
+                for key, value in section_values.items():
+                    setting = schema.get((section, key))
+                    if setting is None:
+                        raise ValueError(f"Unknown setting {section}:{key}")
+
+                    value = setting.parse(value)
+                    if merged[section][key] == value:
+                        continue
+
+                    merged[section][key] = value
+                    changes[(section, key)] = value
+                    if setting.secret:
+                        secrets[_secret_name(section, key)] = value
+
+            if not changes:
+                return changes
+
+            await asyncio.to_thread(
+                self._write, merged, secrets, len(secrets) < len(changes)
+            )
+            self._values = merged
+
+        self._notify(changes)
+        return changes
+
+    def invalidate(self) -> None:
+        """Forget the cached values, the next access reads them again"""
+        self._values = None
+
+
+service = SettingsService()
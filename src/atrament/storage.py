@@ -0,0 +1,483 @@
+import asyncio
+import datetime
+import gzip
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+import threading
+import time
+import uuid
+from dataclasses import asdict, dataclass, field, fields
+from pathlib import Path
+from sys import stderr
+from typing import Any
+
+try:
+    import zstandard
+except ImportError:  # optional, install the "compression" extra
+    zstandard = None
+
+from atrament import settings
+from atrament.checkpoint import content_hash
+from atrament.const import USER_DATA_PATH
+
+# Contents of backed up files, shared by all projects and named by their
+# hash, a file vendored into many projects is stored once
+BLOBS_DIR: Path = USER_DATA_PATH / "blobs"
+RUNS_DIR_NAME: str = "runs"
+
+# Blobs younger than this are never collected, a backup that is being
+# written has stored its blobs but not yet its manifest
+GC_GRACE_SECONDS: float = 60 * 60
+
+# codec -> suffix of the files it compressed, files of any codec are
+# read no matter which one is configured
+CODECS: dict[str, str] = {"none": "", "gzip": ".gz", "zstd": ".zst"}
+GZIP_LEVEL: int = 6
+ZSTD_LEVEL: int = 3
+
+_warned_zstd = False
+
+# held by writers while they look a blob up and touch it, and by the
+# collection while it checks a blob's age and deletes it, so a blob a
+# writer just reused is never deleted on the strength of an older stat
+_blobs_lock = threading.Lock()
+
+
+def project_id(project_path: Path) -> str:
+    """
+    Stable identifier of the project at `project_path`
+
+    Everything the app stores about a project is namespaced by it, two
+    projects with the same name (e.g. of different users of one server)
+    never share backups or caches.
+    """
+    resolved = str(Path(project_path).expanduser().resolve())
+    return hashlib.sha256(resolved.encode("utf-8")).hexdigest()[:16]
+
+
+def backup_dir_for(project_path: Path) -> Path:
+    return USER_DATA_PATH / "projects" / project_id(project_path)
+
+
+def report_dir_for(project_path: Path) -> Path:
+    return USER_DATA_PATH / "reports" / project_id(project_path)
+
+
+def checkpoint_path_for(project_path: Path) -> Path:
+    return USER_DATA_PATH / "checkpoints" / f"{project_id(project_path)}.json"
+
+
+def index_path_for(project_path: Path) -> Path:
+    return USER_DATA_PATH / "index" / f"{project_id(project_path)}.json"
+
+
+def digest_path_for(project_path: Path) -> Path:
+    return USER_DATA_PATH / "cache" / f"{project_id(project_path)}.json"
+
+
+def adopt_legacy_data(project_path: Path, project_name: str) -> None:
+    """
+    Move data stored under the project's name to its project id
+
+    Older versions namespaced everything by the project name and kept
+    backups as plain copies of the files. Nothing is moved when data for
+    the id exists already.
+    """
+    if not project_name or project_name in (".", "..") or "/" in project_name:
+        project_name = ""
+
+    moves: list[tuple[Path, Path]] = []
+    if project_name:
+        moves = [
+            (
+                USER_DATA_PATH / "projects" / project_name,
+                backup_dir_for(project_path),
+            ),
+            (
+                USER_DATA_PATH / "reports" / project_name,
+                report_dir_for(project_path),
+            ),
+            (
+                USER_DATA_PATH / "checkpoints" / f"{project_name}.json",
+                checkpoint_path_for(project_path),
+            ),
+            (
+                USER_DATA_PATH / "index" / f"{project_name}.json",
+                index_path_for(project_path),
+            ),
+            (
+                USER_DATA_PATH / "cache" / f"{project_name}.json",
+                digest_path_for(project_path),
+            ),
+        ]
+    for legacy, current in moves:
+        if legacy == current or not legacy.exists() or current.exists():
+            continue
+        try:
+            current.parent.mkdir(parents=True, exist_ok=True)
+            os.replace(legacy, current)
+        except OSError as e:
+            print(f"Could not move {legacy} to {current}: {e}", file=stderr)
+
+    try:
+        _import_backup_tree(project_path)
+    except (OSError, UnicodeDecodeError) as e:
+        print(f"Could not import the old backup: {e}", file=stderr)
+
+
+def current_codec() -> str:
+    """The configured codec, gzip when zstd isn't installed"""
+    global _warned_zstd
+
+    codec: str = settings.service.current("Storage", "compression")
+    if codec == "zstd" and zstandard is None:
+        if not _warned_zstd:
+            print("zstandard is not installed, using gzip", file=stderr)
+            _warned_zstd = True
+        return "gzip"
+    return codec
+
+
+def compress(data: bytes, codec: str) -> bytes:
+    match codec:
+        case "gzip":
+            return gzip.compress(data, compresslevel=GZIP_LEVEL, mtime=0)
+        case "zstd":
+            assert zstandard is not None
+            return zstandard.ZstdCompressor(level=ZSTD_LEVEL).compress(data)
+        case _:
+            return data
+
+
+def decompress(data: bytes, suffix: str) -> bytes:
+    """
+    Decompress `data` read from a file with the suffix `suffix`
+
+    Raises:
+        OSError: when the file was compressed by zstd and zstandard isn't
+            installed
+    """
+    match suffix:
+        case ".gz":
+            return gzip.decompress(data)
+        case ".zst":
+            if zstandard is None:
+                raise OSError("Install zstandard to read zstd compressed files")
+            return zstandard.ZstdDecompressor().decompress(data)
+        case _:
+            return data
+
+
+def write_compressed(path: Path, text: str, codec: str | None = None) -> Path:
+    """
+    Atomically write `text` to `path` plus the suffix of the codec
+
+    Returns:
+        Path: the path written to
+    """
+    codec = codec or current_codec()
+    path = path.with_name(path.name + CODECS[codec])
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = path.with_name(f"{path.name}.{uuid.uuid4().hex}.tmp")
+    with open(tmp_path, "wb") as f:
+        f.write(compress(text.encode("utf-8"), codec))
+    os.replace(tmp_path, path)
+    return path
+
+
+def read_compressed(path: Path) -> str:
+    """Read a file written by `write_compressed` with any codec"""
+    suffix = next(
+        (s for s in CODECS.values() if s and path.name.endswith(s)), ""
+    )
+    with open(path, "rb") as f:
+        return decompress(f.read(), suffix).decode("utf-8")
+
+
+def extract_reports(report_dir: Path) -> Path:
+    """
+    Decompress the report files of `report_dir` so a browser can open them
+
+    Returns:
+        Path: a temporary directory holding the plain files
+    """
+    target = Path(tempfile.gettempdir()) / "atrament-reports" / report_dir.name
+    shutil.rmtree(target, ignore_errors=True)
+    target.mkdir(parents=True)
+
+    for path in report_dir.iterdir():
+        name = path.name
+        for suffix in CODECS.values():
+            if suffix and name.endswith(suffix):
+                name = name[: -len(suffix)]
+                break
+        (target / name).write_text(read_compressed(path), encoding="utf-8")
+    return target
+
+
+def blob_path(digest: str, blobs_dir: Path = BLOBS_DIR) -> Path:
+    """Path of the blob `digest` without the suffix of its codec"""
+    return blobs_dir / digest[:2] / digest
+
+
+def find_blob(digest: str, blobs_dir: Path = BLOBS_DIR) -> Path | None:
+    base = blob_path(digest, blobs_dir)
+    for suffix in CODECS.values():
+        path = base.with_name(base.name + suffix)
+        if path.exists():
+            return path
+    return None
+
+
+def _put_blob(content: str, blobs_dir: Path) -> str:
+    digest = content_hash(content)
+    with _blobs_lock:
+        existing = find_blob(digest, blobs_dir)
+        if existing is not None:
+            # touch it so a collection running right now keeps it
+            os.utime(existing)
+            return digest
+
+    # a new blob is young enough to outlive any collection
+    write_compressed(blob_path(digest, blobs_dir), content)
+    return digest
+
+
+async def put_blob(content: str, blobs_dir: Path = BLOBS_DIR) -> str:
+    """Store `content` unless it is stored already and return its hash"""
+    # compression is CPU bound, keep it off the event loop
+    return await asyncio.to_thread(_put_blob, content, blobs_dir)
+
+
+def read_blob(digest: str, blobs_dir: Path = BLOBS_DIR) -> str:
+    """
+    Raises:
+        FileNotFoundError: when the blob was collected already
+    """
+    path = find_blob(digest, blobs_dir)
+    if path is None:
+        raise FileNotFoundError(f"Backed up content {digest} is gone")
+    return read_compressed(path)
+
+
+@dataclass
+class Manifest:
+    """
+    A backup taken before a run, maps the project relative path of every
+    backed up file to the hash of its content
+
+    Runs also record what they did, restores back up the files they are
+    about to overwrite so they can be undone like a run.
+    """
+
+    path: Path
+    created: str
+    files: dict[str, str] = field(default_factory=dict)
+    # resolved path of the project, empty for backups of older versions
+    project: str = ""
+    kind: str = "run"  # "run" or "restore"
+    instructions: str = ""
+    model: str = ""
+    status: str = "running"  # "running", "done" or "failed"
+    stats: dict[str, Any] = field(default_factory=dict)
+    # project relative paths of the files the run wrote
+    changed: list[str] = field(default_factory=list)
+    # changed files the user rolled back individually
+    rejected: list[str] = field(default_factory=list)
+    # content the run wrote by path, kept so it can be reused when the
+    # same input is sent with the same instructions again
+    outputs: dict[str, str] = field(default_factory=dict)
+    # checkpoint.sources_signature of the source files sent
+    sources: str = ""
+
+    @property
+    def run_id(self) -> str:
+        return self.path.stem
+
+    @property
+    def created_at(self) -> datetime.datetime:
+        return datetime.datetime.fromisoformat(self.created)
+
+    def blobs(self) -> set[str]:
+        """Every blob the manifest refers to"""
+        return {*self.files.values(), *self.outputs.values()}
+
+    @classmethod
+    def load(cls, path: Path) -> "Manifest":
+        with open(path, "r", encoding="utf-8") as f:
+            data = json.load(f)
+        known = {f.name for f in fields(cls)} - {"path"}
+        return cls(path=path, **{k: v for k, v in data.items() if k in known})
+
+    def save(self) -> None:
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        data = asdict(self)
+        del data["path"]
+
+        tmp_path = self.path.with_suffix(self.path.suffix + ".tmp")
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(data, f, indent=2)
+        os.replace(tmp_path, self.path)
+
+
+def runs_dir(backup_dir: Path) -> Path:
+    return backup_dir / RUNS_DIR_NAME
+
+
+def list_runs(backup_dir: Path) -> list[Manifest]:
+    """Backups of a project, oldest first"""
+    manifests = []
+    for path in sorted(runs_dir(backup_dir).glob("*.json")):
+        try:
+            manifests.append(Manifest.load(path))
+        except (OSError, ValueError, KeyError, TypeError) as e:
+            print(f"Ignoring unreadable backup {path}: {e}", file=stderr)
+    return manifests
+
+
+def find_run(backup_dir: Path, run_id: str) -> Manifest | None:
+    path = runs_dir(backup_dir) / f"{run_id}.json"
+    try:
+        return Manifest.load(path)
+    except (OSError, ValueError, KeyError, TypeError):
+        return None
+
+
+def latest_run(backup_dir: Path) -> Manifest | None:
+    runs = list_runs(backup_dir)
+    return runs[-1] if runs else None
+
+
+def new_manifest(
+    backup_dir: Path, project_path: Path | None = None, **details: Any
+) -> Manifest:
+    now = datetime.datetime.now(datetime.UTC)
+    # sortable by name, the suffix tells runs started at once apart
+    run_id = f"{now.strftime('%Y%m%dT%H%M%S%fZ')}-{uuid.uuid4().hex[:6]}"
+    return Manifest(
+        path=runs_dir(backup_dir) / f"{run_id}.json",
+        created=now.isoformat(),
+        project=str(Path(project_path).resolve()) if project_path else "",
+        **details,
+    )
+
+
+def keep_latest_runs(backup_dir: Path, keep_runs: int) -> list[Manifest]:
+    """
+    Drop every backup of the project but the newest `keep_runs` ones
+
+    Returns:
+        list[Manifest]: the dropped backups
+    """
+    runs = list_runs(backup_dir)
+    dropped = runs[: max(len(runs) - keep_runs, 0)]
+    for manifest in dropped:
+        manifest.path.unlink(missing_ok=True)
+    return dropped
+
+
+def dir_size(path: Path) -> int:
+    """Bytes used by the files under `path`"""
+    size = 0
+    for p in path.rglob("*"):
+        try:
+            if p.is_file():
+                size += p.stat().st_size
+        except OSError:
+            pass
+    return size
+
+
+def forget_project(project_id_: str) -> int:
+    """
+    Delete everything stored about the project with the id `project_id_`
+
+    Returns:
+        int: number of bytes freed, blobs are left to `collect_garbage`
+    """
+    freed = 0
+    for path in (
+        USER_DATA_PATH / "projects" / project_id_,
+        USER_DATA_PATH / "reports" / project_id_,
+    ):
+        if path.exists():
+            freed += dir_size(path)
+            shutil.rmtree(path, ignore_errors=True)
+
+    for path in (
+        USER_DATA_PATH / "checkpoints" / f"{project_id_}.json",
+        USER_DATA_PATH / "index" / f"{project_id_}.json",
+        USER_DATA_PATH / "cache" / f"{project_id_}.json",
+    ):
+        try:
+            freed += path.stat().st_size
+            path.unlink()
+        except OSError:
+            pass
+    return freed
+
+
+def collect_garbage(
+    projects_dir: Path = USER_DATA_PATH / "projects",
+    blobs_dir: Path = BLOBS_DIR,
+) -> int:
+    """
+    Delete the blobs no backup of any project refers to
+
+    Returns:
+        int: number of bytes freed
+    """
+    referenced: set[str] = set()
+    for manifest_path in projects_dir.glob(f"*/{RUNS_DIR_NAME}/*.json"):
+        try:
+            referenced.update(Manifest.load(manifest_path).blobs())
+        except (OSError, ValueError, KeyError, TypeError) as e:
+            # an unreadable manifest might refer to anything, keep it all
+            print(f"Skipping collection, {manifest_path}: {e}", file=stderr)
+            return 0
+
+    freed = 0
+    cutoff = time.time() - GC_GRACE_SECONDS
+    for path in blobs_dir.glob("*/*"):
+        # unfinished writes carry the blob's name too
+        if path.name.split(".")[0] in referenced:
+            continue
+        try:
+            with _blobs_lock:
+                stat = path.stat()
+                if stat.st_mtime > cutoff:
+                    continue
+                path.unlink()
+            freed += stat.st_size
+        except OSError:
+            pass
+    return freed
+
+
+def _import_backup_tree(project_path: Path) -> None:
+    """Turn a backup stored as a plain copy of the files into a run"""
+    backup_dir = backup_dir_for(project_path)
+    files = [
+        p
+        for p in backup_dir.rglob("*")
+        if p.is_file() and runs_dir(backup_dir) not in p.parents
+    ]
+    if not files:
+        return
+
+    manifest = new_manifest(backup_dir, project_path)
+    for p in files:
+        digest = _put_blob(p.read_text(encoding="utf-8"), BLOBS_DIR)
+        manifest.files[p.relative_to(backup_dir).as_posix()] = digest
+    manifest.save()
+
+    for child in backup_dir.iterdir():
+        if child.name == RUNS_DIR_NAME:
+            continue
+        if child.is_dir():
+            shutil.rmtree(child)
+        else:
+            child.unlink()
@@ -0,0 +1,276 @@
+import functools
+import inspect
+import os
+import threading
+from collections.abc import Callable, Hashable, Iterator
+from contextlib import contextmanager
+from dataclasses import dataclass
+from sys import stderr
+from typing import Any
+
+import flet as ft
+
+from atrament.page_ref import get_page_ref
+
+# Work scheduled within one frame is run once, with the latest arguments
+FRAME_SECONDS: float = 1 / 60
+DEFAULT_WIDTH: float = 800
+
+_STORE_KEY = "atrament.ui_scheduler"
+
+# Set to print the updates sent by every measured interaction
+DEBUG_UPDATES: bool = bool(os.environ.get("ATRAMENT_DEBUG_UPDATES"))
+
+ResizeListener = Callable[[float, float], None]
+
+
+@dataclass
+class UpdateStats:
+    requested: int = 0  # controls marked dirty, duplicates included
+    sent: int = 0  # page.update round-trips to the client
+    controls: int = 0  # controls sent in those round-trips
+
+    def __sub__(self, other: "UpdateStats") -> "UpdateStats":
+        return UpdateStats(
+            requested=self.requested - other.requested,
+            sent=self.sent - other.sent,
+            controls=self.controls - other.controls,
+        )
+
+
+def _attached(control: ft.Control) -> bool:
+    try:
+        return control.page is not None
+    except RuntimeError:
+        return False
+
+
+def _skip_auto_update() -> None:
+    """
+    Count the update as done for the running event handler, Flet would
+    push the whole handler's control again otherwise
+    """
+    mark_update_called = getattr(ft.context, "mark_update_called", None)
+    if mark_update_called is not None:
+        mark_update_called()
+        return
+
+    # older Flet can only turn the auto update off, which outside of a
+    # handler would turn it off for every handler
+    try:
+        in_handler = ft.context.page is not None
+    except RuntimeError:
+        in_handler = False
+    if in_handler:
+        ft.context.disable_auto_update()
+
+
+def _has_dirty_ancestor(
+    control: ft.Control, dirty: dict[int, ft.Control]
+) -> bool:
+    parent = control.parent
+    while parent is not None:
+        if id(parent) in dirty:
+            return True
+        parent = parent.parent
+    return False
+
+
+def set_visible(control: ft.Control, visible: bool) -> bool:
+    """Change the visibility of `control`, returns whether it changed"""
+    if control.visible == visible:
+        return False
+    control.visible = visible
+    return True
+
+
+class UiScheduler:
+    """
+    Runs high-frequency UI work at most once per frame
+
+    Work is keyed, scheduling the same key again within a frame replaces
+    the pending callback, so a burst of events turns into one update
+    with the latest state. The scheduler owns `page.on_resize` and fans
+    the coalesced resizes out to its listeners.
+
+    Controls passed to `request_update` are sent together in a single
+    `page.update` at the end of the current event loop tick. The updates
+    of the latest run of every measured interaction are kept in
+    `measured`.
+    """
+
+    def __init__(self, page: ft.Page):
+        self.page = page
+        self.width: float = page.width or page.window.width or DEFAULT_WIDTH
+        self.height: float = page.height or page.window.height or 0
+        self._pending: dict[Hashable, Callable[[], None]] = {}
+        self._scheduled = False
+        # event handlers may run outside of the event loop's thread
+        self._lock = threading.Lock()
+        self._resize_listeners: list[ResizeListener] = []
+        self._dirty: dict[int, ft.Control] = {}
+        self._update_scheduled = False
+        self.stats = UpdateStats()
+        self.measured: dict[str, UpdateStats] = {}
+        # measurements waiting for the updates requested in their block
+        self._after_send: list[Callable[[], None]] = []
+
+        page.on_resize = self._on_resize
+
+    def request_update(self, *controls: ft.Control) -> None:
+        """Send `controls` to the client with the other dirty controls"""
+        _skip_auto_update()
+
+        with self._lock:
+            self.stats.requested += len(controls)
+            for control in controls:
+                self._dirty[id(control)] = control
+            if self._update_scheduled:
+                return
+            self._update_scheduled = True
+
+        self.page.loop.call_soon_threadsafe(self._send_updates)
+
+    def _send_updates(self) -> None:
+        with self._lock:
+            dirty, self._dirty = self._dirty, {}
+            self._update_scheduled = False
+
+        # an updated control carries its children along, and controls
+        # that were unmounted meanwhile can't be updated anymore
+        controls = [
+            control
+            for control in dirty.values()
+            if _attached(control) and not _has_dirty_ancestor(control, dirty)
+        ]
+        if controls:
+            self.page.update(*controls)
+            self.stats.sent += 1
+            self.stats.controls += len(controls)
+
+        with self._lock:
+            after_send, self._after_send = self._after_send, []
+        for finish in after_send:
+            finish()
+
+    @contextmanager
+    def measure(self, label: str = "") -> Iterator[UpdateStats]:
+        """
+        Count the updates of the block, stored in `measured` under `label`
+
+        Updates are sent a tick after they are requested, the counts are
+        final once the updates the block requested were sent.
+        """
+        before = UpdateStats(**vars(self.stats))
+        result = UpdateStats()
+
+        def finish() -> None:
+            vars(result).update(vars(self.stats - before))
+            if label:
+                self.measured[label] = result
+            if DEBUG_UPDATES:
+                print(
+                    f"UI {label or 'interaction'}: {result.sent} updates,"
+                    f" {result.controls} controls,"
+                    f" {result.requested} requested",
+                    file=stderr,
+                )
+
+        try:
+            yield result
+        finally:
+            with self._lock:
+                pending = self._update_scheduled
+                if pending:
+                    self._after_send.append(finish)
+            if not pending:
+                finish()
+
+    def schedule(self, key: Hashable, callback: Callable[[], None]) -> None:
+        with self._lock:
+            self._pending[key] = callback
+            if self._scheduled:
+                return
+            self._scheduled = True
+
+        loop = self.page.loop
+        loop.call_soon_threadsafe(loop.call_later, FRAME_SECONDS, self._flush)
+
+    def _flush(self) -> None:
+        with self._lock:
+            pending, self._pending = self._pending, {}
+            self._scheduled = False
+
+        for callback in pending.values():
+            try:
+                callback()
+            except Exception as e:
+                print(f"Scheduled UI update failed: {e}", file=stderr)
+
+    def on_resize(self, listener: ResizeListener) -> Callable[[], None]:
+        """Register a listener and return a function that removes it"""
+        self._resize_listeners.append(listener)
+
+        def unsubscribe() -> None:
+            if listener in self._resize_listeners:
+                self._resize_listeners.remove(listener)
+
+        return unsubscribe
+
+    def _on_resize(self, e: ft.PageResizeEvent) -> None:
+        self.width, self.height = e.width, e.height
+        self.schedule("resize", self._notify_resize)
+
+    def _notify_resize(self) -> None:
+        with self.measure("resize"):
+            for listener in list(self._resize_listeners):
+                listener(self.width, self.height)
+
+
+def update(*controls: ft.Control) -> None:
+    """Batched replacement for `control.update()`, skips unmounted controls"""
+    attached = [control for control in controls if _attached(control)]
+    if attached:
+        for_page(attached[0].page).request_update(*attached)
+
+
+def measured(label: str) -> Callable[[Callable], Callable]:
+    """
+    Measure every call of an event handler, see `UiScheduler.measure`
+
+    The scheduler is the one of the control the handler is a method of,
+    or of the session the handler runs in.
+    """
+
+    def scheduler_of(args: tuple) -> UiScheduler:
+        if args and isinstance(args[0], ft.BaseControl) and _attached(args[0]):
+            return for_page(args[0].page)
+        return for_page(get_page_ref())
+
+    def decorate(handler: Callable) -> Callable:
+        if inspect.iscoroutinefunction(handler):
+
+            @functools.wraps(handler)
+            async def measured_async(*args: Any, **kwargs: Any) -> Any:
+                with scheduler_of(args).measure(label):
+                    return await handler(*args, **kwargs)
+
+            return measured_async
+
+        @functools.wraps(handler)
+        def measured_sync(*args: Any, **kwargs: Any) -> Any:
+            with scheduler_of(args).measure(label):
+                return handler(*args, **kwargs)
+
+        return measured_sync
+
+    return decorate
+
+
+def for_page(page: ft.Page) -> UiScheduler:
+    """Scheduler of the session `page` belongs to"""
+    scheduler = page.session.store.get(_STORE_KEY)
+    if scheduler is None:
+        scheduler = UiScheduler(page)
+        page.session.store.set(_STORE_KEY, scheduler)
+    return scheduler
@@ -0,0 +1,136 @@
+import weakref
+from collections import OrderedDict
+from collections.abc import Callable
+from urllib.parse import quote
+
+import flet as ft
+
+from atrament import settings
+
+MAX_CACHED_VIEWS: int = 8
+# Memory is accounted in controls, a view's weight is the number of
+# controls in its tree
+MAX_CACHED_CONTROLS: int = 20_000
+
+_STORE_KEY = "atrament.view_cache"
+
+
+def project_route(project_path: str) -> str:
+    return f"/project/{quote(project_path, safe='')}"
+
+
+def history_route(project_path: str) -> str:
+    return f"/history/{quote(project_path, safe='')}"
+
+
+def count_controls(control: ft.Control) -> int:
+    count = 1
+    for child in getattr(control, "controls", None) or []:
+        count += count_controls(child)
+
+    content = getattr(control, "content", None)
+    if isinstance(content, ft.Control):
+        count += count_controls(content)
+    return count
+
+
+class ViewCache:
+    """
+    Rendered views keyed by the route they were rendered for
+
+    Going back to a route reuses its view instead of rendering the
+    section again. Views are evicted least recently used first once
+    there are more than `max_views` of them or their controls add up to
+    more than `max_controls`. Whatever makes a view stale has to
+    invalidate it.
+    """
+
+    def __init__(
+        self,
+        max_views: int = MAX_CACHED_VIEWS,
+        max_controls: int = MAX_CACHED_CONTROLS,
+    ):
+        self.max_views = max_views
+        self.max_controls = max_controls
+        self.size_controls = 0
+        self._views: OrderedDict[str, tuple[ft.View, int]] = OrderedDict()
+
+    def __contains__(self, route: str) -> bool:
+        return route in self._views
+
+    def get(self, route: str) -> ft.View | None:
+        entry = self._views.get(route)
+        if entry is None:
+            return None
+
+        # the view may have grown (e.g. files added) since it was cached
+        view = entry[0]
+        self.put(route, view)
+        return view
+
+    def put(self, route: str, view: ft.View) -> None:
+        self.invalidate(route)
+
+        weight = count_controls(view)
+        if weight > self.max_controls:
+            return
+
+        self._views[route] = (view, weight)
+        self.size_controls += weight
+        self._evict()
+
+    def _evict(self) -> None:
+        while self._views and (
+            len(self._views) > self.max_views
+            or self.size_controls > self.max_controls
+        ):
+            _, (_, weight) = self._views.popitem(last=False)
+            self.size_controls -= weight
+
+    def invalidate(self, route: str) -> None:
+        entry = self._views.pop(route, None)
+        if entry is not None:
+            self.size_controls -= entry[1]
+
+    def invalidate_where(self, predicate: Callable[[str], bool]) -> None:
+        for route in [r for r in self._views if predicate(r)]:
+            self.invalidate(route)
+
+    def clear(self) -> None:
+        self._views.clear()
+        self.size_controls = 0
+
+
+# caches of all live sessions, views belong to the session that rendered
+# them but what makes them stale usually affects everybody
+_caches: "weakref.WeakSet[ViewCache]" = weakref.WeakSet()
+
+
+def for_page(page: ft.Page) -> ViewCache:
+    """View cache of the session `page` belongs to"""
+    cache = page.session.store.get(_STORE_KEY)
+    if cache is None:
+        cache = ViewCache()
+        page.session.store.set(_STORE_KEY, cache)
+        _caches.add(cache)
+    return cache
+
+
+def invalidate(route: str) -> None:
+    """Drop the view of `route` in every session"""
+    for cache in list(_caches):
+        cache.invalidate(route)
+
+
+def invalidate_where(predicate: Callable[[str], bool]) -> None:
+    for cache in list(_caches):
+        cache.invalidate_where(predicate)
+
+
+def _on_settings_change(changes: settings.Changes) -> None:
+    # project views list the models the API keys give access to
+    if any(settings.is_secret(key) for _, key in changes):
+        invalidate_where(lambda route: route.startswith("/project/"))
+
+
+settings.service.subscribe(_on_settings_change)
@@ -0,0 +1,199 @@
+import asyncio
+import os
+from collections.abc import Callable, Iterable
+from enum import Enum
+from pathlib import Path
+from sys import stderr
+
+try:
+    import watchfiles
+except ImportError:  # optional, install the "watch" extra
+    watchfiles = None
+
+# Changes arriving within this window are delivered as one batch
+DEBOUNCE_SECONDS: float = 0.3
+# How often tracked files are checked when native events are unavailable
+POLL_INTERVAL_SECONDS: float = 1.0
+
+
+class FileEvent(Enum):
+    Added = "added"
+    Modified = "modified"
+    Deleted = "deleted"
+
+
+Changes = dict[str, FileEvent]
+ChangeListener = Callable[[Changes], None]
+
+
+def _normalize(path: str) -> str:
+    return os.path.abspath(path)
+
+
+class ProjectWatcher:
+    """
+    Watches a project directory and reports batches of file changes
+
+    Uses native filesystem events (inotify on Linux) through the optional
+    watchfiles package and falls back to polling the tracked files. Events
+    are coalesced per path, so a burst of writes to a file is delivered
+    as a single change.
+    """
+
+    def __init__(self, project_path: Path):
+        self.project_path = project_path
+        self._listeners: list[ChangeListener] = []
+        # path -> (mtime_ns, size), None when the file is missing
+        self._tracked: dict[str, tuple[int, int] | None] = {}
+        self._pending: Changes = {}
+        self._flush_handle: asyncio.TimerHandle | None = None
+        self._task: asyncio.Task | None = None
+        self._stop_event: asyncio.Event | None = None
+
+    @property
+    def running(self) -> bool:
+        return self._task is not None and not self._task.done()
+
+    @property
+    def has_listeners(self) -> bool:
+        return bool(self._listeners)
+
+    def subscribe(self, listener: ChangeListener) -> Callable[[], None]:
+        self._listeners.append(listener)
+
+        def unsubscribe() -> None:
+            if listener in self._listeners:
+                self._listeners.remove(listener)
+
+        return unsubscribe
+
+    def track(self, paths: Iterable[str]) -> None:
+        """Files the polling fallback checks, native events see everything"""
+        for p in map(_normalize, paths):
+            if p not in self._tracked:
+                self._tracked[p] = self._stat(p)
+
+    @staticmethod
+    def _stat(path: str) -> tuple[int, int] | None:
+        try:
+            stat = os.stat(path)
+        except OSError:
+            return None
+        return stat.st_mtime_ns, stat.st_size
+
+    def start(self) -> None:
+        if self.running:
+            return
+
+        self._stop_event = asyncio.Event()
+        if watchfiles is not None:
+            self._task = asyncio.create_task(self._watch_native())
+        else:
+            self._task = asyncio.create_task(self._watch_polling())
+
+    def stop(self) -> None:
+        if self._stop_event is not None:
+            self._stop_event.set()
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+        if self._flush_handle is not None:
+            self._flush_handle.cancel()
+            self._flush_handle = None
+        self._pending.clear()
+
+    def _record(self, path: str, event: FileEvent) -> None:
+        previous = self._pending.get(path)
+        # a file created and modified within one batch is still new
+        if previous is FileEvent.Added and event is FileEvent.Modified:
+            event = FileEvent.Added
+        self._pending[path] = event
+
+        if self._flush_handle is None:
+            self._flush_handle = asyncio.get_running_loop().call_later(
+                DEBOUNCE_SECONDS, self._flush
+            )
+
+    def _flush(self) -> None:
+        self._flush_handle = None
+        changes, self._pending = self._pending, {}
+        if not changes:
+            return
+
+        for listener in list(self._listeners):
+            try:
+                listener(changes)
+            except Exception as e:
+                print(f"File change listener failed: {e}", file=stderr)
+
+    async def _watch_native(self) -> None:
+        assert watchfiles is not None and self._stop_event is not None
+        events = {
+            watchfiles.Change.added: FileEvent.Added,
+            watchfiles.Change.modified: FileEvent.Modified,
+            watchfiles.Change.deleted: FileEvent.Deleted,
+        }
+
+        try:
+            async for batch in watchfiles.awatch(
+                self.project_path, stop_event=self._stop_event
+            ):
+                for change, path in batch:
+                    self._record(_normalize(path), events[change])
+        except Exception as e:
+            # e.g. inotify watch limit reached, keep going by polling
+            print(f"Native file watching failed, polling: {e}", file=stderr)
+            await self._watch_polling()
+
+    async def _watch_polling(self) -> None:
+        while True:
+            await asyncio.sleep(POLL_INTERVAL_SECONDS)
+
+            for p, previous in list(self._tracked.items()):
+                current = self._stat(p)
+                if current == previous:
+                    continue
+
+                self._tracked[p] = current
+                if current is None:
+                    self._record(p, FileEvent.Deleted)
+                elif previous is None:
+                    self._record(p, FileEvent.Added)
+                else:
+                    self._record(p, FileEvent.Modified)
+
+
+_watchers: dict[Path, ProjectWatcher] = {}
+
+
+def watch(
+    project_path: Path, listener: ChangeListener, paths: Iterable[str] = ()
+) -> Callable[[], None]:
+    """
+    Subscribe `listener` to changes in the project
+
+    The project's watcher is started with its first listener and stopped
+    when the returned unsubscribe function removes the last one.
+    """
+    watcher = _watchers.get(project_path)
+    if watcher is None:
+        watcher = _watchers[project_path] = ProjectWatcher(project_path)
+
+    watcher.track(paths)
+    unsubscribe = watcher.subscribe(listener)
+    watcher.start()
+
+    def stop() -> None:
+        unsubscribe()
+        if not watcher.has_listeners:
+            watcher.stop()
+            _watchers.pop(project_path, None)
+
+    return stop
+
+
+def track(project_path: Path, paths: Iterable[str]) -> None:
+    """Add files to the polling fallback of a running project watcher"""
+    watcher = _watchers.get(project_path)
+    if watcher is not None:
+        watcher.track(paths)
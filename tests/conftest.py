@@ -0,0 +1,6 @@
+import os
+import tempfile
+
+# atrament keeps backups, blobs and settings under the user data dir, which
+# is resolved on import, point it somewhere disposable first
+os.environ["XDG_DATA_HOME"] = tempfile.mkdtemp(prefix="atrament-tests-")
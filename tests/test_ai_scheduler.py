@@ -0,0 +1,193 @@
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+
+from atrament import ai, rate_limits
+
+
+class Throttled(Exception):
+    status_code = 429
+
+    def __init__(self, retry_after: float):
+        super().__init__("429 Too Many Requests")
+        self.response = SimpleNamespace(
+            headers={"retry-after": str(retry_after)}
+        )
+
+
+@pytest.fixture(autouse=True)
+def no_jitter(monkeypatch: pytest.MonkeyPatch) -> None:
+    # the backoff is then exactly the Retry-After of the provider
+    monkeypatch.setattr(ai, "BASE_RETRY_DELAY", 0.0)
+
+
+def test_backoff_frees_the_slot():
+    async def main():
+        scheduler = ai.RequestScheduler()
+        scheduler.limiter("m").limit = 1
+        events = []
+        attempts = 0
+
+        async def throttled_once():
+            nonlocal attempts
+            attempts += 1
+            events.append(f"a{attempts}")
+            if attempts == 1:
+                raise Throttled(0.2)
+            return "a"
+
+        async def other():
+            events.append("b")
+            return "b"
+
+        first = asyncio.create_task(scheduler.run("m", throttled_once))
+        await asyncio.sleep(0.05)
+        assert await scheduler.run("m", other) == "b"
+        assert await first == "a"
+
+        assert events == ["a1", "b", "a2"]
+
+    asyncio.run(main())
+
+
+def test_throttled_burst_halves_the_limit_once():
+    async def main():
+        scheduler = ai.RequestScheduler()
+        limiter = scheduler.limiter("m")
+        limiter.limit = 8
+        throttled = set()
+
+        def request(i: int):
+            async def call():
+                await asyncio.sleep(0.01)
+                if i not in throttled:
+                    throttled.add(i)
+                    raise Throttled(0.05)
+                return i
+
+            return call
+
+        results = await asyncio.gather(
+            *(scheduler.run("m", request(i)) for i in range(4))
+        )
+
+        assert results == [0, 1, 2, 3]
+        # one halving, then grown by the successful retries
+        assert 4 <= limiter.limit < 5
+
+    asyncio.run(main())
+
+
+def test_rate_limits_apply_to_existing_limiters():
+    scheduler = ai.RequestScheduler()
+    scheduler.limiter("gpt-4o")
+
+    scheduler.set_rate_limits(rate_limits.parse("gpt-4o=60/1000; *=/500"))
+
+    limiter = scheduler.limiter("gpt-4o")
+    assert limiter.requests is not None and limiter.requests.capacity == 60
+    assert limiter.tokens is not None and limiter.tokens.capacity == 1000
+    other = scheduler.limiter("other")
+    assert other.requests is None
+    assert other.tokens is not None and other.tokens.capacity == 500
+
+
+def test_rate_limits_come_from_the_settings():
+    client = ai.AiClinet()
+    client.scheduler.limiter("gpt-4o")
+
+    client.on_settings_change(
+        {("Performance", "rate-limits"): "gpt-4o=60/1000; *=/500"}
+    )
+
+    limiter = client.scheduler.limiter("gpt-4o")
+    assert limiter.requests is not None and limiter.requests.capacity == 60
+    assert limiter.tokens is not None and limiter.tokens.capacity == 1000
+    other = client.scheduler.limiter("other")
+    assert other.requests is None
+    assert other.tokens is not None and other.tokens.capacity == 500
+
+
+class Unavailable(Exception):
+    status_code = 503
+
+
+def test_server_errors_are_retried_other_errors_are_not():
+    async def main():
+        scheduler = ai.RequestScheduler()
+        attempts = 0
+
+        async def flaky():
+            nonlocal attempts
+            attempts += 1
+            if attempts < 3:
+                raise Unavailable("503 Service Unavailable")
+            return "ok"
+
+        assert await scheduler.run("m", flaky) == "ok"
+        assert attempts == 3
+
+        async def broken():
+            nonlocal attempts
+            attempts += 1
+            raise ValueError("bad request")
+
+        attempts = 0
+        with pytest.raises(ValueError):
+            await scheduler.run("m", broken)
+        assert attempts == 1
+
+    asyncio.run(main())
+
+
+def test_retries_give_up_after_max_retries(monkeypatch):
+    monkeypatch.setattr(ai, "MAX_RETRIES", 2)
+
+    async def main():
+        scheduler = ai.RequestScheduler()
+        attempts = 0
+
+        async def throttled():
+            nonlocal attempts
+            attempts += 1
+            raise Throttled(0)
+
+        with pytest.raises(ai.ThrottledError):
+            await scheduler.run("m", throttled)
+        assert attempts == 3
+        # freed for the requests that come next
+        assert scheduler.limiter("m").in_flight == 0
+
+    asyncio.run(main())
+
+
+def test_successes_grow_the_limit_additively():
+    async def main():
+        scheduler = ai.RequestScheduler(max_concurrency=5)
+        limiter = scheduler.limiter("m")
+        limiter.limit = 4
+
+        async def call():
+            return None
+
+        for _ in range(4):
+            await scheduler.run("m", call)
+        assert 4.9 < limiter.limit <= 5
+
+        for _ in range(10):
+            await scheduler.run("m", call)
+        assert limiter.limit == 5
+
+    asyncio.run(main())
+
+
+def test_retry_after_accepts_seconds_and_dates():
+    assert ai._retry_after(Throttled(1.5)) == 1.5
+
+    error = Throttled(0)
+    error.response.headers = {"retry-after": "Wed, 21 Oct 2015 07:28:00 GMT"}
+    assert ai._retry_after(error) == 0.0
+    error.response.headers = {"retry-after-ms": "250"}
+    assert ai._retry_after(error) == 0.25
+    assert ai._retry_after(ValueError()) is None
@@ -0,0 +1,129 @@
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+from anthropic import AsyncAnthropic
+
+from atrament import ai, settings
+
+
+class Messages:
+    """Records the requests, every reply reads the cached context"""
+
+    def __init__(self) -> None:
+        self.requests: list[dict] = []
+        self.streamed = False
+
+    def reply(self, params: dict):
+        self.requests.append(params)
+        return SimpleNamespace(
+            content=[
+                SimpleNamespace(type="thinking", thinking="..."),
+                SimpleNamespace(type="text", text='{"a.py": "A"}'),
+            ],
+            usage=SimpleNamespace(
+                input_tokens=10,
+                cache_read_input_tokens=1000,
+                cache_creation_input_tokens=None,
+                output_tokens=5,
+            ),
+        )
+
+    async def create(self, **params):
+        return self.reply(params)
+
+    def stream(self, **params):
+        messages = self
+
+        class Stream:
+            async def __aenter__(self):
+                messages.streamed = True
+                return self
+
+            async def __aexit__(self, *exc):
+                return False
+
+            async def get_final_message(self):
+                return messages.reply(params)
+
+        return Stream()
+
+
+@pytest.fixture
+def messages(monkeypatch: pytest.MonkeyPatch) -> Messages:
+    messages = Messages()
+    anthropic_client = AsyncAnthropic(api_key="test")
+    monkeypatch.setattr(anthropic_client, "messages", messages)
+
+    async def get_client(company):
+        return anthropic_client
+
+    monkeypatch.setattr(ai.client, "get_client", get_client)
+    return messages
+
+
+def stream_responses(monkeypatch: pytest.MonkeyPatch, stream: bool) -> None:
+    current = settings.service.current
+
+    def patched(section, key):
+        if (section, key) == ("Performance", "stream-responses"):
+            return stream
+        return current(section, key)
+
+    monkeypatch.setattr(settings.service, "current", patched)
+
+
+def test_context_is_a_cached_system_block(messages, monkeypatch):
+    stream_responses(monkeypatch, False)
+
+    response = asyncio.run(
+        ai.client.prompt(
+            ai.AiCompany.Anthropic, "edit a.py", "claude-test", "sources"
+        )
+    )
+
+    (request,) = messages.requests
+    assert request["system"] == [
+        {
+            "type": "text",
+            "text": "sources",
+            "cache_control": {"type": "ephemeral"},
+        }
+    ]
+    assert request["messages"] == [{"role": "user", "content": "edit a.py"}]
+    assert response.text == '{"a.py": "A"}'
+    # cached tokens are part of the input, unlike in Anthropic's usage
+    assert response.input_tokens == 1010
+    assert response.cached_tokens == 1000
+    assert response.output_tokens == 5
+
+
+def test_responses_are_streamed_when_enabled(messages, monkeypatch):
+    stream_responses(monkeypatch, True)
+
+    asyncio.run(
+        ai.client.prompt(ai.AiCompany.Anthropic, "edit a.py", "claude-test")
+    )
+
+    assert messages.streamed
+    assert messages.requests[0]["system"] is ai.anthropic.NOT_GIVEN
+
+
+def test_dated_model_ids_are_listed(monkeypatch):
+    wanted = next(iter(ai.WANTED_ANTHROPIC_MODELS))
+
+    async def models(limit):
+        for model_id in (f"{wanted}-20250929", f"{wanted}x", "claude-2"):
+            yield SimpleNamespace(id=model_id)
+
+    anthropic_client = AsyncAnthropic(api_key="test")
+    monkeypatch.setattr(
+        anthropic_client, "models", SimpleNamespace(list=models)
+    )
+
+    async def get_client(company):
+        return anthropic_client
+
+    monkeypatch.setattr(ai.client, "get_client", get_client)
+
+    assert asyncio.run(ai._get_anthropic_models()) == [f"{wanted}-20250929"]
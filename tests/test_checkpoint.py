@@ -0,0 +1,97 @@
+import asyncio
+import json
+from pathlib import Path
+
+import pytest
+
+from atrament import ai, engine, storage
+
+
+class Model:
+    """Upper-cases the files sent, fails requests holding `failing`"""
+
+    def __init__(self) -> None:
+        self.sent: list[str] = []
+        self.failing = {"t1.txt"}
+
+    async def prompt(self, company, text, model, context=None):
+        part = text.split("TARGET FILES:\n", 1)[1].lstrip()
+        files, _ = json.JSONDecoder().raw_decode(part)
+        names = [Path(p).name for p in files]
+        self.sent.extend(names)
+        if self.failing.intersection(names):
+            raise RuntimeError("connection reset")
+        return ai.AiResponse(
+            text=json.dumps({p: c.upper() for p, c in files.items()})
+        )
+
+    def recover(self) -> None:
+        self.failing.clear()
+        self.sent.clear()
+
+
+@pytest.fixture
+def model(monkeypatch: pytest.MonkeyPatch) -> Model:
+    model = Model()
+    monkeypatch.setattr(ai.client, "prompt", model.prompt)
+    return model
+
+
+def make_job(project: Path, instructions: str = "upper-case") -> engine.Job:
+    target_files = []
+    for i in range(3):
+        path = project / f"t{i}.txt"
+        if not path.exists():
+            path.write_text(f"target {i}")
+        target_files.append(str(path))
+    return engine.Job(
+        project_path=project,
+        project_name=project.name,
+        instructions=instructions,
+        company=ai.AiCompany.OpenAI,
+        model="test",
+        target_files=target_files,
+        shard_size=1,
+    )
+
+
+def test_retry_sends_only_the_files_that_were_not_applied(tmp_path, model):
+    with pytest.raises(RuntimeError):
+        asyncio.run(engine.run_job(make_job(tmp_path)))
+    assert (tmp_path / "t0.txt").read_text() == "TARGET 0"
+    assert (tmp_path / "t1.txt").read_text() == "target 1"
+
+    model.recover()
+    job = make_job(tmp_path)
+    asyncio.run(engine.run_job(job))
+
+    assert model.sent == ["t1.txt"]
+    assert (tmp_path / "t1.txt").read_text() == "TARGET 1"
+    assert job.checkpoint_path is not None
+    assert not job.checkpoint_path.exists()
+    # the backup of the failed attempt still holds the originals
+    manifest = storage.latest_run(storage.backup_dir_for(tmp_path))
+    assert manifest is not None
+    assert storage.read_blob(manifest.files["t0.txt"]) == "target 0"
+
+
+def test_checkpoint_of_another_run_is_ignored(tmp_path, model):
+    with pytest.raises(RuntimeError):
+        asyncio.run(engine.run_job(make_job(tmp_path)))
+
+    model.recover()
+    asyncio.run(engine.run_job(make_job(tmp_path, "shout")))
+
+    assert sorted(model.sent) == ["t0.txt", "t1.txt", "t2.txt"]
+
+
+def test_file_changed_since_it_was_applied_is_sent_again(tmp_path, model):
+    with pytest.raises(RuntimeError):
+        asyncio.run(engine.run_job(make_job(tmp_path)))
+    (tmp_path / "t0.txt").write_text("edited by hand")
+
+    model.recover()
+    asyncio.run(engine.run_job(make_job(tmp_path)))
+
+    assert sorted(model.sent) == ["t0.txt", "t1.txt"]
+    assert (tmp_path / "t0.txt").read_text() == "EDITED BY HAND"
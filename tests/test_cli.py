@@ -0,0 +1,87 @@
+import asyncio
+import json
+from pathlib import Path
+
+import pytest
+
+from atrament import ai, cli, engine, retention, settings
+
+
+@pytest.fixture
+def project(tmp_path: Path, monkeypatch: pytest.MonkeyPatch) -> Path:
+    target = tmp_path / "t.txt"
+    target.write_text("target")
+    data = {
+        "metadata": {"name": tmp_path.name},
+        "workdata": {
+            "ai-configuration": {
+                "prompt": "upper-case everything",
+                "model": "",
+            },
+            "files": {"target-files": [str(target)], "source-files": []},
+        },
+    }
+    (tmp_path / engine.PROJECT_FILE_NAME).write_text(json.dumps(data))
+
+    async def prompt(company, text, model, context=None):
+        part = text.split("TARGET FILES:\n", 1)[1].lstrip()
+        files, _ = json.JSONDecoder().raw_decode(part)
+        return ai.AiResponse(
+            text=json.dumps({p: c.upper() for p, c in files.items()})
+        )
+
+    monkeypatch.setattr(ai.client, "prompt", prompt)
+    return tmp_path
+
+
+@pytest.fixture
+def collections(monkeypatch: pytest.MonkeyPatch) -> list[None]:
+    calls: list[None] = []
+
+    async def collect(policy=None):
+        calls.append(None)
+        return retention.RetentionReport()
+
+    monkeypatch.setattr(retention.daemon, "collect", collect)
+    return calls
+
+
+def test_batch_runs_the_project(project, collections):
+    code = cli.main([str(project), "-m", "OpenAI:test"])
+
+    assert code == cli.EXIT_OK
+    assert (project / "t.txt").read_text() == "TARGET"
+    # cleaning up touches every project of the user, it's opt-in
+    assert collections == []
+
+
+def test_cleanup_runs_after_the_batch_when_asked(project, collections):
+    cli.main([str(project), "-m", "OpenAI:test", "--cleanup"])
+
+    assert collections == [None]
+
+
+def test_failing_project_fails_the_batch(tmp_path, project, collections):
+    missing = tmp_path / "missing"
+
+    code = cli.main([str(project), str(missing), "-m", "OpenAI:test"])
+
+    assert code == cli.EXIT_FAILURE
+    assert (project / "t.txt").read_text() == "TARGET"
+
+
+def test_api_keys_fall_back_to_the_environment(monkeypatch):
+    stored = settings.service.get
+
+    async def get(section, key):
+        # no keyring backend
+        return None if key == "api-key" else await stored(section, key)
+
+    monkeypatch.setattr(settings.service, "get", get)
+    monkeypatch.setenv("OPENAI_API_KEY", "sk-from-env")
+    monkeypatch.delenv("ANTHROPIC_API_KEY", raising=False)
+
+    client = asyncio.run(ai.client.get_client(ai.AiCompany.OpenAI))
+    assert client.api_key == "sk-from-env"
+    with pytest.raises(ValueError, match="ANTHROPIC_API_KEY"):
+        asyncio.run(ai.client.get_client(ai.AiCompany.Anthropic))
@@ -0,0 +1,88 @@
+import asyncio
+import json
+from pathlib import Path
+
+import pytest
+
+from atrament import ai, engine, storage
+
+
+@pytest.fixture
+def project(tmp_path: Path, monkeypatch: pytest.MonkeyPatch) -> Path:
+    for i in range(3):
+        (tmp_path / f"t{i}.txt").write_text(f"target {i}")
+
+    async def prompt(company, text, model, context=None):
+        await asyncio.sleep(0.01)
+        part = text.split("TARGET FILES:\n", 1)[1].lstrip()
+        files, _ = json.JSONDecoder().raw_decode(part)
+        return ai.AiResponse(
+            text=json.dumps({p: c.upper() for p, c in files.items()})
+        )
+
+    monkeypatch.setattr(ai.client, "prompt", prompt)
+    return tmp_path
+
+
+def make_job(project: Path, **options) -> engine.Job:
+    return engine.Job(
+        project_path=project,
+        project_name=project.name,
+        instructions="upper-case everything",
+        company=ai.AiCompany.OpenAI,
+        model="test",
+        target_files=[str(project / f"t{i}.txt") for i in range(3)],
+        **options,
+    )
+
+
+def test_run_applies_the_response_and_backs_up_the_originals(project):
+    result = asyncio.run(engine.run_job(make_job(project)))
+
+    assert sorted(result.changed_files) == [
+        str(project / f"t{i}.txt") for i in range(3)
+    ]
+    assert (project / "t0.txt").read_text() == "TARGET 0"
+    manifest = storage.latest_run(storage.backup_dir_for(project))
+    assert manifest is not None
+    assert manifest.status == "done"
+    assert storage.read_blob(manifest.files["t0.txt"]) == "target 0"
+
+
+def test_sharded_run_reports_every_stage_once(project):
+    stages: list[engine.Stage] = []
+
+    async def on_stage(_job: engine.Job, stage: engine.Stage) -> None:
+        stages.append(stage)
+
+    job = make_job(project, shard_size=1, max_request_bytes=None)
+    asyncio.run(engine.run_job(job, engine.JobHooks(on_stage=on_stage)))
+
+    assert stages == [
+        engine.Stage.Load,
+        engine.Stage.Backup,
+        engine.Stage.Prompt,
+        engine.Stage.Apply,
+        engine.Stage.Done,
+    ]
+
+
+def test_failure_is_reported_with_its_stage(project, monkeypatch):
+    errors = []
+
+    async def prompt(company, text, model, context=None):
+        raise RuntimeError("connection reset")
+
+    async def on_error(_job, stage, error):
+        errors.append((stage, str(error)))
+
+    monkeypatch.setattr(ai.client, "prompt", prompt)
+    with pytest.raises(RuntimeError):
+        asyncio.run(
+            engine.run_job(
+                make_job(project), engine.JobHooks(on_error=on_error)
+            )
+        )
+
+    assert errors == [(engine.Stage.Prompt, "connection reset")]
+    assert (project / "t0.txt").read_text() == "target 0"
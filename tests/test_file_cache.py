@@ -0,0 +1,71 @@
+import asyncio
+import json
+from pathlib import Path
+
+import pytest
+
+from atrament import ai, engine, file_cache
+from atrament.checkpoint import content_hash
+
+
+def test_digest_is_remembered_until_the_file_changes(tmp_path: Path):
+    path = tmp_path / "a.txt"
+    path.write_text("one")
+    cache = file_cache.FileCache(digest_path=tmp_path / "digests.json")
+
+    assert cache.digest(str(path), "one") == content_hash("one")
+    # an unchanged file isn't hashed again, even after a restart
+    cache.save()
+    restarted = file_cache.FileCache(digest_path=tmp_path / "digests.json")
+    assert restarted.digest(str(path), "ignored") == content_hash("one")
+
+    path.write_text("changed")
+    assert restarted.digest(str(path), "changed") == content_hash("changed")
+
+
+def test_read_serves_unchanged_files_from_memory(tmp_path: Path):
+    path = tmp_path / "a.txt"
+    path.write_text("one")
+    cache = file_cache.FileCache()
+
+    assert asyncio.run(cache.read(str(path))) == "one"
+    assert cache.size_bytes > 0
+    path.write_text("two")
+    assert asyncio.run(cache.read(str(path))) == "two"
+
+
+def test_raising_the_file_limit_changes_the_run_signature(
+    tmp_path: Path, monkeypatch: pytest.MonkeyPatch
+):
+    (tmp_path / "t.txt").write_text("target")
+    source = tmp_path / "s.txt"
+    source.write_text("x" * 100)
+
+    async def prompt(company, text, model, context=None):
+        raise RuntimeError("model unavailable")
+
+    monkeypatch.setattr(ai.client, "prompt", prompt)
+
+    def failed_run(max_file_bytes: int) -> str:
+        job = engine.Job(
+            project_path=tmp_path,
+            project_name=tmp_path.name,
+            instructions="translate",
+            company=ai.AiCompany.OpenAI,
+            model="test",
+            target_files=[str(tmp_path / "t.txt")],
+            source_files=[str(source)],
+            max_file_bytes=max_file_bytes,
+        )
+        with pytest.raises(RuntimeError):
+            asyncio.run(engine.run_job(job))
+        assert job.checkpoint_path is not None
+        return json.loads(job.checkpoint_path.read_text())["signature"]
+
+    truncated = failed_run(10)
+    complete = failed_run(1000)
+
+    # the failed attempt sent a different source, it can't be resumed
+    assert truncated != complete
+    cache = file_cache.for_project(tmp_path.name)
+    assert cache.digest(str(source), "x" * 100) == content_hash("x" * 100)
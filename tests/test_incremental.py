@@ -0,0 +1,75 @@
+import asyncio
+import json
+from pathlib import Path
+
+import pytest
+
+from atrament import ai, engine, file_cache, storage
+
+
+@pytest.fixture
+def project(tmp_path: Path) -> Path:
+    for i in range(2):
+        (tmp_path / f"t{i}.txt").write_text(f"target {i}")
+    (tmp_path / "s.txt").write_text("source")
+    return tmp_path
+
+
+@pytest.fixture
+def sent(monkeypatch: pytest.MonkeyPatch) -> list[list[str]]:
+    """Names of the files sent per request, the model upper-cases them"""
+    requests: list[list[str]] = []
+
+    async def prompt(company, text, model, context=None):
+        part = text.split("TARGET FILES:\n", 1)[1]
+        files = json.loads(part.split("\n\nUSER INSTRUCTIONS:", 1)[0])
+        requests.append(sorted(Path(p).name for p in files))
+        return ai.AiResponse(
+            text=json.dumps({p: c.upper() for p, c in files.items()})
+        )
+
+    monkeypatch.setattr(ai.client, "prompt", prompt)
+    return requests
+
+
+def make_job(project: Path, incremental: bool = False) -> engine.Job:
+    return engine.Job(
+        project_path=project,
+        project_name=project.name,
+        instructions="upper-case everything",
+        company=ai.AiCompany.OpenAI,
+        model="test",
+        target_files=[str(project / "t0.txt"), str(project / "t1.txt")],
+        source_files=[str(project / "s.txt")],
+        incremental=incremental,
+    )
+
+
+def test_incremental_skips_files_holding_their_output(project, sent):
+    asyncio.run(engine.run_job(make_job(project)))
+    result = asyncio.run(engine.run_job(make_job(project, incremental=True)))
+
+    assert sent == [["t0.txt", "t1.txt"]]
+    assert len(result.up_to_date_files) == 2
+
+
+def test_rejected_output_is_not_reused(project, sent):
+    asyncio.run(engine.run_job(make_job(project)))
+    # the second run sends the original again and produces the same output
+    (project / "t0.txt").write_text("target 0")
+    asyncio.run(engine.run_job(make_job(project)))
+    latest = storage.latest_run(storage.backup_dir_for(project))
+    assert latest is not None
+    asyncio.run(
+        engine.reject_files(
+            project, latest, ["t0.txt"], file_cache.for_project(project)
+        )
+    )
+    assert (project / "t0.txt").read_text() == "target 0"
+
+    sent.clear()
+    result = asyncio.run(engine.run_job(make_job(project, incremental=True)))
+
+    # the output of the first run is identical to the rejected one
+    assert result.reused_files == []
+    assert sent == [["t0.txt"]]
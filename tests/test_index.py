@@ -0,0 +1,67 @@
+from pathlib import Path
+
+from atrament import index
+from atrament.index import SourceIndex
+
+
+def write_sources(project: Path) -> dict[str, str]:
+    sources = {
+        "billing.py": "def charge_invoice(invoice):\n    total = invoice.total\n",
+        "parser.py": "def parse_config(text):\n    return loads(text)\n",
+        "notes.txt": "unrelated notes\n" * 3,
+    }
+    files = {}
+    for name, text in sources.items():
+        path = project / name
+        path.write_text(text)
+        files[str(path)] = text
+    return files
+
+
+def test_identifiers_are_split_into_their_words():
+    terms = index.tokenize("loadFilesContent parse_config")
+
+    assert "loadfilescontent" in terms
+    assert {"load", "files", "content", "parse", "config"} <= set(terms)
+
+
+def test_sources_within_the_budget_are_sent_whole(tmp_path):
+    files = write_sources(tmp_path)
+    source_index = SourceIndex(tmp_path / "index.json")
+    source_index.update(files)
+
+    assert source_index.select("invoice", files, 10_000) is files
+
+
+def test_most_relevant_chunks_fill_the_budget(tmp_path, monkeypatch):
+    monkeypatch.setattr(index, "CHUNK_LINES", 1)
+    files = write_sources(tmp_path)
+    source_index = SourceIndex(tmp_path / "index.json")
+    source_index.update(files)
+
+    selected = source_index.select("charge the invoice total", files, 20)
+
+    billing = str(tmp_path / "billing.py")
+    assert set(selected) == {f"{billing}:1-1", f"{billing}:2-2"}
+    assert selected[f"{billing}:1-1"] == "def charge_invoice(invoice):\n"
+
+
+def test_only_changed_files_are_indexed_again(tmp_path):
+    files = write_sources(tmp_path)
+    path = tmp_path / "index.json"
+    source_index = SourceIndex(path)
+    assert source_index.update(files)
+    source_index.save()
+
+    loaded = SourceIndex.load(path)
+    assert not loaded.update(files)
+
+    billing = tmp_path / "billing.py"
+    billing.write_text("def refund_payment(payment):\n    pass\n")
+    files[str(billing)] = billing.read_text()
+    assert loaded.update(files)
+    assert loaded.rank("refund")[0][1].path == str(billing)
+
+    del files[str(billing)]
+    assert loaded.update(files)
+    assert all(chunk.path != str(billing) for _, chunk in loaded.rank("x"))
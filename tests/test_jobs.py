@@ -0,0 +1,91 @@
+import asyncio
+import json
+from pathlib import Path
+
+import pytest
+
+from atrament import ai, engine, jobs
+
+
+@pytest.fixture
+def project(tmp_path: Path, monkeypatch: pytest.MonkeyPatch) -> Path:
+    (tmp_path / "t.txt").write_text("target")
+
+    async def prompt(company, text, model, context=None):
+        part = text.split("TARGET FILES:\n", 1)[1].lstrip()
+        files, _ = json.JSONDecoder().raw_decode(part)
+        await asyncio.sleep(0.01)
+        return ai.AiResponse(
+            text=json.dumps({p: c.upper() for p, c in files.items()})
+        )
+
+    monkeypatch.setattr(ai.client, "prompt", prompt)
+    return tmp_path
+
+
+def make_job(project: Path) -> engine.Job:
+    return engine.Job(
+        project_path=project,
+        project_name=project.name,
+        instructions="upper-case everything",
+        company=ai.AiCompany.OpenAI,
+        model="test",
+        target_files=[str(project / "t.txt")],
+    )
+
+
+def test_submitted_job_runs_in_the_background(project):
+    statuses: list[jobs.JobStatus] = []
+
+    async def main():
+        queue = jobs.JobQueue()
+        queue.subscribe(lambda queued: statuses.append(queued.status))
+        queued = queue.submit(make_job(project))
+        assert queue.active_for(project) is queued
+
+        result = await queued.wait()
+        assert result.changed_files == [str(project / "t.txt")]
+        assert queue.active_for(project) is None
+        assert queue.latest_for(project) is queued
+
+    asyncio.run(main())
+
+    assert statuses[0] == jobs.JobStatus.Queued
+    assert statuses[-1] == jobs.JobStatus.Done
+    assert (project / "t.txt").read_text() == "TARGET"
+
+
+def test_a_project_runs_one_job_at_a_time(project):
+    async def main():
+        queue = jobs.JobQueue()
+        queued = queue.submit(make_job(project))
+        with pytest.raises(RuntimeError):
+            queue.submit(make_job(project))
+        await queued.wait()
+
+        # a finished job makes room for the next one
+        await queue.submit(make_job(project)).wait()
+        assert len(queue.jobs()) == 1
+
+    asyncio.run(main())
+
+
+def test_settings_changes_resize_in_order():
+    async def main():
+        queue = jobs.JobQueue(max_concurrent_jobs=1)
+        limit = queue._request_limit(ai.AiCompany.OpenAI)
+
+        queue.on_settings_change(
+            {
+                ("Performance", "max-concurrent-jobs"): 2,
+                ("Performance", "max-requests-per-company"): 3,
+            }
+        )
+        queue.on_settings_change({("Performance", "max-concurrent-jobs"): 5})
+        assert queue._resizing is not None
+        await queue._resizing
+
+        assert queue._job_limit.size == 5
+        assert limit.size == 3
+
+    asyncio.run(main())
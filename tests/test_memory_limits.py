@@ -0,0 +1,88 @@
+import asyncio
+import json
+from pathlib import Path
+
+import pytest
+
+from atrament import ai, engine
+
+
+@pytest.fixture
+def in_flight(monkeypatch: pytest.MonkeyPatch) -> list[int]:
+    """Requests in flight whenever one is sent, the model upper-cases"""
+    counts: list[int] = []
+    current = 0
+
+    async def prompt(company, text, model, context=None):
+        nonlocal current
+        current += 1
+        counts.append(current)
+        await asyncio.sleep(0.01)
+        current -= 1
+
+        part = text.split("TARGET FILES:\n", 1)[1]
+        files = json.loads(part.split("\n\nUSER INSTRUCTIONS:", 1)[0])
+        return ai.AiResponse(
+            text=json.dumps({p: c.upper() for p, c in files.items()})
+        )
+
+    monkeypatch.setattr(ai.client, "prompt", prompt)
+    return counts
+
+
+def make_job(project: Path, targets: int, **limits) -> engine.Job:
+    target_files = []
+    for i in range(targets):
+        path = project / f"t{i}.txt"
+        path.write_text(f"target {i}")
+        target_files.append(str(path))
+    return engine.Job(
+        project_path=project,
+        project_name=project.name,
+        instructions="upper-case everything",
+        company=ai.AiCompany.OpenAI,
+        model="test",
+        target_files=target_files,
+        **limits,
+    )
+
+
+def test_oversized_target_fails_before_anything_is_sent(tmp_path, in_flight):
+    job = make_job(tmp_path, 2, max_file_bytes=5)
+
+    with pytest.raises(engine.FileTooLargeError):
+        asyncio.run(engine.run_job(job))
+    assert in_flight == []
+
+
+def test_oversized_source_is_truncated(tmp_path, in_flight):
+    source = tmp_path / "s.txt"
+    source.write_text("s" * 100)
+    job = make_job(tmp_path, 1, max_file_bytes=50)
+    job.source_files = [str(source)]
+
+    result = asyncio.run(engine.run_job(job))
+
+    assert result.stats.truncated_files == [str(source)]
+    assert (tmp_path / "t0.txt").read_text() == "TARGET 0"
+
+
+def test_request_limit_shards_and_bounds_requests_in_flight(
+    tmp_path, in_flight
+):
+    job = make_job(tmp_path, 6, max_request_bytes=10)
+
+    asyncio.run(engine.run_job(job))
+
+    assert len(in_flight) == 6
+    assert max(in_flight) <= engine.MAX_SHARDS_IN_FLIGHT
+    for i in range(6):
+        assert (tmp_path / f"t{i}.txt").read_text() == f"TARGET {i}"
+
+
+def test_shards_without_request_limit_run_at_once(tmp_path, in_flight):
+    job = make_job(tmp_path, 4, shard_size=1, max_request_bytes=None)
+
+    asyncio.run(engine.run_job(job))
+
+    assert max(in_flight) == 4
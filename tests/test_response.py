@@ -0,0 +1,69 @@
+import pytest
+
+from atrament.response import parse_response
+
+
+def test_well_formed_response_needs_no_repair():
+    parsed = parse_response('{"a.py": "1", "b.py": "2"}', ["a.py", "b.py"])
+
+    assert parsed.files == {"a.py": "1", "b.py": "2"}
+    assert not parsed.repaired
+    assert parsed.lost == []
+
+
+def test_fences_and_text_around_the_object_are_dropped():
+    text = 'Here you go:\n```json\n{"a.py": "x = {}"}\n```\nDone.'
+
+    parsed = parse_response(text, ["a.py"])
+
+    assert parsed.files == {"a.py": "x = {}"}
+    assert parsed.repaired
+
+
+def test_cut_off_response_keeps_the_complete_entries():
+    parsed = parse_response('{"a.py": "1", "b.py": "2', ["a.py", "b.py"])
+
+    assert parsed.files == {"a.py": "1"}
+    assert parsed.lost == ["b.py"]
+
+
+def test_files_nobody_asked_for_are_unexpected():
+    parsed = parse_response('{"a.py": "1", "c.py": "3"}', ["a.py"])
+
+    assert parsed.files == {"a.py": "1"}
+    assert parsed.unexpected == ["c.py"]
+
+
+def test_content_that_is_not_text_is_unexpected():
+    text = '{"a.py": null, "b.py": {"nested": "2"}, "c.py": "3"}'
+
+    parsed = parse_response(text, ["a.py", "b.py", "c.py"])
+
+    assert parsed.files == {"c.py": "3"}
+    assert parsed.unexpected == ["a.py", "b.py"]
+    assert parsed.lost == ["a.py", "b.py"]
+
+
+def test_files_of_several_objects_are_merged():
+    text = 'Part one {"a.py": "1"} and {braces} part two {"b.py": "2"}'
+
+    parsed = parse_response(text, ["a.py", "b.py"])
+
+    assert parsed.files == {"a.py": "1", "b.py": "2"}
+    assert parsed.lost == []
+
+
+def test_file_given_different_contents_is_lost():
+    text = '{"a.py": "1", "b.py": "2"}\n{"a.py": "one"}'
+
+    parsed = parse_response(text, ["a.py", "b.py"])
+
+    assert parsed.files == {"b.py": "2"}
+    assert parsed.lost == ["a.py"]
+
+
+def test_response_without_any_file_is_rejected():
+    with pytest.raises(ValueError):
+        parse_response("I can't do that.", ["a.py"])
+    with pytest.raises(ValueError):
+        parse_response('{"a.py": null}', ["a.py"])
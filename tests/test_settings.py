@@ -0,0 +1,149 @@
+import asyncio
+import json
+import threading
+from pathlib import Path
+
+import pytest
+
+from atrament import settings
+
+
+class Keyring:
+    """Passwords in memory, remembers the threads reading them"""
+
+    def __init__(self) -> None:
+        self.passwords: dict[str, str] = {}
+        self.readers: list[threading.Thread] = []
+        self.writes: list[str] = []
+
+    def get_password(self, service: str, name: str) -> str | None:
+        self.readers.append(threading.current_thread())
+        return self.passwords.get(name)
+
+    def set_password(self, service: str, name: str, password: str) -> None:
+        self.writes.append(name)
+        self.passwords[name] = password
+
+
+@pytest.fixture
+def settings_file(tmp_path: Path, monkeypatch: pytest.MonkeyPatch) -> Path:
+    path = tmp_path / "user_settings.json"
+    monkeypatch.setattr(settings, "USER_SETTINGS_FILE", path)
+    return path
+
+
+@pytest.fixture
+def keyring(monkeypatch: pytest.MonkeyPatch) -> Keyring:
+    keyring = Keyring()
+    monkeypatch.setattr(settings.keyring, "get_password", keyring.get_password)
+    monkeypatch.setattr(settings.keyring, "set_password", keyring.set_password)
+    return keyring
+
+
+def test_keyring_is_read_once_off_the_event_loop(settings_file, keyring):
+    keyring.passwords["ChatGPT:api-key"] = "sk-1"
+    service = settings.SettingsService()
+    assert service.cached() is None
+
+    async def main():
+        assert await service.get("ChatGPT", "api-key") == "sk-1"
+        assert await service.get("ChatGPT", "api-key") == "sk-1"
+
+    asyncio.run(main())
+
+    assert keyring.readers
+    assert threading.main_thread() not in keyring.readers
+    reads = len(keyring.readers)
+    asyncio.run(service.get("Claude", "api-key"))
+    assert len(keyring.readers) == reads
+    assert service.cached()["ChatGPT"]["api-key"] == "sk-1"
+
+
+def test_secrets_are_only_stored_in_the_keyring(settings_file, keyring):
+    service = settings.SettingsService()
+
+    async def main():
+        assert await service.save({"ChatGPT": {"api-key": "sk-2"}})
+        assert not await service.save({"ChatGPT": {"api-key": "sk-2"}})
+
+    asyncio.run(main())
+
+    assert keyring.writes == ["ChatGPT:api-key"]
+    assert keyring.passwords["ChatGPT:api-key"] == "sk-2"
+    # nothing else changed, the settings file isn't even written
+    assert not settings_file.exists()
+    # a new process reads it back from the keyring
+    assert (
+        asyncio.run(settings.SettingsService().get("ChatGPT", "api-key"))
+        == "sk-2"
+    )
+
+
+def test_unversioned_file_is_migrated(settings_file, keyring):
+    settings_file.write_text(
+        json.dumps(
+            {
+                "ChatGPT": {"api-key": None},
+                "Performance": {
+                    "max-concurrent-jobs": "8",
+                    "file-cache-mb": "",
+                    "stream-responses": "false",
+                    "max-requests-per-company": "zero",
+                },
+            }
+        )
+    )
+
+    values = asyncio.run(settings.SettingsService().load())
+
+    assert values["Performance"]["max-concurrent-jobs"] == 8
+    assert values["Performance"]["file-cache-mb"] == 64
+    assert values["Performance"]["stream-responses"] is False
+    # invalid values fall back to the default
+    assert values["Performance"]["max-requests-per-company"] == 2
+    stored = json.loads(settings_file.read_text())
+    assert stored[settings.VERSION_KEY] == settings.SCHEMA_VERSION
+    assert stored["Performance"]["max-concurrent-jobs"] == 8
+    assert stored["ChatGPT"]["api-key"] is None
+
+
+def test_invalid_value_saves_nothing(settings_file, keyring):
+    service = settings.SettingsService()
+
+    async def main():
+        with pytest.raises(ValueError, match="at least 1"):
+            await service.save(
+                {
+                    "ChatGPT": {"api-key": "sk-3"},
+                    "Performance": {"max-concurrent-jobs": "0"},
+                }
+            )
+        with pytest.raises(ValueError, match="has to be a float"):
+            await service.save(
+                {"Performance": {"request-timeout-seconds": "soon"}}
+            )
+
+    asyncio.run(main())
+
+    assert keyring.writes == []
+    assert not settings_file.exists()
+
+
+def test_listeners_get_the_changed_values(settings_file, keyring):
+    service = settings.SettingsService()
+    changes = []
+    unsubscribe = service.subscribe(changes.append)
+
+    async def main():
+        await service.load()
+        await service.save(
+            {"Performance": {"max-concurrent-jobs": "6", "file-cache-mb": 64}}
+        )
+        unsubscribe()
+        await service.save({"Performance": {"max-concurrent-jobs": "7"}})
+
+    asyncio.run(main())
+
+    # every value on load, then only the one that changed
+    assert changes[0][("Performance", "max-concurrent-jobs")] == 4
+    assert changes[1:] == [{("Performance", "max-concurrent-jobs"): 6}]
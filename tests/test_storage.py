@@ -0,0 +1,77 @@
+import asyncio
+import os
+import time
+from pathlib import Path
+
+from atrament import storage
+from atrament.checkpoint import content_hash
+
+
+def test_same_content_is_stored_once(tmp_path: Path):
+    blobs_dir = tmp_path / "blobs"
+
+    async def main():
+        return [
+            await storage.put_blob(content, blobs_dir)
+            for content in ("shared", "shared", "other")
+        ]
+
+    first, second, other = asyncio.run(main())
+
+    assert first == second == content_hash("shared")
+    assert other != first
+    assert len(list(blobs_dir.glob("*/*"))) == 2
+
+
+def test_projects_with_the_same_name_are_kept_apart(tmp_path: Path):
+    a = tmp_path / "a" / "project"
+    b = tmp_path / "b" / "project"
+
+    assert storage.backup_dir_for(a) != storage.backup_dir_for(b)
+    assert storage.project_id(a) == storage.project_id(
+        b / ".." / ".." / "a" / "project"
+    )
+
+
+def test_blobs_no_backup_refers_to_are_collected(tmp_path: Path):
+    projects_dir = tmp_path / "projects"
+    blobs_dir = tmp_path / "blobs"
+
+    async def main():
+        return [
+            await storage.put_blob(content, blobs_dir)
+            for content in ("kept", "orphan", "young orphan")
+        ]
+
+    kept, _, young = asyncio.run(main())
+    manifest = storage.Manifest(
+        path=projects_dir / "p" / storage.RUNS_DIR_NAME / "run.json",
+        created="2024-01-01T00:00:00",
+        files={"a.txt": kept},
+    )
+    manifest.save()
+    old = time.time() - 2 * storage.GC_GRACE_SECONDS
+    for path in blobs_dir.glob("*/*"):
+        if not path.name.startswith(young):
+            os.utime(path, (old, old))
+
+    assert storage.collect_garbage(projects_dir, blobs_dir) > 0
+
+    left = {path.name.split(".")[0] for path in blobs_dir.glob("*/*")}
+    # the young one may belong to a backup that is still being written
+    assert left == {kept, young}
+
+
+def test_plain_copy_backup_is_imported(tmp_path: Path):
+    project = tmp_path / "project"
+    project.mkdir()
+    backup_dir = storage.backup_dir_for(project)
+    (backup_dir / "sub").mkdir(parents=True)
+    (backup_dir / "sub" / "a.txt").write_text("original")
+
+    storage.adopt_legacy_data(project, "project")
+
+    manifest = storage.latest_run(backup_dir)
+    assert manifest is not None
+    assert manifest.files == {"sub/a.txt": content_hash("original")}
+    assert not (backup_dir / "sub").exists()
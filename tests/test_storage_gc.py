@@ -0,0 +1,54 @@
+import os
+import threading
+import time
+from pathlib import Path
+
+import pytest
+
+from atrament import storage
+
+
+def test_manifest_written_during_collection_keeps_its_blobs(
+    tmp_path: Path, monkeypatch: pytest.MonkeyPatch
+):
+    projects_dir = tmp_path / "projects"
+    blobs_dir = tmp_path / "blobs"
+    content = "backed up content"
+
+    # a blob nothing refers to any more, old enough to be collected
+    digest = storage._put_blob(content, blobs_dir)
+    blob = storage.find_blob(digest, blobs_dir)
+    assert blob is not None
+    old = time.time() - 2 * storage.GC_GRACE_SECONDS
+    os.utime(blob, (old, old))
+
+    def back_up() -> None:
+        manifest = storage.Manifest(
+            path=projects_dir / "p" / storage.RUNS_DIR_NAME / "run.json",
+            created="2024-01-01T00:00:00",
+        )
+        manifest.files["a.txt"] = storage._put_blob(content, blobs_dir)
+        manifest.save()
+
+    # a backup reusing the blob lands between the collection reading the
+    # blob's age and deleting it
+    writer = threading.Thread(target=back_up)
+    stat = Path.stat
+
+    def stat_then_back_up(self: Path, *args, **kwargs):
+        result = stat(self, *args, **kwargs)
+        if self == blob and writer.ident is None:
+            writer.start()
+            writer.join(timeout=0.5)
+        return result
+
+    monkeypatch.setattr(Path, "stat", stat_then_back_up)
+    storage.collect_garbage(projects_dir, blobs_dir)
+    monkeypatch.undo()
+    writer.join()
+
+    manifest = storage.Manifest.load(
+        projects_dir / "p" / storage.RUNS_DIR_NAME / "run.json"
+    )
+    for referenced in manifest.blobs():
+        assert storage.read_blob(referenced, blobs_dir) == content
@@ -0,0 +1,246 @@
+import asyncio
+import json
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+import flet as ft
+import msgpack
+import pytest
+from flet.messaging.connection import Connection
+from flet.messaging.protocol import configure_encode_object_for_msgpack
+from flet.messaging.session import Session
+from flet.pubsub.pubsub_hub import PubSubHub
+
+from atrament import ai, engine, page_ref, ui_scheduler
+from atrament.sections import project as project_section
+from atrament.sections.project import ProjectSection
+
+# page.update round-trips an interaction may take, one per state change
+# the user can see plus one for the dialog it ends with
+MAX_UPDATES = {
+    "file list": 1,
+    "resize": 1,
+    "process files": 4,
+    "rollback": 2,
+}
+
+
+# pages only hold a weak reference to their session
+_sessions: list[Session] = []
+
+
+def encode(payload) -> bytes:
+    # encoding is what records the state later patches are diffed against
+    return msgpack.packb(
+        payload, default=configure_encode_object_for_msgpack(ft.BaseControl)
+    )
+
+
+class OfflineConnection(Connection):
+    """Connection encoding every message and dropping it, there's no client"""
+
+    def send_message(self, message) -> None:
+        encode([message.action, message.body])
+
+
+async def open_page(*controls: ft.Control) -> tuple[ft.Page, list[tuple]]:
+    """Page of a fresh session showing `controls`, and its updates"""
+    connection = OfflineConnection()
+    connection.loop = asyncio.get_running_loop()
+    connection.executor = ThreadPoolExecutor()
+    connection.pubsubhub = PubSubHub(
+        loop=connection.loop, executor=connection.executor
+    )
+    session = Session(connection)
+    _sessions.append(session)
+    page = session.page
+    page_ref.set_page_ref(page)
+
+    page.views[0].controls.extend(controls)
+    # what the client registering does, mounts every control
+    encode(page.session.get_page_patch())
+
+    sent: list[tuple] = []
+    send = page.update
+
+    def update(*updated: ft.Control) -> None:
+        sent.append(updated)
+        send(*updated)
+
+    page.update = update
+    return page, sent
+
+
+async def settle() -> None:
+    """Let the batched updates and scheduled callbacks run"""
+    await asyncio.sleep(ui_scheduler.FRAME_SECONDS * 3)
+
+
+def test_updates_of_one_tick_are_sent_together():
+    async def main():
+        texts = [ft.Text(str(i)) for i in range(5)]
+        page, sent = await open_page(ft.Column(texts))
+        scheduler = ui_scheduler.for_page(page)
+
+        with scheduler.measure("burst") as stats:
+            for text in texts + texts:
+                ui_scheduler.update(text)
+        await settle()
+
+        assert len(sent) == 1
+        assert (stats.requested, stats.sent, stats.controls) == (10, 1, 5)
+        assert scheduler.measured["burst"] is stats
+
+    asyncio.run(main())
+
+
+def test_resize_burst_is_one_update():
+    async def main():
+        text = ft.Text("")
+        page, _ = await open_page(text)
+        scheduler = ui_scheduler.for_page(page)
+        calls = []
+
+        def on_resize(width: float, height: float) -> None:
+            calls.append(width)
+            text.value = str(width)
+            ui_scheduler.update(text)
+
+        scheduler.on_resize(on_resize)
+        for width in range(100, 120):
+            page.on_resize(ft.PageResizeEvent("resize", page, width, 600))
+        await settle()
+
+        assert calls == [119]
+        assert scheduler.measured["resize"].sent <= MAX_UPDATES["resize"]
+
+    asyncio.run(main())
+
+
+@pytest.fixture
+def project(tmp_path: Path, monkeypatch: pytest.MonkeyPatch) -> Path:
+    data = engine.default_project(tmp_path)
+    data["workdata"]["ai-configuration"]["model"] = "0:test"
+    for i in range(3):
+        path = tmp_path / f"t{i}.txt"
+        path.write_text(f"target {i}")
+        data["workdata"]["files"]["target-files"].append(str(path))
+    (tmp_path / engine.PROJECT_FILE_NAME).write_text(json.dumps(data))
+
+    async def get_models():
+        return [(ai.AiCompany.OpenAI, "test")]
+
+    async def prompt(company, text, model, context=None):
+        part = text.split("TARGET FILES:\n", 1)[1]
+        files = json.loads(part.split("\n\nUSER INSTRUCTIONS:", 1)[0])
+        return ai.AiResponse(
+            text=json.dumps({p: c.upper() for p, c in files.items()})
+        )
+
+    monkeypatch.setattr(ai, "get_models", get_models)
+    monkeypatch.setattr(ai.client, "prompt", prompt)
+    return tmp_path
+
+
+async def open_project(project: Path) -> tuple[ProjectSection, ft.Page]:
+    section = ProjectSection(str(project))
+    page, _ = await open_page(section.body)
+    await section.load()
+    await settle()
+    section.config.model_dropdown.value = "0:test"
+    return section, page
+
+
+def test_project_interactions_stay_within_budget(project):
+    async def main():
+        section, page = await open_project(project)
+        scheduler = ui_scheduler.for_page(page)
+
+        section.target_files.update_list()
+        await settle()
+
+        await section.process_files(None)
+        await settle()
+        assert (project / "t0.txt").read_text() == "TARGET 0"
+
+        await section.rollback_files(None)
+        dialog = page._dialogs.controls[-1]
+        rollback = next(a for a in dialog.actions if a.content == "Rollback")
+        await rollback.on_click(None)
+        await settle()
+        assert (project / "t0.txt").read_text() == "target 0"
+
+        for label, budget in MAX_UPDATES.items():
+            if label != "resize":
+                assert scheduler.measured[label].sent <= budget, label
+
+    asyncio.run(main())
+
+
+def test_failed_rollback_shows_the_error(project, monkeypatch):
+    async def main():
+        section, page = await open_project(project)
+        await section.process_files(None)
+        await settle()
+
+        async def restore_backup(*args):
+            raise OSError("disk full")
+
+        monkeypatch.setattr(engine, "restore_backup", restore_backup)
+        await section.rollback_files(None)
+        dialog = page._dialogs.controls[-1]
+        rollback = next(a for a in dialog.actions if a.content == "Rollback")
+        await rollback.on_click(None)
+
+        dialog = page._dialogs.controls[-1]
+        assert dialog.title == "Rollback failed"
+        assert dialog.content.value == "error: disk full"
+
+    asyncio.run(main())
+
+
+def test_files_deleted_while_the_view_was_left_are_missing(project):
+    async def main():
+        section, page = await open_project(project)
+        view = page.views[0]
+
+        view.controls.remove(section.body)
+        page.update()
+        (project / "t1.txt").unlink()
+        view.controls.append(section.body)
+        page.update()
+        await settle()
+
+        assert section.target_files.missing == {str(project / "t1.txt")}
+
+    asyncio.run(main())
+
+
+def test_change_report_is_written_off_the_event_loop(project, monkeypatch):
+    async def main():
+        section, _ = await open_project(project)
+        await section.process_files(None)
+        await settle()
+
+        removed = []
+        rmtree = project_section.shutil.rmtree
+
+        def record_rmtree(path, **kwargs):
+            removed.append(threading.current_thread())
+            rmtree(path, **kwargs)
+
+        opened = []
+        monkeypatch.setattr(project_section.shutil, "rmtree", record_rmtree)
+        monkeypatch.setattr(project_section.webbrowser, "open", opened.append)
+        stale = engine.report_dir_for(project) / "stale.html"
+        stale.parent.mkdir(parents=True, exist_ok=True)
+        stale.write_text("")
+
+        await section.see_change_report(None)
+
+        assert removed and removed[0] is not threading.main_thread()
+        assert not stale.exists()
+        assert opened[0].endswith("index.html")
+
+    asyncio.run(main())